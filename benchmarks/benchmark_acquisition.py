@@ -0,0 +1,121 @@
+#################################################################################################
+# Acquisition loop benchmark
+#
+# Runs the realtime collection loop against simulated instruments, so loop throughput can be
+# measured (and regressions caught) on any machine, no Keysight, Keithley, or DAQ needed.
+#
+# Run from the top of the repository:
+#       python -m benchmarks.benchmark_acquisition --points 200 --keysight-latency 0.01 --dmm-latency 0.02
+#       python -m benchmarks.benchmark_acquisition --points 200 --init-pulse-time 0.05 --points-per-arm 10
+#
+# The trigger timing (high/low time and the initialization pulse) defaults to 0 so the number
+# reported is the overhead of the loop and the instruments, not the sleeps.
+#################################################################################################
+
+import argparse
+import json
+import tempfile
+import time
+
+import src.epr_data_collection_rt.instrument_backends as backends
+import src.epr_data_collection_rt.kse_acquisition as acq
+import src.epr_data_collection_rt.simulated_instruments as sim
+
+
+def runAcquisitionBenchmark(points, settings, high_time=0.0, low_time=0.0, init_pulse_time=0.0, points_per_arm=1, hardware_timing=False, folder=None):
+    """
+    Collects a fixed number of points from simulated instruments and times the loop.
+
+    Parameters
+    ----------
+    points : int
+        The number of valid points to collect.
+    settings : simulated_instruments.SimulationSettings
+        Latency, noise, overflow, and failure settings for the simulated instruments.
+    high_time : float
+        Time the trigger pulse stays high, in seconds.
+    low_time : float
+        Time the trigger pulse stays low, in seconds.
+    init_pulse_time : float
+        High and low time of the throwaway pulse in the initialization pass, in seconds.
+    points_per_arm : int
+        Triggers per arm, above 1 the loop runs in buffered mode.
+    hardware_timing : bool
+        Play the trigger pulses out on the simulated DAQ clock instead of timing them in software.
+    folder : str, optional
+        Where to write the data files. A temporary folder is used if not given.
+
+    Returns
+    -------
+    results : dict
+        Points collected, elapsed time, throughput in points/s, time per point, the write queue status, and the latency of each phase of the loop.
+    """
+    bench = backends.useSimulatedInstruments(settings)
+    with tempfile.TemporaryDirectory() as tmp:
+        a = acq.RealtimeAcquisition()
+        a.folder = folder if folder is not None else tmp
+        a.keysight_addr = sim.KEYSIGHT_ADDR
+        a.dmm_addr = sim.DMM_ADDR
+        a.daq_path = sim.DAQ_DEVICE + '/ao0'
+        a.alkali_metal = 'rb85'
+        a.energy_level = 'high'
+        a.high_time = high_time
+        a.low_time = low_time
+        a.init_pulse_time = init_pulse_time
+        a.points_per_arm = points_per_arm
+        a.hardware_timing = hardware_timing
+        a.error_threshold = max(points, 3) #keep going through injected failures
+        a.on_status = None
+        a.connect()
+        writer = a.writer
+        t0 = time.perf_counter()
+        a.run(max_points=points)
+        elapsed = time.perf_counter() - t0
+        status = writer.getStatus()
+        a.close()
+    backends.useHardwareInstruments()
+    results = {
+        'points': a.points_collected,
+        'triggers': bench.trigger_count,
+        'elapsed_s': elapsed,
+        'points_per_s': a.points_collected/elapsed if elapsed > 0 else float('inf'),
+        'ms_per_point': 1000*elapsed/a.points_collected if a.points_collected > 0 else float('nan'),
+        'written': status['written'],
+        'dropped': status['dropped'],
+        'write_errors': status['write_errors'],
+        'latency_ms': a.latency.getSummary(),
+    }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the realtime acquisition loop against simulated instruments.')
+    parser.add_argument('--points', type=int, default=200, help='number of valid points to collect')
+    parser.add_argument('--keysight-latency', type=float, default=0.0, help='seconds per frequency counter query')
+    parser.add_argument('--dmm-latency', type=float, default=0.0, help='seconds per dmm query')
+    parser.add_argument('--write-latency', type=float, default=0.0, help='seconds per instrument write')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency per query, up to this many seconds')
+    parser.add_argument('--overflow', type=float, default=0.0, help='probability of an overflow reading')
+    parser.add_argument('--failure', type=float, default=0.0, help='probability of a failed query')
+    parser.add_argument('--high-time', type=float, default=0.0)
+    parser.add_argument('--low-time', type=float, default=0.0)
+    parser.add_argument('--init-pulse-time', type=float, default=0.0)
+    parser.add_argument('--points-per-arm', type=int, default=1, help='triggers per arm, above 1 uses buffered mode')
+    parser.add_argument('--hardware-timing', action='store_true', help='play the trigger pulses out on the DAQ clock')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help='save the results to this file')
+    args = parser.parse_args()
+
+    settings = sim.SimulationSettings(keysight_latency=args.keysight_latency, dmm_latency=args.dmm_latency,
+                                      write_latency=args.write_latency, latency_jitter=args.jitter,
+                                      overflow_probability=args.overflow, failure_probability=args.failure, seed=args.seed)
+    results = runAcquisitionBenchmark(args.points, settings, args.high_time, args.low_time, args.init_pulse_time, args.points_per_arm, args.hardware_timing)
+    results['settings'] = vars(args)
+    for k in ['points', 'triggers', 'elapsed_s', 'points_per_s', 'ms_per_point', 'written', 'dropped', 'write_errors']:
+        print(k + ': ' + str(results[k]))
+    if (args.json is not None):
+        with open(args.json, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+#################################################################################################
+# Processing benchmark
+#
+# Times the data processing functions in kse_experiment_utils and utilities on synthetic run
+# files, and reports throughput (rows/s) and peak memory. Results are saved as JSON so runs can be
+# compared over time.
+#
+# Run from the top of the repository:
+#       python -m benchmarks.benchmark_processing --sizes 1e3 1e4 1e5 1e6
+#       python -m benchmarks.benchmark_processing --sizes 1e6 --compare benchmarks/results/<older run>.json
+#
+# Synthetic files are kept in --data-dir so they only have to be generated once per size.
+# Functions that take python lists of strings are skipped above --max-list-rows, since the lists
+# alone would not fit in memory at 1e8 rows.
+#################################################################################################
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from threading import Thread, Event
+
+import numpy as np
+import pandas as pd
+
+import src.epr_data_collection_rt.kse_experiment_utils as kse
+import src.epr_data_collection_rt.raw_data_store as store
+import src.epr_data_collection_rt.utilities as util
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+GENERATE_CHUNK = 1000000
+
+########## SYNTHETIC DATA ############################################################################################################
+
+def syntheticColumns(start, n, seed=0):
+    """
+    Generates n rows of synthetic frequency, voltage, and time data, starting at row start.
+
+    Returns
+    -------
+    freqs : np.ndarray
+        Frequencies around 3.2 MHz, with an occasional 9.9e37 overflow value.
+    volts : np.ndarray
+        DMM voltages around 0.1 V.
+    t_ints : np.ndarray
+        Time intervals 0.8 s apart.
+    """
+    rng = np.random.default_rng(seed + start)
+    freqs = 3.2e6 + rng.normal(0, 5, n)
+    volts = 0.1 + rng.normal(0, 1e-4, n)
+    freqs[rng.random(n) < 1e-4] = 9.9e37
+    t_ints = 0.8*np.arange(start, start + n)
+    return freqs, volts, t_ints
+
+def generateRunFiles(data_dir, rows):
+    """
+    Writes a realtime and a batched style raw data csv with the given number of rows, unless they already exist.
+    The realtime data is also written as a binary raw data file (same path with .bin), so the two formats can be compared.
+
+    Returns
+    -------
+    fp_rt : str
+        Realtime layout: Frequencies, Voltages, Time Interval.
+    fp_batched : str
+        Batched layout: Frequencies, Voltages, Times, Timestamps.
+    """
+    fp_rt = os.path.join(data_dir, 'synthetic_rt_' + str(rows) + '.csv')
+    fp_batched = os.path.join(data_dir, 'synthetic_batched_' + str(rows) + '.csv')
+    fp_bin = fp_rt[:-len('.csv')] + store.RAW_FILE_EXT
+    if (os.path.exists(fp_rt) and os.path.exists(fp_batched) and os.path.exists(fp_bin)):
+        return fp_rt, fp_batched
+    t0 = 1.7e9
+    with open(fp_rt + '.tmp', 'w', newline='') as f_rt, open(fp_batched + '.tmp', 'w', newline='') as f_b:
+        f_rt.write('Frequencies,Voltages,Time Interval\n')
+        f_b.write('Frequencies,Voltages,Times,Timestamps\n')
+        for start in range(0, rows, GENERATE_CHUNK):
+            n = min(GENERATE_CHUNK, rows - start)
+            freqs, volts, t_ints = syntheticColumns(start, n)
+            pd.DataFrame({'f': freqs, 'v': volts, 't': t_ints}).to_csv(f_rt, index=False, header=False)
+            stamps = t0 + t_ints
+            hrtimes = np.datetime_as_string((stamps*1e6).astype('datetime64[us]'))
+            hrtimes = [s[11:] for s in hrtimes]
+            pd.DataFrame({'f': freqs, 'v': volts, 'h': hrtimes, 't': stamps}).to_csv(f_b, index=False, header=False)
+    if (os.path.exists(fp_bin + '.tmp')):
+        os.remove(fp_bin + '.tmp')
+    writer = store.RawDataWriter(fp_bin + '.tmp', store.RT_COLUMNS, sync_every=None, sync_interval=None)
+    for start in range(0, rows, GENERATE_CHUNK):
+        writer.appendRows(np.column_stack(syntheticColumns(start, min(GENERATE_CHUNK, rows - start))))
+    writer.close()
+    os.replace(fp_rt + '.tmp', fp_rt)
+    os.replace(fp_batched + '.tmp', fp_batched)
+    os.replace(fp_bin + '.tmp', fp_bin)
+    return fp_rt, fp_batched
+
+########## MEASUREMENT ############################################################################################################
+
+def currentRSS():
+    """
+    Returns the resident memory of this process in bytes, or None if it can't be measured on this platform.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class PeakMemorySampler:
+    """
+    Samples the resident memory of the process on a background thread while a benchmark runs.
+    Peak memory is reported relative to the memory in use when sampling started.
+    """
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.done = Event()
+        self.baseline = None
+        self.peak = None
+
+    def sample(self):
+        """
+        Sampling thread loop, keeps track of the highest resident memory seen.
+        """
+        while (not self.done.is_set()):
+            rss = currentRSS()
+            if (rss is not None and rss > self.peak):
+                self.peak = rss
+            self.done.wait(self.interval)
+
+    def __enter__(self):
+        gc.collect()
+        self.baseline = currentRSS()
+        self.peak = self.baseline if self.baseline is not None else 0
+        self.thread = Thread(target=self.sample, daemon=True)
+        if (self.baseline is not None):
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        if (self.thread.is_alive()):
+            self.thread.join()
+        rss = currentRSS()
+        if (rss is not None and rss > self.peak):
+            self.peak = rss
+
+    def peakMB(self):
+        """
+        Returns the peak memory above the starting baseline in MB, or None if memory can't be measured.
+        """
+        if (self.baseline is None):
+            return None
+        return (self.peak - self.baseline)/1e6
+
+def timeIt(function, setup, rows, repeat):
+    """
+    Runs function(*setup()) repeat times and keeps the fastest run.
+
+    Returns
+    -------
+    result : dict
+        seconds (fastest run), rows_per_s, and peak_mem_mb (peak extra memory over all runs).
+    """
+    best = float('inf')
+    peak = None
+    for i in range(0, repeat):
+        args = setup()
+        with PeakMemorySampler() as mem:
+            t0 = time.perf_counter()
+            function(*args)
+            elapsed = time.perf_counter() - t0
+        del args
+        best = min(best, elapsed)
+        if (mem.peakMB() is not None):
+            peak = mem.peakMB() if peak is None else max(peak, mem.peakMB())
+    return {'seconds': best, 'rows_per_s': rows/best if best > 0 else float('inf'), 'peak_mem_mb': peak}
+
+########## BENCHMARKS ############################################################################################################
+
+def getBenchmarks(fp_rt, fp_batched, rows, out_dir):
+    """
+    Returns the benchmarks to run for one file size, as (name, function, setup, uses_lists).
+    setup returns the arguments for function, and is not timed.
+    """
+    def columns():
+        return syntheticColumns(0, rows)
+    def strings():
+        freqs, volts, t_ints = columns()
+        return [repr(v) for v in volts.tolist()]
+    out_csv = os.path.join(out_dir, 'benchmark_out.csv')
+    return [
+        ('kse.processAllData', kse.processAllData, lambda: (fp_batched, 'rb85', 'high'), False),
+        ('kse.processAllData_rt', kse.processAllData_rt, lambda: (fp_rt, 'rb85', 'high'), False),
+        #the same data as processAllData_rt, from the binary raw data file instead of the csv
+        ('store.processRawDataFile', store.processRawDataFile, lambda: (fp_rt[:-len('.csv')] + store.RAW_FILE_EXT, 'rb85', 'high'), False),
+        ('kse.streamAllData_rt', kse.streamAllData_rt, lambda: (fp_rt, out_csv, 'rb85', 'high'), False),
+        ('kse.removeAllOverflowVals', kse.removeAllOverflowVals, lambda: (fp_rt, ['Frequencies', 'Voltages']), False),
+        ('kse.convertDMMData', kse.convertDMMData, lambda: (strings(), 'rb85', 'high'), True),
+        ('kse.getAvgAndStdDev', kse.getAvgAndStdDev, lambda: (columns()[0],), False),
+        ('util.formatTimestampsForCSV', util.formatTimestampsForCSV, lambda: (1.7e9 + columns()[2],), False),
+        ('util.stringToPandasSeries', util.stringToPandasSeries, lambda: (','.join(strings()), ','), True),
+        ('util.stringArraytoFloatArray', util.stringArraytoFloatArray, lambda: (strings(),), True),
+        ('util.exportToCSV', util.exportToCSV, lambda: (out_csv, ['Frequencies', 'Voltages', 'Time Interval'], np.column_stack(columns()).tolist()), True),
+    ]
+
+def runBenchmarks(sizes, data_dir, max_list_rows, only=None, log=print):
+    """
+    Runs every benchmark for every size.
+
+    Parameters
+    ----------
+    sizes : [int]
+        Number of rows in the synthetic run files.
+    data_dir : str
+        Where synthetic run files are kept.
+    max_list_rows : int
+        Benchmarks that take python lists are skipped above this many rows.
+    only : [str], optional
+        Only run benchmarks whose name contains one of these strings.
+    log : function
+        Called with progress messages.
+
+    Returns
+    -------
+    results : [dict]
+        One entry per (function, rows), with seconds, rows_per_s, and peak_mem_mb.
+    """
+    results = []
+    for rows in sizes:
+        log('Generating synthetic files with ' + str(rows) + ' rows')
+        fp_rt, fp_batched = generateRunFiles(data_dir, rows)
+        repeat = 3 if rows <= 100000 else 1
+        for (name, function, setup, uses_lists) in getBenchmarks(fp_rt, fp_batched, rows, data_dir):
+            if (only is not None and not any(o in name for o in only)):
+                continue
+            if (uses_lists and rows > max_list_rows):
+                results.append({'function': name, 'rows': rows, 'skipped': True})
+                continue
+            r = timeIt(function, setup, rows, repeat)
+            r['function'] = name
+            r['rows'] = rows
+            results.append(r)
+            log('  ' + name.ljust(32) + util.formatter(r['rows_per_s'], 3) + ' rows/s, ' + str(round(r['seconds'], 4)) + ' s, peak ' + str(r['peak_mem_mb'] if r['peak_mem_mb'] is None else round(r['peak_mem_mb'], 1)) + ' MB')
+    return results
+
+def compareResults(results, fp_previous, log=print):
+    """
+    Prints the speedup of each benchmark relative to a previously saved run.
+    """
+    with open(fp_previous) as infile:
+        previous = json.load(infile)
+    before = {(r['function'], r['rows']): r for r in previous['results'] if not r.get('skipped')}
+    log('Compared with ' + fp_previous)
+    for r in results:
+        key = (r['function'], r['rows'])
+        if (r.get('skipped') or key not in before):
+            continue
+        speedup = before[key]['seconds']/r['seconds']
+        log('  ' + r['function'].ljust(32) + str(r['rows']).rjust(10) + ' rows: ' + str(round(speedup, 2)) + 'x')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data processing functions on synthetic run files.')
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e3, 1e4, 1e5, 1e6], help='rows per synthetic file, 1e3 to 1e8')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'kse_benchmark_data'), help='where synthetic files are kept')
+    parser.add_argument('--max-list-rows', type=float, default=1e7, help='skip list based functions above this many rows')
+    parser.add_argument('--only', nargs='+', default=None, help='only run benchmarks whose name contains one of these')
+    parser.add_argument('--output', default=None, help='where to save the JSON results, defaults to benchmarks/results/processing-<date>.json')
+    parser.add_argument('--compare', default=None, help='a previous JSON results file to compare against')
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    sizes = [int(s) for s in args.sizes]
+    results = runBenchmarks(sizes, args.data_dir, int(args.max_list_rows), args.only)
+    report = {
+        'date': util.dtStringForFilename(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'results': results,
+    }
+    output = args.output
+    if (output is None):
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, 'processing-' + report['date'] + '.json')
+    with open(output, 'w') as outfile:
+        json.dump(report, outfile, indent=2)
+    print('Results saved to ' + output)
+    if (args.compare is not None):
+        compareResults(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,14 +6,13 @@ import pyqtgraph as pg
 
 import traceback, sys
 import math
-import nidaqmx
 import time
-import pyvisa as visa
-import pandas as pd
+import numpy as np
 import src.epr_data_collection_rt.utilities as util
+import src.epr_data_collection_rt.raw_data_store as store
+import src.epr_data_collection_rt.instrument_session as session
+import src.epr_data_collection_rt.plot_decimation as decimation
 from os import path
-from pymeasure.instruments.keithley import Keithley2000
-from pymeasure.adapters import PrologixAdapter
 
 ########################################## Helper functions go here ##############################################################################
 #these should go on their own module probably idk
@@ -83,13 +82,15 @@ class MainWindow(QMainWindow):
         self.start_data_collection_btn = QPushButton("Start Data Collection")
         self.stop_data_collection_btn = QPushButton("Stop Data Collection")
         #GRAPH
-        self.x
-        self.y
+        #every cycle is appended to the decimator and the one curve is redrawn from it, rather than adding a new plot item per cycle
+        self.plot_decimator = decimation.MinMaxDecimator()
+        self.plot_downsampling = True #draw a min/max decimated copy of the run so redraws cost the same however long it runs
 
         #self.frame = pg.GraphicsLayoutWidget()
         #self.data_disp = self.frame.addPlot()
 
         self.data_disp = pg.PlotWidget()
+        self.data_curve = self.data_disp.plot([], [])
 
         
         self.data_disp.setLabel("left", "frequency (Hz)")
@@ -129,6 +130,13 @@ class MainWindow(QMainWindow):
         self.daq_path = 'Dev2/ao0' #the path to the daq
         self.dmm_addr = 'ASRL6::INSTR' #address of USB connected to computer
         self.gpib_channel_no = 1 #the channel number for the GPIB connection from the dmm. this can be set on the dmm to anything between 1 and 16
+        self.keysight_timeout = 2.0 #seconds to wait for the keysight to answer, same as the pyvisa default
+        #the raw data file is fsynced every sync_every points or sync_interval seconds, checked after each cycle is written
+        self.sync_every = store.DEFAULT_SYNC_EVERY
+        self.sync_interval = store.DEFAULT_SYNC_INTERVAL
+        #instrument connections, kept open from one run to the next
+        self.session = session.InstrumentSession(print)
+        self.file = None #the raw data file of the current run, only created once every instrument has connected
 
         self.start_time = None
 
@@ -152,17 +160,16 @@ class MainWindow(QMainWindow):
 
         #make the threadpool
         self.threadpool = QThreadPool()
+        #the instrument connections are only closed when the app exits
+        app.aboutToQuit.connect(self.session.close)
 
     #functions
     def plot_data(self):
-        x=self.time_intervals
-        y=self.frequencies.to_list()
-        for i in range(0, len(y)):
-            y[i]=float(y[i])
-        #print(x)
-        #print(y)
-        self.data_disp.plot(x,y)
-        self.data_disp.update()
+        #only the new cycle is converted, the earlier cycles are already in the decimator
+        self.plot_decimator.extend(self.time_intervals, self.frequencies.to_numpy(dtype=float))
+        max_points = decimation.DEFAULT_MAX_POINTS if self.plot_downsampling else math.inf
+        x, y = self.plot_decimator.getView(max_points=max_points)
+        self.data_curve.setData(x, y)
         #self.data_disp.autoRange()
 
     def collection_thread(self):
@@ -173,9 +180,13 @@ class MainWindow(QMainWindow):
         self.threadpool.start(worker)    
 
     def collect_data(self):
+        if ((self.file is None) or self.file.closed):
+            print('Initialize data collection before starting')
+            return
 
         self.cycle_num=1
-        while (True):  #self.cycle_num <= self.how_many_cycles
+        self.collection_active = True
+        while (self.collection_active):  #self.cycle_num <= self.how_many_cycles
             self.collection_cycle_active = True
 
             self.freq_counter.write('INIT')
@@ -220,105 +231,90 @@ class MainWindow(QMainWindow):
             except: 
                 print('I regret to inform you that something done f*cked up with the Keysight and there is no data.')
                 print('Ending data collection.')
-                self.task.close()
-                self.freq_counter.close()
-                self.adapter.close()
-                self.rm.close()
+                self.session.close()
 
             try: 
                 self.dmm_vals = self.dmm.ask('TRAC:DATA?')
             except:  
                 print('I regret to inform you that something done f*cked up with the Keysight and there is no data.')
                 print('Ending data collection.')
-                self.task.close()
-                self.freq_counter.close()
-                self.adapter.close()
-                self.rm.close()   
+                self.session.close()
 
-            #now I need to make the data into some sort of format that we can easily put in a text file
+            #now I need to make the data into some sort of format that we can easily put in a file
             self.frequencies = util.stringToPandasSeries(self.frequencies, ',')
             self.dmm_vals = util.stringToPandasSeries(self.dmm_vals, ',')
-            self.hrdates, self.hrtimes = util.formatTimestampsForCSV(self.times)
-            
-            self.df = pd.DataFrame({
-                'Frequency': self.frequencies,
-                'Voltage': self.dmm_vals,
-                'Time': self.hrtimes, 
-                'Timestamps': self.times
-            })
-            self.df.to_csv(self.fp, mode='a', index=False, header=False)
+            #append the whole cycle to the raw data file in one write, human readable times are added by store.exportRawDataToCSV
+            self.file.appendRows(np.column_stack((self.frequencies.astype(float), self.dmm_vals.astype(float), self.times)))
+            #one write per cycle, so sync it now rather than leaving it unsynced until the next cycle (which might never finish)
+            self.file.sync()
             self.cycle_num = self.cycle_num+1
             self.plot_data()
             self.collection_cycle_active = False
 
+        #stop_collection ends the loop after the current cycle, the instrument connections stay open for the next run
+        self.file.close()
+        print(self.file.getSyncStatusString())
+        print('Data collection stopped')
+
     
     def connect_to_instruments(self):
+        if (self.collection_active):
+            print('Stop data collection before initializing again')
+            return
         # in case there is data from the last run in the plot, clear the plot before connecting
-        self.data_disp.clear()
+        self.plot_decimator.clear()
+        self.data_curve.setData([], [])
 
-        #do all the document prep at the beginning so it doesn't slow down collection later
-        #create a new csv file at the specified location
-        self.filename = util.dtStringForFilename()+'.csv'
+        #initializing again without starting a run finishes the file from last time, so it isn't left open (and locked)
+        if (self.file is not None):
+            self.file.close()
+            self.file = None
+
+        try:
+            # the instrument connections stay open between runs, the session only reconnects or resends configuration when something has changed
+            # set KSE_INSTRUMENT_BACKEND=simulated to run without any instruments attached
+            self.rm = self.session.getResourceManager()
+
+            # Keysight connection and data collection set up
+            ## set the type of measurement to frequency, with external triggers on the rising edge
+            self.freq_counter = self.session.getFrequencyCounter(self.keysight_addr, ['CONF:FREQ', self.trig_source_cmd, 'TRIG:SLOP POS', self.trig_count_cmd], self.keysight_timeout)
+
+            # DAQ Setup and task initialization
+            self.task = self.session.getDAQTask(self.daq_path)
+
+            #Keithley dmm connection and data collection set up
+            ## need to set trigger type to external
+            ## set trigger count to the desired number of datapoints per collection cycle
+            ## set sample count to 1 (this is one sample per trigger)
+            self.adapter, self.dmm = self.session.getDMM(self.dmm_addr, self.gpib_channel_no, [self.trig_source_cmd, self.trig_count_cmd, 'SAMP:COUN 1'])
+        except Exception as error:
+            #no raw data file is created until every instrument has connected, so there is nothing to clean up
+            print('Could not connect to the instruments: ' + str(error))
+            return
+
+        #do all the document prep before starting so it doesn't slow down collection later
+        #if a run in this folder was cut off by a crash or power cut, cut the torn last record off its raw data file
+        #files another program (or another run) is still writing are left alone
+        skipped = []
+        for (name, removed) in store.recoverRawDataFolder(self.folder, skipped).items():
+            print('Recovered ' + name + ', removed a torn record (' + str(removed) + ' bytes)')
+        for name in skipped:
+            print('Not checking ' + name + ' for a torn record, it is still being written')
+        #create a new raw data file at the specified location, the header is written when the file is created
+        self.filename = util.dtStringForFilename()+store.RAW_FILE_EXT
         self.fp = self.folder + self.filename
-        self.file = open(self.fp, 'a')
-        #create an empty data frame and save the headers to the file
-        self.df_headers = pd.DataFrame({'Frequencies': [], 'Voltages': [], 'Times':[], 'Timestamps':[]})
-        self.df_headers.to_csv(self.fp, mode='a', index=False)
+        try:
+            self.file = store.RawDataWriter(self.fp, store.BATCHED_COLUMNS, self.sync_every, self.sync_interval)
+        except Exception as error:
+            print('Could not create the output file: ' + str(error))
+            return
         print('Output file created')
-
-        # open the resource manager so we can connect to the keysight and the keithley
-        self.rm = visa.ResourceManager()
-
-        # Keysight connection setup
-        self.freq_counter = self.rm.open_resource(self.keysight_addr)
-        self.freq_counter.encoding = 'latin_1'
-        self.freq_counter.source_channel = 'CH1'
-
-        # Keysight data collection set up
-        ## reset everything and clear the event queues
-        self.freq_counter.write('*RST')
-        self.freq_counter.write('STAT:PRES')
-        self.freq_counter.write('*CLS')
-        ## set the type of measurement to frequency
-        self.freq_counter.write('CONF:FREQ')
-        self.freq_counter.write(self.trig_source_cmd)
-        self.freq_counter.write('TRIG:SLOP POS')
-        self.freq_counter.write(self.trig_count_cmd)
-
-        # DAQ Setup and task initialization
-        self.task = nidaqmx.Task()
-        self.task.ao_channels.add_ao_voltage_chan(self.daq_path)
         print('Starting Collection')
-        self.task.start()
-        self.task.write(0.0)#make sure we are starting at 0V
-
-        #Keithley dmm connection set up
-        self.adapter = PrologixAdapter(self.dmm_addr, self.gpib_channel_no) #create prologix adapter and connect to GPIB w/ address 1
-        self.dmm = Keithley2000(self.adapter) #create the instrument using the adapter
-
-        # Keithley data collection set up
-        ## reset everything and clear the event queues
-        self.dmm.reset()
-        ## need to set trigger type to external
-        self.dmm.write(self.trig_source_cmd)
-        ## set trigger count to the desired number of datapoints per collection cycle
-        self.dmm.write(self.trig_count_cmd)
-        ## set sample count to 1 (this is one sample per trigger)
-        self.dmm.write('SAMP:COUN 1')
 
     
     def stop_collection(self):
-        self.collection_active = False                
-        #close the DAQ taks
-        self.task.close()
-        #close the csv file
-        self.file.close()
-        #close the connections
-        self.openres = self.rm.list_opened_resources()
-        print('Closing Connection with ', self.openres)
-        self.freq_counter.close()
-        self.adapter.close()
-        self.rm.close()
+        #the collection thread finishes the current cycle, then closes the raw data file
+        self.collection_active = False
 
 
 
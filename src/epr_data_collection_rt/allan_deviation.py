@@ -0,0 +1,295 @@
+import numpy as np
+import pandas as pd
+
+########## ALLAN DEVIATION ############################################################################################################
+# Overlapping and modified Allan deviation of a frequency series, for judging the stability of the frequency counter and
+# picking averaging times. Frequencies are turned into phase with a cumulative sum, after which each averaging time only
+# needs a few array operations over the run (O(n) per tau instead of O(n*tau)), so 1e7 point runs take seconds.
+# The sums are done in blocks that fit in the cpu cache, which is about 3x faster than whole array operations on long runs.
+#
+# The deviations are in the units of the data passed in (Hz for the Keysight columns). Divide by the mean frequency first
+# for fractional frequency deviations. Points are assumed to be evenly spaced tau0 apart, which is only approximately
+# true for the realtime app (buffered mode has a gap at every arm), so use the typical spacing from getSampleInterval.
+#
+# StreamingAllanDeviation does the same sums one point at a time, so the deviations can be kept up to date during a run.
+
+POINTS_PER_DECADE = 10
+BLOCK_SIZE = 65536 #points per block when summing, small enough that the temporary arrays stay in the cpu cache
+PROCESSED_COLUMNS = ['Keysight', 'Adjusted Keysight Data']
+
+########################################################################################################################################
+
+
+def getAveragingFactors(n, max_fraction=1/3, per_decade=POINTS_PER_DECADE):
+    """
+    Returns log spaced averaging factors m (tau = m*tau0) for a series of n points.
+
+    Parameters
+    ----------
+    n : int
+        The number of frequency points.
+    max_fraction : float
+        The largest m is this fraction of n. 1/3 leaves at least a few terms for the modified Allan deviation.
+    per_decade : int
+        How many averaging factors per decade of tau.
+
+    Returns
+    -------
+    ms : np.ndarray
+        The averaging factors, unique integers starting at 1.
+    """
+    max_m = max(int(n*max_fraction), 1)
+    num = int(np.ceil(np.log10(max_m)*per_decade)) + 1
+    return np.unique(np.round(np.logspace(0, np.log10(max_m), num)).astype(np.int64))
+
+def getSampleInterval(times):
+    """
+    Returns the typical time between points, the median spacing, so gaps in the run don't skew it.
+
+    Parameters
+    ----------
+    times : np.ndarray
+        The time of each point in seconds.
+
+    Returns
+    -------
+    tau0 : float
+        The typical spacing in seconds.
+    """
+    return float(np.median(np.diff(times)))
+
+def getPhase(freqs, tau0):
+    """
+    Integrates a frequency series into phase, x[0] = 0 and x[i+1] = x[i] + y[i]*tau0. The mean frequency is taken out first,
+    it doesn't change the Allan deviation but it keeps the running sum small enough that no precision is lost.
+    """
+    y = np.asarray(freqs, dtype=np.float64)
+    x = np.zeros(len(y) + 1)
+    np.cumsum((y - np.mean(y))*tau0, out=x[1:])
+    return x
+
+def sumOfSquares(a, terms, n):
+    """
+    Returns the sum over j < n of (c1*a[j+k1] + c2*a[j+k2] + ...)**2, working through a in blocks of BLOCK_SIZE points.
+
+    Parameters
+    ----------
+    a : np.ndarray
+        The series, phase or cumulative phase.
+    terms : [(int, float)]
+        The (offset k, coefficient c) of each term.
+    n : int
+        The number of values of j.
+
+    Returns
+    -------
+    total : float
+        The sum of squares.
+    """
+    total = 0.0
+    buf = np.empty(min(BLOCK_SIZE, n))
+    tmp = np.empty(min(BLOCK_SIZE, n))
+    for start in range(0, n, BLOCK_SIZE):
+        end = min(start + BLOCK_SIZE, n)
+        v = buf[:end-start]
+        t = tmp[:end-start]
+        (k, c) = terms[0]
+        np.multiply(a[start+k:end+k], c, out=v)
+        for (k, c) in terms[1:]:
+            np.multiply(a[start+k:end+k], c, out=t)
+            v += t
+        total = total + np.dot(v, v)
+    return total
+
+def overlappingAllanDeviation(freqs, tau0, ms=None):
+    """
+    Returns the overlapping Allan deviation of a frequency series.
+
+    Parameters
+    ----------
+    freqs : np.ndarray
+        Evenly spaced frequency readings.
+    tau0 : float
+        The time between readings in seconds.
+    ms : np.ndarray, optional
+        The averaging factors to compute, tau = m*tau0. Defaults to getAveragingFactors(len(freqs), 1/2).
+
+    Returns
+    -------
+    taus : np.ndarray
+        The averaging times in seconds.
+    adev : np.ndarray
+        The overlapping Allan deviation at each averaging time.
+    errors : np.ndarray
+        A simple error estimate for each deviation, adev/sqrt(number of terms).
+    """
+    x = getPhase(freqs, tau0)
+    if (ms is None):
+        ms = getAveragingFactors(len(freqs), 1/2)
+    ms = np.asarray(ms, dtype=np.int64)
+    ms = ms[2*ms < len(x)]
+    adev = np.zeros(len(ms))
+    counts = np.zeros(len(ms))
+    for (k, m) in enumerate(ms):
+        #second differences of phase, x[i+2m] - 2x[i+m] + x[i]
+        n = len(x) - 2*m
+        counts[k] = n
+        adev[k] = np.sqrt(sumOfSquares(x, [(2*m, 1.0), (m, -2.0), (0, 1.0)], n)/(2*(m*tau0)**2*n))
+    return ms*tau0, adev, adev/np.sqrt(counts)
+
+def modifiedAllanDeviation(freqs, tau0, ms=None):
+    """
+    Returns the modified Allan deviation of a frequency series, which also averages over phase and so can tell white and flicker phase noise apart.
+
+    Parameters
+    ----------
+    freqs : np.ndarray
+        Evenly spaced frequency readings.
+    tau0 : float
+        The time between readings in seconds.
+    ms : np.ndarray, optional
+        The averaging factors to compute, tau = m*tau0. Defaults to getAveragingFactors(len(freqs), 1/3).
+
+    Returns
+    -------
+    taus : np.ndarray
+        The averaging times in seconds.
+    mdev : np.ndarray
+        The modified Allan deviation at each averaging time.
+    errors : np.ndarray
+        A simple error estimate for each deviation, mdev/sqrt(number of terms).
+    """
+    x = getPhase(freqs, tau0)
+    if (ms is None):
+        ms = getAveragingFactors(len(freqs), 1/3)
+    ms = np.asarray(ms, dtype=np.int64)
+    ms = ms[3*ms <= len(x) - 1]
+    #the sum of m consecutive second differences starting at j is X[j+3m] - 3X[j+2m] + 3X[j+m] - X[j], X being the cumulative sum
+    #of the phase, so one cumulative sum serves every averaging time
+    X = np.zeros(len(x) + 1)
+    np.cumsum(x, out=X[1:])
+    mdev = np.zeros(len(ms))
+    counts = np.zeros(len(ms))
+    for (k, m) in enumerate(ms):
+        n = len(X) - 3*m
+        counts[k] = n
+        mdev[k] = np.sqrt(sumOfSquares(X, [(3*m, 1.0), (2*m, -3.0), (m, 3.0), (0, -1.0)], n)/(2*float(m)**4*tau0**2*n))
+    return ms*tau0, mdev, mdev/np.sqrt(counts)
+
+def getProcessedAllanDeviations(df, columns=PROCESSED_COLUMNS, per_decade=POINTS_PER_DECADE):
+    """
+    Returns the overlapping and modified Allan deviation of the frequency columns of a processed data frame.
+
+    Parameters
+    ----------
+    df : pandas.Dataframe
+        Processed data, as returned by processAllData_rt or read from a _processed.csv.
+    columns : [str]
+        The columns to analyze.
+    per_decade : int
+        How many averaging times per decade.
+
+    Returns
+    -------
+    deviations : pandas.Dataframe
+        One row per averaging time, with a Tau column and '<column> ADEV' and '<column> MDEV' columns.
+        MDEV is blank for the longest averaging times, it needs three tau of data instead of two.
+    """
+    tau0 = getSampleInterval(df['Time'].to_numpy())
+    ms = getAveragingFactors(len(df), 1/2, per_decade)
+    deviations = pd.DataFrame({'Tau': ms*tau0})
+    for col in columns:
+        freqs = df[col].to_numpy(dtype=np.float64)
+        taus, adev, errors = overlappingAllanDeviation(freqs, tau0, ms)
+        deviations[col + ' ADEV'] = pd.Series(adev)
+        taus, mdev, errors = modifiedAllanDeviation(freqs, tau0, ms)
+        deviations[col + ' MDEV'] = pd.Series(mdev)
+    return deviations
+
+
+class StreamingAllanDeviation:
+    """
+    Overlapping and modified Allan deviation at a fixed set of averaging times, updated one point at a time.
+    Each point costs O(number of averaging times), and only the last 3*max(ms) phase values are kept, not the run.
+
+    Parameters
+    ----------
+    tau0 : float
+        The time between readings in seconds.
+    ms : [int]
+        The averaging factors to keep track of, tau = m*tau0. e.g. getAveragingFactors(expected number of points).
+    """
+    def __init__(self, tau0, ms):
+        self.tau0 = tau0
+        self.ms = np.unique(np.asarray(ms, dtype=np.int64)) #sorted, so the averaging times with enough data are always the first ones
+        self.size = 3*int(self.ms.max()) + 1
+        #the last m second differences for every averaging time, one after the other in a single array
+        self.diff_starts = np.concatenate(([0], np.cumsum(self.ms)[:-1]))
+        self.clear()
+
+    def clear(self):
+        self.phase = np.zeros(self.size) #ring buffer of the most recent phase values
+        self.count = 0 #number of phase values so far
+        self.offset = None #the first frequency is taken out of every reading to keep the phase small
+        self.adev_sums = np.zeros(len(self.ms))
+        self.adev_counts = np.zeros(len(self.ms), dtype=np.int64)
+        #for the modified deviation, the last m second differences and their running sum, per averaging time
+        self.diffs = np.zeros(int(np.sum(self.ms)))
+        self.diff_sums = np.zeros(len(self.ms))
+        self.mdev_sums = np.zeros(len(self.ms))
+        self.mdev_counts = np.zeros(len(self.ms), dtype=np.int64)
+
+    def add(self, freq):
+        """
+        Adds one frequency reading, updating every averaging time at once.
+
+        Parameters
+        ----------
+        freq : float
+            The reading.
+        """
+        if (self.offset is None):
+            self.offset = freq
+            self.count = 1 #x[0] = 0
+        k = self.count
+        x = self.phase[(k - 1) % self.size] + (freq - self.offset)*self.tau0
+        self.phase[k % self.size] = x
+        self.count = k + 1
+        #only averaging times with k >= 2m have a new second difference
+        n = int(np.searchsorted(self.ms, k//2, side='right'))
+        if (n == 0):
+            return
+        ms = self.ms[:n]
+        d = x - 2*self.phase[(k - ms) % self.size] + self.phase[(k - 2*ms) % self.size]
+        self.adev_sums[:n] += d*d
+        self.adev_counts[:n] += 1
+        #d is second difference number i = k - 2m, the window holds differences i-m+1 to i
+        i = k - 2*ms
+        slots = self.diff_starts[:n] + i % ms
+        self.diff_sums[:n] += d - self.diffs[slots]
+        self.diffs[slots] = d
+        full = np.flatnonzero(i >= ms - 1)
+        self.mdev_sums[full] += self.diff_sums[full]**2
+        self.mdev_counts[full] += 1
+
+    def addPoints(self, freqs):
+        for freq in freqs:
+            self.add(freq)
+
+    def getDeviations(self):
+        """
+        Returns the deviations so far. Averaging times without enough data yet are nan.
+
+        Returns
+        -------
+        taus : np.ndarray
+            The averaging times in seconds.
+        adev : np.ndarray
+            The overlapping Allan deviation at each averaging time.
+        mdev : np.ndarray
+            The modified Allan deviation at each averaging time.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            adev = np.sqrt(self.adev_sums/(2*(self.ms*self.tau0)**2*self.adev_counts))
+            mdev = np.sqrt(self.mdev_sums/(2*self.ms.astype(np.float64)**4*self.tau0**2*self.mdev_counts))
+        return self.ms*self.tau0, adev, mdev
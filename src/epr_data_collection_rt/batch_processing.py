@@ -0,0 +1,254 @@
+import argparse
+import os
+import re
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+try:
+    from . import kse_experiment_utils as kse
+    from . import processed_cache as cache
+    from . import raw_data_store as store
+    from . import utilities as util
+except ImportError:
+    import kse_experiment_utils as kse
+    import processed_cache as cache
+    import raw_data_store as store
+    import utilities as util
+
+########## BATCH PROCESSING ############################################################################################################
+# Reprocesses every raw data file in one or more run folders, spread across a pool of processes, and writes a summary
+# table with one row per run. Use this instead of looping over processAllData in the notebook when the analysis settings change.
+#
+# Run from the top of the repository:
+#       python -m src.epr_data_collection_rt.batch_processing Data/kseExperiment --metal rb85 --energy high
+#
+# Raw files are found by name (the timestamp from dtStringForFilename, as either .csv or .bin), and each one gets a
+# <name>_processed.csv written next to it (or in --output-dir). Both realtime and batched raw csv layouts are understood.
+# Results are kept in the processed data cache (see processed_cache), so runs that haven't changed since the last batch are not converted again.
+
+RAW_FILENAME_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}-\d{2}_\d{2}_\d{2}(\.\d+)?\.(csv|bin)$')
+SUMMARY_COLUMNS = ['File', 'Start', 'Duration (s)', 'Rows', 'Rows Read', 'Frequency Overflows', 'DMM Overflows',
+                   'Keysight Mean', 'Keysight Std Dev', 'Adjusted Mean', 'Adjusted Std Dev', 'Seconds', 'Error']
+
+########################################################################################################################################
+
+
+def findRawDataFiles(folders, recursive=False):
+    """
+    Finds every raw data file in the given folders, going by the file name.
+
+    Parameters
+    ----------
+    folders : [str]
+        The folders to search.
+    recursive : bool
+        Also search all the subfolders.
+
+    Returns
+    -------
+    files : [str]
+        The paths to the raw data files, sorted by name (so also by start time within a folder).
+    """
+    files = []
+    for folder in folders:
+        for (dirpath, dirnames, filenames) in os.walk(folder):
+            files.extend(os.path.join(dirpath, fn) for fn in filenames if RAW_FILENAME_PATTERN.match(fn))
+            if (not recursive):
+                break
+    return sorted(files)
+
+def getProcessedFilename(fp, output_dir=None):
+    """
+    Returns the path of the processed data file for a raw data file, in the same form the apps use.
+
+    Parameters
+    ----------
+    fp : str
+        The path to the raw data file.
+    output_dir : str, optional
+        Where to put the processed file. Defaults to the folder of the raw file.
+
+    Returns
+    -------
+    fp_processed : str
+        The path to the processed data file.
+    """
+    folder, filename = os.path.split(fp)
+    name = os.path.splitext(filename)[0]
+    return os.path.join(output_dir if output_dir is not None else folder, name + '_processed.csv')
+
+def processRawFile(fp, metal, energy, apply_corrections=False):
+    """
+    Processes a single raw data file, csv or binary, realtime or batched.
+
+    Parameters
+    ----------
+    fp : str
+        The path to the raw data file.
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see kse.getConversionCoefficients.
+
+    Returns
+    -------
+    df : pandas.Dataframe
+        The processed data, with the overflow counts in df.attrs['rejected'].
+    """
+    if (store.isRawDataFile(fp)):
+        return store.processRawDataFile(fp, metal, energy, apply_corrections)
+    header = pd.read_csv(fp, nrows=0, quotechar='|').columns
+    if ('Time Interval' in header):
+        return kse.processAllData_rt(fp, metal, energy, apply_corrections)
+    return kse.processAllData(fp, metal, energy, apply_corrections)
+
+def processRunFile(fp, metal, energy, output_dir=None, cache_dir=None, use_cache=True, apply_corrections=False):
+    """
+    Processes one raw data file, writes its processed csv, and summarizes it. Runs in a worker process.
+    Errors are reported in the summary instead of raised, so one bad file doesn't stop the rest.
+
+    Parameters
+    ----------
+    fp : str
+        The path to the raw data file.
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.
+    output_dir : str, optional
+        Where to put the processed file. Defaults to the folder of the raw file.
+    cache_dir : str, optional
+        Where the processed data cache lives. Uses the default cache folder if not given.
+    use_cache : bool
+        Load unchanged runs from the processed data cache instead of converting them again.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see kse.getConversionCoefficients.
+
+    Returns
+    -------
+    summary : dict
+        One row of the summary table, keyed by SUMMARY_COLUMNS.
+    """
+    t0 = time.perf_counter()
+    summary = {'File': fp, 'Start': os.path.splitext(os.path.basename(fp))[0]}
+    try:
+        if (use_cache):
+            df = cache.processCached(fp, metal, energy, processRawFile, cache.ProcessedDataCache(cache_dir), apply_corrections)
+        else:
+            df = processRawFile(fp, metal, energy, apply_corrections)
+        kse.createCSVProcessedData(getProcessedFilename(fp, output_dir), df)
+        summary['Rows'] = len(df)
+        summary['Rows Read'] = df.attrs.get('rows_read', len(df))
+        summary['Frequency Overflows'] = df.attrs['rejected']['Frequencies']
+        summary['DMM Overflows'] = df.attrs['rejected']['Voltages']
+        if (len(df) > 0):
+            times = df['Time'].to_numpy()
+            summary['Duration (s)'] = times[-1] - times[0]
+            summary['Keysight Mean'], summary['Keysight Std Dev'] = kse.getAvgAndStdDev(df['Keysight'].to_numpy())
+            summary['Adjusted Mean'], summary['Adjusted Std Dev'] = kse.getAvgAndStdDev(df['Adjusted Keysight Data'].to_numpy())
+    except Exception as error:
+        summary['Error'] = type(error).__name__ + ': ' + str(error)
+    summary['Seconds'] = time.perf_counter() - t0
+    return summary
+
+def processRunFiles(files, metal, energy, workers=None, output_dir=None, cache_dir=None, use_cache=True, apply_corrections=False, log=print):
+    """
+    Processes raw data files in parallel, one file per task, and reports progress as each one finishes.
+
+    Parameters
+    ----------
+    files : [str]
+        The paths to the raw data files.
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.
+    workers : int, optional
+        The number of worker processes. Defaults to the number of cores.
+    output_dir : str, optional
+        Where to put the processed files. Defaults to the folder of each raw file.
+    cache_dir : str, optional
+        Where the processed data cache lives. Uses the default cache folder if not given.
+    use_cache : bool
+        Load unchanged runs from the processed data cache instead of converting them again.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see kse.getConversionCoefficients.
+    log : function
+        Called with progress messages.
+
+    Returns
+    -------
+    summaries : [dict]
+        One summary row per file, in the same order as files.
+    """
+    if (workers is None):
+        workers = os.cpu_count() or 1
+    #hand out the biggest files first, so one big file at the end doesn't leave every other core idle
+    order = sorted(range(0, len(files)), key=lambda i: os.path.getsize(files[i]), reverse=True)
+    summaries = [None]*len(files)
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(processRunFile, files[i], metal, energy, output_dir, cache_dir, use_cache, apply_corrections): i for i in order}
+        done = 0
+        for future in as_completed(futures):
+            i = futures[future]
+            summaries[i] = future.result()
+            done = done + 1
+            s = summaries[i]
+            result = ('ERROR ' + s['Error']) if 'Error' in s else (str(s['Rows']) + ' rows')
+            log('[' + str(done) + '/' + str(len(files)) + '] ' + os.path.basename(files[i]) + ': ' + result + ' in ' + str(round(s['Seconds'], 2)) + ' s')
+    log('Processed ' + str(len(files)) + ' files in ' + str(round(time.perf_counter() - t0, 2)) + ' s with ' + str(workers) + ' workers')
+    return summaries
+
+def buildSummaryTable(summaries):
+    """
+    Combines the per file summaries into one table.
+
+    Parameters
+    ----------
+    summaries : [dict]
+        The summaries returned by processRunFiles.
+
+    Returns
+    -------
+    table : pandas.Dataframe
+        One row per file, with the columns in SUMMARY_COLUMNS.
+    """
+    return pd.DataFrame(summaries, columns=SUMMARY_COLUMNS)
+
+def main():
+    parser = argparse.ArgumentParser(description='Reprocess every raw data file in one or more run folders in parallel, and summarize the runs.')
+    parser.add_argument('folders', nargs='+', help='folders containing raw data files')
+    parser.add_argument('--metal', required=True, choices=['rb85', 'rb87', 'cs133'])
+    parser.add_argument('--energy', required=True, choices=['high', 'low'])
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, defaults to the number of cores')
+    parser.add_argument('--recursive', action='store_true', help='also search subfolders')
+    parser.add_argument('--output-dir', default=None, help='where to write the processed files, defaults to next to each raw file')
+    parser.add_argument('--cache-dir', default=None, help='where the processed data cache lives, defaults to KSE_CACHE_DIR or ~/.kse_cache')
+    parser.add_argument('--no-cache', action='store_true', help='always convert from the raw files')
+    parser.add_argument('--apply-corrections', action='store_true', help='apply the quadratic in field and frequency corrections to the dmm conversion')
+    parser.add_argument('--summary', default=None, help='where to write the summary table, defaults to <first folder>/<date>_summary.csv')
+    args = parser.parse_args()
+
+    files = findRawDataFiles(args.folders, args.recursive)
+    if (len(files) == 0):
+        print('No raw data files found in ' + ', '.join(args.folders))
+        return
+    if (args.output_dir is not None):
+        os.makedirs(args.output_dir, exist_ok=True)
+    print('Processing ' + str(len(files)) + ' raw data files as ' + args.metal + ' ' + args.energy)
+    summaries = processRunFiles(files, args.metal, args.energy, args.workers, args.output_dir, args.cache_dir, not args.no_cache, args.apply_corrections)
+    summary_fp = args.summary
+    if (summary_fp is None):
+        summary_fp = os.path.join(args.folders[0], util.dtStringForFilename() + '_summary.csv')
+    buildSummaryTable(summaries).to_csv(summary_fp, index=False)
+    print('Summary saved to ' + summary_fp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+import os
+
+try:
+    from . import simulated_instruments as sim
+except ImportError:
+    import simulated_instruments as sim
+
+########## INSTRUMENT BACKENDS ############################################################################################################
+# Everything that talks to hardware (pyvisa, nidaqmx, pymeasure) is created through the functions in this module,
+# so the apps can be pointed at simulated instruments instead of real ones.
+# The hardware libraries are only imported when a hardware backend is actually used.
+#
+# To run either app (or the benchmarks) without any instruments attached, set the environment variable
+#       KSE_INSTRUMENT_BACKEND=simulated
+# or call useSimulatedInstruments() before anything connects.
+
+BACKEND_ENV_VAR = 'KSE_INSTRUMENT_BACKEND'
+HARDWARE = 'hardware'
+SIMULATED = 'simulated'
+
+_backend = os.environ.get(BACKEND_ENV_VAR, HARDWARE).lower()
+_bench = None
+
+########################################################################################################################################
+
+
+def useSimulatedInstruments(settings=None):
+    """
+    Switches every instrument created from here on over to simulated instruments.
+
+    Parameters
+    ----------
+    settings : simulated_instruments.SimulationSettings, optional
+        Latency, noise, overflow, and failure settings for the simulated instruments. Uses the defaults if not given.
+
+    Returns
+    -------
+    bench : simulated_instruments.SimulatedBench
+        The simulated bench the instruments are attached to, useful for reading back trigger counts.
+    """
+    global _backend, _bench
+    _backend = SIMULATED
+    _bench = sim.SimulatedBench(settings)
+    return _bench
+
+def useHardwareInstruments():
+    """
+    Switches every instrument created from here on back to real hardware.
+    """
+    global _backend, _bench
+    _backend = HARDWARE
+    _bench = None
+
+def isSimulated():
+    """
+    Returns True if instruments are being simulated.
+
+    Returns
+    -------
+    simulated : bool
+        True if the simulated backend is selected.
+    """
+    return _backend == SIMULATED
+
+def getSimulatedBench():
+    """
+    Returns the simulated bench, creating one with the default settings if needed.
+
+    Returns
+    -------
+    bench : simulated_instruments.SimulatedBench
+        The simulated bench the instruments are attached to.
+    """
+    global _bench
+    if (_bench is None):
+        _bench = sim.SimulatedBench()
+    return _bench
+
+def getResourceManager():
+    """
+    Opens a VISA resource manager.
+
+    Returns
+    -------
+    rm : visa.ResourceManager or simulated_instruments.SimulatedResourceManager
+        The resource manager to open instrument connections with.
+    """
+    if (isSimulated()):
+        return getSimulatedBench().getResourceManager()
+    import pyvisa as visa
+    return visa.ResourceManager()
+
+def getLocalSystem():
+    """
+    Returns the local NI-DAQmx system, used to list the available DAQ channels.
+
+    Returns
+    -------
+    system : nidaqmx.system.System or simulated_instruments.SimulatedSystem
+        The local system.
+    """
+    if (isSimulated()):
+        return getSimulatedBench().getSystem()
+    import nidaqmx.system
+    return nidaqmx.system.System.local()
+
+def createDAQTask():
+    """
+    Creates a new DAQ task.
+
+    Returns
+    -------
+    task : nidaqmx.Task or simulated_instruments.SimulatedDAQTask
+        A new, empty DAQ task.
+    """
+    if (isSimulated()):
+        return getSimulatedBench().createTask()
+    import nidaqmx
+    return nidaqmx.Task()
+
+def configureFiniteOutput(task, rate, samples):
+    """
+    Switches a DAQ output task over to the sample clock, so each waveform written to it is played out
+    by the DAQ hardware at a fixed rate instead of one software write at a time.
+
+    Parameters
+    ----------
+    task : nidaqmx.Task or simulated_instruments.SimulatedDAQTask
+        The task to configure, with its output channel already added.
+    rate : float
+        The sample clock rate, in samples/s.
+    samples : int
+        The number of samples in each waveform.
+    """
+    if (isSimulated()):
+        task.timing.cfg_samp_clk_timing(rate, sample_mode='finite', samps_per_chan=samples)
+        return
+    from nidaqmx.constants import AcquisitionType
+    task.timing.cfg_samp_clk_timing(rate, sample_mode=AcquisitionType.FINITE, samps_per_chan=samples)
+
+def createDMM(dmm_addr, gpib_channel_no):
+    """
+    Connects to the Keithley 2000 DMM through a Prologix GPIB adapter.
+
+    Parameters
+    ----------
+    dmm_addr : str
+        The address of the Prologix adapter.
+    gpib_channel_no : int
+        The GPIB address set on the DMM.
+
+    Returns
+    -------
+    adapter : PrologixAdapter or simulated_instruments.SimulatedAdapter
+        The adapter, which needs to be closed when collection ends.
+    dmm : Keithley2000 or simulated_instruments.SimulatedKeithley2000
+        The DMM.
+    """
+    if (isSimulated()):
+        bench = getSimulatedBench()
+        adapter = bench.createAdapter(dmm_addr, gpib_channel_no)
+        return adapter, bench.createDMM(adapter)
+    from pymeasure.instruments.keithley import Keithley2000
+    from pymeasure.adapters import PrologixAdapter
+    adapter = PrologixAdapter(dmm_addr, gpib_channel_no)
+    dmm = Keithley2000(adapter)
+    return adapter, dmm
+
+def setDMMTimeout(adapter, timeout):
+    """
+    Sets how long reads from the dmm can take before the adapter gives up with a timeout error.
+    The adapter's connection is set in its own unit: a pyvisa resource (the PrologixAdapter of pymeasure 0.10 and later)
+    takes ms, a pyserial port (the PrologixAdapter of older pymeasure, over a SerialAdapter) takes seconds.
+    The simulated adapter takes ms, like pyvisa.
+
+    Parameters
+    ----------
+    adapter : PrologixAdapter or simulated_instruments.SimulatedAdapter
+        The dmm's adapter.
+    timeout : float
+        The timeout in seconds.
+
+    Returns
+    -------
+    was_set : bool
+        False if the adapter has no connection whose timeout we know how to set, the read timeout is then left as it was.
+    """
+    if (isSimulated()):
+        adapter.timeout = timeout*1000
+        return True
+    connection = getattr(adapter, 'connection', None)
+    if ((connection is None) or (not hasattr(connection, 'timeout'))):
+        return False
+    if (hasattr(connection, 'visalib')):
+        #pyvisa resource, timeouts in ms
+        connection.timeout = timeout*1000
+    elif (hasattr(connection, 'baudrate')):
+        #pyserial port, timeouts in seconds
+        connection.timeout = timeout
+    else:
+        return False
+    return True
@@ -0,0 +1,266 @@
+try:
+    from . import instrument_backends as backends
+except ImportError:
+    import instrument_backends as backends
+
+########## INSTRUMENT SESSION ############################################################################################################
+# Keeps the instrument connections open between runs, so back to back runs don't have to reopen the VISA resources,
+# reset the Keysight and the dmm, and recreate the DAQ task every time.
+#
+# Each instrument is only reconnected when its address changes or when it stops answering a quick *IDN? query,
+# and only the configuration commands that differ from what was last sent to it are sent again.
+# Configuration is a list of commands sent in order. If one command changes, it and every command after it are sent
+# again, since an earlier command (CONF:FREQ for example) can reset the ones that come after it.
+#
+# Call close() when the app exits, or after errors that might have left an instrument in a bad state.
+
+LIVENESS_TIMEOUT = 1.0 #seconds to wait for *IDN? before deciding a connection is dead
+
+########################################################################################################################################
+
+
+def getCommandsToSend(applied, wanted):
+    """
+    Returns the configuration commands that need to be sent to go from one configuration to another.
+
+    Parameters
+    ----------
+    applied : [str]
+        The configuration commands last sent to the instrument, in order.
+    wanted : [str]
+        The configuration commands the instrument should have, in order.
+
+    Returns
+    -------
+    commands : [str]
+        Every command from the first one that differs onwards, or an empty list if nothing changed.
+    """
+    for i in range(0, len(wanted)):
+        if ((i >= len(applied)) or (applied[i] != wanted[i])):
+            return list(wanted[i:])
+    return []
+
+
+class InstrumentSession:
+    """
+    Long lived connections to the frequency counter, the dmm, and the DAQ, shared by every run.
+
+    Parameters
+    ----------
+    on_status : function(str), optional
+        Called with messages about connections being opened, reused, and closed.
+    """
+    def __init__(self, on_status=None):
+        self.on_status = on_status
+        self.rm = None
+        self.freq_counter = None
+        self.keysight_addr = None
+        self.keysight_config = []
+        self.adapter = None
+        self.dmm = None
+        self.dmm_key = None
+        self.dmm_config = []
+        self.task = None
+        self.task_key = None
+
+    def status(self, msg):
+        if (self.on_status is not None):
+            self.on_status(msg)
+
+    def getResourceManager(self):
+        """
+        Returns the VISA resource manager, opening it the first time.
+        """
+        if (self.rm is None):
+            self.rm = backends.getResourceManager()
+        return self.rm
+
+    def isFrequencyCounterAlive(self):
+        """
+        Returns True if the open frequency counter connection still answers *IDN?.
+        """
+        timeout = self.freq_counter.timeout
+        try:
+            self.freq_counter.timeout = LIVENESS_TIMEOUT*1000 #pyvisa timeouts are in ms
+            self.freq_counter.query('*IDN?')
+            return True
+        except Exception:
+            return False
+        finally:
+            self.freq_counter.timeout = timeout
+
+    def isDMMAlive(self):
+        """
+        Returns True if the open dmm connection still answers *IDN?.
+        """
+        try:
+            self.dmm.ask('*IDN?')
+            return True
+        except Exception:
+            return False
+
+    def isTaskAlive(self):
+        """
+        Returns True if the DAQ task hasn't been closed or lost.
+        """
+        try:
+            self.task.is_task_done()
+            return True
+        except Exception:
+            return False
+
+    def getFrequencyCounter(self, keysight_addr, config, timeout):
+        """
+        Returns a configured connection to the Keysight, reusing the open one if it is for the same address and still answering.
+        A new connection is reset first, a reused one just has any measurement in progress aborted.
+
+        Parameters
+        ----------
+        keysight_addr : str
+            The VISA address of the frequency counter.
+        config : [str]
+            The configuration commands, in order.
+        timeout : float
+            How long reads can take, in seconds.
+
+        Returns
+        -------
+        freq_counter : pyvisa Resource or simulated_instruments.SimulatedFrequencyCounter
+            The frequency counter.
+        """
+        if ((self.freq_counter is not None) and (self.keysight_addr == keysight_addr) and self.isFrequencyCounterAlive()):
+            self.freq_counter.write('ABOR')
+            self.freq_counter.write('*CLS')
+            self.status('Reusing frequency counter connection')
+        else:
+            self.closeFrequencyCounter()
+            self.freq_counter = self.getResourceManager().open_resource(keysight_addr)
+            self.keysight_addr = keysight_addr
+            ## reset everything and clear the event queues
+            self.freq_counter.write('*RST')
+            self.freq_counter.write('STAT:PRES')
+            self.freq_counter.write('*CLS')
+            self.keysight_config = []
+        self.freq_counter.encoding = 'latin_1'
+        self.freq_counter.timeout = timeout*1000 #pyvisa timeouts are in ms
+        self.freq_counter.source_channel = 'CH1'
+        for cmd in getCommandsToSend(self.keysight_config, config):
+            self.freq_counter.write(cmd)
+        self.keysight_config = list(config)
+        return self.freq_counter
+
+    def getDMM(self, dmm_addr, gpib_channel_no, config, timeout=None):
+        """
+        Returns a configured connection to the Keithley dmm, reusing the open one if it is for the same address and still answering.
+        A new connection is reset first, a reused one just has any measurement in progress aborted.
+
+        Parameters
+        ----------
+        dmm_addr : str
+            The address of the Prologix adapter.
+        gpib_channel_no : int
+            The GPIB address set on the dmm.
+        config : [str]
+            The configuration commands, in order.
+        timeout : float, optional
+            How long reads can take, in seconds. The adapter's default if not given.
+
+        Returns
+        -------
+        adapter : PrologixAdapter or simulated_instruments.SimulatedAdapter
+            The adapter.
+        dmm : Keithley2000 or simulated_instruments.SimulatedKeithley2000
+            The dmm.
+        """
+        key = (dmm_addr, gpib_channel_no)
+        if ((self.dmm is not None) and (self.dmm_key == key) and self.isDMMAlive()):
+            self.dmm.write('ABOR')
+            self.status('Reusing dmm connection')
+        else:
+            self.closeDMM()
+            self.adapter, self.dmm = backends.createDMM(dmm_addr, gpib_channel_no)
+            self.dmm_key = key
+            self.dmm.reset()
+            self.dmm_config = []
+        if ((timeout is not None) and (not backends.setDMMTimeout(self.adapter, timeout))):
+            self.status("Can't set the dmm read timeout on a " + type(self.adapter).__name__ + ', reads use its own timeout')
+        for cmd in getCommandsToSend(self.dmm_config, config):
+            self.dmm.write(cmd)
+        self.dmm_config = list(config)
+        return self.adapter, self.dmm
+
+    def getDAQTask(self, daq_path, timing=None):
+        """
+        Returns a DAQ task with an analog output channel, reusing the open one if nothing about it has changed.
+        Without timing the task is started and set to 0V. With timing it is left stopped, ready for a waveform.
+
+        Parameters
+        ----------
+        daq_path : str
+            The analog output channel.
+        timing : (float, int), optional
+            The sample clock rate and samples per waveform for hardware timed output. Software timed if not given.
+
+        Returns
+        -------
+        task : nidaqmx.Task or simulated_instruments.SimulatedDAQTask
+            The DAQ task.
+        """
+        key = (daq_path, timing)
+        if ((self.task is not None) and (self.task_key == key) and self.isTaskAlive()):
+            if (timing is None):
+                self.task.write(0.0)#make sure we are starting at 0V
+            return self.task
+        self.closeDAQTask()
+        self.task = backends.createDAQTask()
+        self.task.ao_channels.add_ao_voltage_chan(daq_path)
+        self.task.start()
+        self.task.write(0.0)#make sure we are starting at 0V
+        if (timing is not None):
+            self.task.stop()
+            backends.configureFiniteOutput(self.task, timing[0], timing[1])
+        self.task_key = key
+        return self.task
+
+    def closeFrequencyCounter(self):
+        if (self.freq_counter is not None):
+            try:
+                self.freq_counter.close()
+            except Exception:
+                pass
+        self.freq_counter = None
+        self.keysight_addr = None
+        self.keysight_config = []
+
+    def closeDMM(self):
+        if (self.adapter is not None):
+            try:
+                self.adapter.close()
+            except Exception:
+                pass
+        self.adapter = None
+        self.dmm = None
+        self.dmm_key = None
+        self.dmm_config = []
+
+    def closeDAQTask(self):
+        if (self.task is not None):
+            try:
+                self.task.close()
+            except Exception:
+                pass
+        self.task = None
+        self.task_key = None
+
+    def close(self):
+        """
+        Closes every connection and the resource manager. The next run connects from scratch. Safe to call more than once.
+        """
+        self.closeDAQTask()
+        if (self.rm is not None):
+            self.status('Closing Connection with ' + str(self.rm.list_opened_resources()))
+        self.closeFrequencyCounter()
+        self.closeDMM()
+        if (self.rm is not None):
+            self.rm.close()
+            self.rm = None
@@ -0,0 +1,694 @@
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait as waitForFetches
+
+import numpy as np
+
+try:
+    from . import instrument_session as session
+    from . import kse_experiment_utils as kse
+    from . import latency_probes as probes
+    from . import processed_cache as cache
+    from . import queued_writer as qw
+    from . import raw_data_store as store
+    from . import running_stats as rs
+    from . import utilities as util
+except ImportError:
+    import instrument_session as session
+    import kse_experiment_utils as kse
+    import latency_probes as probes
+    import processed_cache as cache
+    import queued_writer as qw
+    import raw_data_store as store
+    import running_stats as rs
+    import utilities as util
+
+
+# the phases of the loop that are timed, in the order they happen
+## initialization: arming the instruments and the throwaway pulse (INIT, pulse, R?), or arming and loading the waveform with hardware timing
+## trigger pulses: the trigger pulses and the high_time/low_time sleeps
+## keysight fetch, dmm fetch: each instrument's read back, timed on its own thread
+## read back: how long the loop waited for both read backs
+## handoff: queueing the points for the writer, the running statistics, and the plot
+## cycle: a whole point (or batch), all of the above
+## disk write: writing a batch of points to the raw and processed files, on the writer thread
+LATENCY_PHASES = ['initialization', 'trigger pulses', 'keysight fetch', 'dmm fetch', 'read back', 'handoff', 'cycle', 'disk write']
+
+# the instruments time their own reads out (keysight_timeout, dmm_timeout), this is how much longer the loop waits
+# for a read back before giving up on a driver that is stuck and never returns
+FETCH_GRACE = 5.0 #seconds
+
+
+class RealtimeAcquisition:
+    """
+    The realtime data collection loop, on its own so it can run without the GUI (benchmarks, simulated instruments, headless runs).
+    The GUI fills in the user entered settings, hooks up the callbacks, and calls run() from a worker thread.
+    Instruments are created through instrument_backends, so the same loop runs against real or simulated instruments.
+
+    Callbacks
+    ---------
+    on_point : function(freq, time_interval)
+        Called from the collection thread with every valid point, used to feed the live plot.
+    on_status : function(str)
+        Called with user feedback messages.
+    on_writer_status : function(str)
+        Called with the state of the disk write queue after every point.
+    on_stats : function(str)
+        Called with the running statistics of the keysight and adjusted frequencies after every point (or batch).
+    on_latency : function(str)
+        Called with the latency percentiles of each phase of the loop after every point (or batch).
+    """
+    def __init__(self):
+        # Collection parameters
+        ## parameters that will remain hard coded
+        self.trig_count = 1 #set from points_per_arm in connect()
+        self.trig_count_cmd = 'TRIG:COUN '+ str(self.trig_count)
+        self.trig_source = 'EXT'
+        self.trig_source_cmd = 'TRIG:SOUR '+ self.trig_source
+        # Note about the timeing: the high and low times are set such that in conjunction with the initializaion cycle
+        # which now has to happen each time we get a point, the total time between points will be ~.8s. these an all be adjusted if needed
+        self.high_V = 2.0
+        self.low_V = 0.0
+        self.high_time = 0.1
+        self.low_time = 0.7
+        self.init_pulse_time = 0.05 #high and low time of the throwaway pulse in the initialization pass
+        ## parameters that could become user entered later
+        # buffered mode: with points_per_arm > 1 the keysight and the dmm trace buffer are armed for that many triggers at once,
+        # so the initialization pass only happens once per batch, and both buffers are read back (and plotted) at the end of each batch.
+        # the keithley trace buffer holds at most 1024 readings
+        self.points_per_arm = 1
+        # hardware timed triggers: the DAQ plays out the trigger pulses for a whole arm from its own sample clock instead of
+        # time.sleep between software writes, and the point times come from the DAQ clock
+        self.hardware_timing = False
+        self.daq_sample_rate = 1000.0 #samples/s, so pulse high and low times are rounded to the nearest ms
+        self.write_queue_size = 1000 #how many points can be waiting to be written to disk before new points get dropped
+        # the raw data file is fsynced every sync_every points or sync_interval seconds, whichever comes first,
+        # so a crash or power cut loses at most that much data without paying for an fsync on every point
+        self.sync_every = store.DEFAULT_SYNC_EVERY
+        self.sync_interval = store.DEFAULT_SYNC_INTERVAL
+        self.error_threshold = 3
+        self.apply_corrections = False #apply the quadratic in field and frequency corrections to the dmm conversion, see kse.getConversionCoefficients
+        self.stats_window = rs.DEFAULT_WINDOW #how many of the most recent points the windowed statistics cover
+        # the keysight (USB) and the dmm (prologix GPIB over serial) are read back at the same time, these are how long each one's reads can take, in seconds
+        self.keysight_timeout = 5.0
+        self.dmm_timeout = 5.0
+        self.gpib_channel_no = 1 #the channel number for the GPIB connection from the dmm. this can be set on the dmm to anything between 1 and 16
+        #user entered fields required to start collection
+        self.folder = ''
+        self.keysight_addr = ''
+        self.daq_path = ''
+        self.dmm_addr = ''
+        self.alkali_metal = ''
+        self.energy_level = ''
+        #state of the current run
+        self.session = session.InstrumentSession(self.status)
+        self.rm = None
+        self.freq_counter = None
+        self.task = None
+        self.adapter = None
+        self.dmm = None
+        self.outfile = None
+        self.live_processor = None
+        self.writer = None
+        self.fetch_pool = None
+        self.needs_reconnect = False #set when a read back failed, the instruments are reconnected before the next point
+        self.waveform = None
+        self.trigger_offsets = None
+        self.freq_stats = rs.RunStatistics('Keysight', 'Hz', self.stats_window)
+        self.adjusted_stats = rs.RunStatistics('Adjusted', 'Hz', self.stats_window)
+        self.coefficients = None
+        self.initial_V = None
+        #how long each phase of the loop takes, written to the _metrics.json file at the end of every run
+        self.latency = probes.LatencyProbes(LATENCY_PHASES)
+        self.running = False
+        self.start_time = None
+        self.error_counter = 0
+        self.points_collected = 0
+        self.filename = ''
+        self.processed_filename = ''
+        self.metrics_filename = ''
+        #callbacks
+        self.on_point = None
+        self.on_status = print
+        self.on_writer_status = None
+        self.on_stats = None
+        self.on_latency = None
+
+    def getMissingSetting(self):
+        """
+        Checks that all the user entered settings needed to start collection are filled in.
+
+        Returns
+        -------
+        missing : str or None
+            A description of the first missing setting, or None if nothing is missing.
+        """
+        if(self.folder==''):
+            return 'Data Collection File Location'
+        elif(self.keysight_addr==''):
+            return 'Keysight Address'
+        elif(self.dmm_addr==''):
+            return 'DMM Address'
+        elif(self.daq_path==''):
+            return 'DAQ Channel'
+        elif(self.alkali_metal==''):
+            return 'Alkali Metal'
+        elif(self.energy_level==''):
+            return 'Energy Level'
+        return None
+
+    def status(self, msg):
+        """
+        Passes a user feedback message on to on_status.
+        """
+        if (self.on_status is not None):
+            self.on_status(msg)
+
+    def openDataFiles(self):
+        """
+        Creates the raw and processed data files for a new run and starts the writer thread.
+        """
+        #do all the document prep at the beginning so it doesn't slow down collection later
+        #if a run in this folder was cut off by a crash or power cut, cut the torn last record off its raw data file
+        #files another program (or another run) is still writing are left alone
+        skipped = []
+        for (name, removed) in store.recoverRawDataFolder(self.folder, skipped).items():
+            self.status('Recovered ' + name + ', removed a torn record (' + str(removed) + ' bytes)')
+        for name in skipped:
+            self.status('Not checking ' + name + ' for a torn record, it is still being written')
+        #create a new raw data file at the specified location, the header is written when the file is created
+        #use store.exportRawDataToCSV to get the raw data as a csv
+        self.filename = util.dtStringForFilename()+store.RAW_FILE_EXT
+        self.fp = os.path.join(self.folder, self.filename)
+        self.outfile = store.RawDataWriter(self.fp, store.RT_COLUMNS, self.sync_every, self.sync_interval)
+        try:
+            #processed data is written as it is collected, using the metal and energy selected by the user
+            fn_arry = (self.filename).split('.')
+            self.processed_filename = fn_arry[0]+'.'+fn_arry[1]+'_processed.csv'
+            self.metrics_filename = fn_arry[0]+'.'+fn_arry[1]+'_metrics.json'
+            self.live_processor = kse.LiveDataProcessor(os.path.join(self.folder, self.processed_filename), self.alkali_metal, self.energy_level, self.apply_corrections)
+            #all disk writes happen on the writer thread so they can't hold up the trigger timing
+            #the writer thread also syncs the raw data file when no points arrive, so a stalled run doesn't leave points unsynced
+            if (self.sync_interval is None):
+                idle_interval = None
+            else:
+                idle_interval = self.sync_interval/4
+            self.writer = qw.QueuedWriter(self.writeSamples, maxsize=self.write_queue_size, on_idle=self.syncRawFile, idle_interval=idle_interval)
+            self.writer.start()
+        except Exception:
+            #don't leave half a run's files open
+            self.closeDataFiles()
+            raise
+        self.writerStatus()
+
+    def closeDataFiles(self):
+        """
+        Closes whichever of the raw and processed data files are open.
+        """
+        if (self.outfile is not None):
+            self.outfile.close()
+            self.outfile = None
+        if (self.live_processor is not None):
+            self.live_processor.close()
+            self.live_processor = None
+
+    def connect(self):
+        """
+        Connects to and configures the frequency counter, DAQ, and dmm, then creates the data files for a new run.
+        The files are only created once every instrument is connected, so a failed connection doesn't leave an empty run behind.
+        """
+        #files from a connect that was never run (initialized twice) are finished first, so their writer thread doesn't leak
+        self.finishRun()
+        self.error_counter = 0
+        self.start_time = None
+        self.points_collected = 0
+        self.trig_count = self.points_per_arm
+        self.trig_count_cmd = 'TRIG:COUN '+ str(self.trig_count)
+        #the statistics start over with every run, the adjusted frequency is converted the same way as the processed file
+        self.freq_stats = rs.RunStatistics('Keysight', 'Hz', self.stats_window)
+        self.adjusted_stats = rs.RunStatistics('Adjusted', 'Hz', self.stats_window)
+        self.coefficients = None #set from the first point, same as the processed file
+        self.initial_V = None
+        self.latency.clear()
+
+        self.connectInstruments()
+        self.status("Connected to frequency counter and dmm")
+        try:
+            self.openDataFiles()
+        except Exception:
+            self.finishRun()
+            raise
+
+    def connectInstruments(self):
+        """
+        Connects to and configures the frequency counter, DAQ, and dmm, and starts the read back threads.
+        Connections that are already open and configured are reused, so this is also how a dropped instrument is reconnected mid run.
+        """
+        #connections stay open between runs, the session only reconnects or resends configuration when something has changed
+        self.rm = self.session.getResourceManager()
+
+        # Keysight connection and data collection set up
+        ## set the type of measurement to frequency, with external triggers on the rising edge
+        self.freq_counter = self.session.getFrequencyCounter(self.keysight_addr, ['CONF:FREQ', self.trig_source_cmd, 'TRIG:SLOP POS', self.trig_count_cmd], self.keysight_timeout)
+
+        # DAQ Setup and task initialization
+        if (self.hardware_timing):
+            #every arm plays out the same waveform, so build it once and set the sample clock up for it
+            self.waveform, self.trigger_offsets = self.buildTriggerWaveform()
+            self.task = self.session.getDAQTask(self.daq_path, (self.daq_sample_rate, len(self.waveform)))
+        else:
+            self.task = self.session.getDAQTask(self.daq_path)
+
+        #Keithley dmm connection and data collection set up
+        ## need to set trigger type to external
+        ## set trigger count to the desired number of datapoints per collection cycle
+        ## with hardware timing the dmm also sees the throwaway pulse at the start of each waveform, so it needs one extra trigger
+        ## set sample count to 1 (this is one sample per trigger)
+        dmm_trig_count = self.trig_count+1 if self.hardware_timing else self.trig_count
+        dmm_config = [self.trig_source_cmd, 'TRIG:COUN '+ str(dmm_trig_count), 'SAMP:COUN 1']
+        if (dmm_trig_count == 1):
+            #a buffered run before this one may have left the trace buffer on, single points don't use it
+            dmm_config.append('TRAC:FEED:CONT NEV')
+        self.adapter, self.dmm = self.session.getDMM(self.dmm_addr, self.gpib_channel_no, dmm_config, self.dmm_timeout)
+        #one thread per instrument for reading them back, kept for the whole run so there is no thread start up cost per point
+        if (self.fetch_pool is None):
+            self.fetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='kse-fetch')
+        self.needs_reconnect = False
+
+    def initializationPass(self):
+        """
+        Arms the frequency counter and the dmm for the next point, or the next batch of points in buffered mode.
+        """
+        self.freq_counter.write('INIT')
+        #do one trigger cycle to get rid of the empty data point that apparently gets collected for reasons?
+        #I hate that this is a thing, but it appears to be a thing, so we're going to roll with it
+        self.task.write(2.0)
+        time.sleep(self.init_pulse_time)
+        self.task.write(0.0)
+        time.sleep(self.init_pulse_time)
+        self.freq_counter.query('R?')#remove the empty data point from the data register, so our time stamps will match up with the frequencies collected
+        if (self.trig_count > 1):
+            # set up the data trace so the dmm keeps every reading in the batch, same as the batched app
+            self.dmm.write('TRAC:POIN ' + str(self.trig_count))
+            self.dmm.write('TRAC:FEED SENS1;FEED:CONT NEXT')
+        #initialize the DMM
+        self.dmm.write('INIT')
+
+    def collectPoint(self):
+        """
+        Collects a single point: arms the instruments, sends the trigger pulse, and reads back both instruments.
+
+        Returns
+        -------
+        y : float
+            The frequency counter reading.
+        y2 : float
+            The dmm reading.
+        x : float
+            The time interval since the first point, in seconds.
+        """
+        self.latency.timed('initialization', self.initializationPass)
+
+        t0 = time.perf_counter()
+        self.task.write(self.high_V) #high voltage value to send (probably stay below 5V in general)
+        t1=time.time()
+        time.sleep(self.high_time) #how long do we want to stay at the hight voltage
+        self.task.write(self.low_V) #usually this will be 0V
+        time.sleep(self.low_time) #how long do we want to stay at the low voltage
+        self.latency.add('trigger pulses', time.perf_counter() - t0)
+        #set the start time
+        if (self.start_time is None):
+            self.start_time = t1
+        #time interval is last value of times minus start time value
+        x = t1-self.start_time
+
+        #get the frequency and dmm data
+        freq_str, dmm_str = self.fetchReadings('FETC?', 'FETC?')
+        y = float(freq_str)
+        y2 = float(dmm_str)
+        return y, y2, x
+
+    def collectBatch(self):
+        """
+        Collects trig_count points from one arm: a single initialization pass, trig_count trigger pulses,
+        then both buffers are read back at once.
+
+        Returns
+        -------
+        points : [(float, float, float)]
+            The points in the batch, as (frequency, voltage, time interval).
+        """
+        self.latency.timed('initialization', self.initializationPass)
+
+        t0 = time.perf_counter()
+        times = []
+        for i in range(0, self.trig_count):
+            self.task.write(self.high_V)
+            times.append(time.time())
+            time.sleep(self.high_time)
+            self.task.write(self.low_V)
+            time.sleep(self.low_time)
+        self.latency.add('trigger pulses', time.perf_counter() - t0)
+        if (self.start_time is None):
+            self.start_time = times[0]
+
+        #get all the frequencies and all the dmm readings from this batch
+        freq_str, dmm_str = self.fetchReadings('FETC?', 'TRAC:DATA?')
+        freqs = util.stringArraytoFloatArray(freq_str.strip().split(','))
+        volts = util.stringArraytoFloatArray(dmm_str.strip().split(','))
+        if ((len(freqs) != self.trig_count) or (len(volts) != self.trig_count)):
+            raise ValueError('Expected ' + str(self.trig_count) + ' readings per instrument, got ' + str(len(freqs)) + ' frequencies and ' + str(len(volts)) + ' voltages')
+        return [(freqs[i], volts[i], times[i]-self.start_time) for i in range(0, self.trig_count)]
+
+    def buildTriggerWaveform(self):
+        """
+        Builds the DAQ output for one hardware timed arm: the throwaway pulse from the initialization pass, then trig_count trigger pulses.
+        Every stretch is at least one sample long.
+
+        Returns
+        -------
+        waveform : np.ndarray
+            The output voltage for every sample clock tick, ending at low_V.
+        offsets : np.ndarray
+            The time of each trigger pulse's rising edge from the start of the waveform, in seconds.
+        """
+        rate = self.daq_sample_rate
+        init_high = max(1, int(round(self.init_pulse_time*rate)))
+        init_low = max(1, int(round(self.init_pulse_time*rate)))
+        high = max(1, int(round(self.high_time*rate)))
+        low = max(1, int(round(self.low_time*rate)))
+        pulse = np.concatenate((np.full(high, self.high_V), np.full(low, self.low_V)))
+        waveform = np.concatenate((np.full(init_high, self.high_V), np.full(init_low, self.low_V), np.tile(pulse, self.trig_count)))
+        offsets = (init_high + init_low + (high + low)*np.arange(self.trig_count))/rate
+        return waveform, offsets
+
+    def collectTimedBatch(self):
+        """
+        Collects trig_count points from one hardware timed arm. The DAQ plays out the throwaway pulse and all the trigger pulses
+        on its own clock while this thread just waits, then both instruments are read back and their throwaway readings dropped.
+
+        Returns
+        -------
+        points : [(float, float, float)]
+            The points in the batch, as (frequency, voltage, time interval).
+        """
+        #arm both instruments before anything is sent
+        t0 = time.perf_counter()
+        self.freq_counter.write('INIT')
+        self.dmm.write('TRAC:POIN ' + str(self.trig_count+1))
+        self.dmm.write('TRAC:FEED SENS1;FEED:CONT NEXT')
+        self.dmm.write('INIT')
+
+        self.task.write(self.waveform, auto_start=False)
+        self.latency.add('initialization', time.perf_counter() - t0)
+        #the waveform starts as soon as the task does, the times of the pulses within it come from the DAQ clock
+        t0 = time.time()
+        self.task.start()
+        self.task.wait_until_done(timeout=len(self.waveform)/self.daq_sample_rate + 10.0)
+        self.task.stop()
+        self.latency.add('trigger pulses', time.time() - t0)
+        times = t0 + self.trigger_offsets
+        if (self.start_time is None):
+            self.start_time = times[0]
+
+        #R? returns everything in the keysight's memory including the empty throwaway reading, the dmm trace has the throwaway reading first too
+        freq_str, dmm_str = self.fetchReadings('R?', 'TRAC:DATA?')
+        freqs = util.stringArraytoFloatArray(util.parseDefiniteLengthBlock(freq_str)[1:])
+        volts = util.stringArraytoFloatArray(dmm_str.strip().split(',')[1:])
+        if ((len(freqs) != self.trig_count) or (len(volts) != self.trig_count)):
+            raise ValueError('Expected ' + str(self.trig_count) + ' readings per instrument, got ' + str(len(freqs)) + ' frequencies and ' + str(len(volts)) + ' voltages')
+        return [(freqs[i], volts[i], times[i]-self.start_time) for i in range(0, self.trig_count)]
+
+    def fetchReadings(self, freq_cmd, dmm_cmd):
+        """
+        Queries the frequency counter and the dmm at the same time, so reading back costs the slower of the two instead of both added up.
+        If either read fails or times out, that instrument is disconnected and reconnected before the next point (see resetInstruments).
+
+        Parameters
+        ----------
+        freq_cmd : str
+            The query to send to the frequency counter.
+        dmm_cmd : str
+            The query to send to the dmm.
+
+        Returns
+        -------
+        freq_str : str
+            The frequency counter response.
+        dmm_str : str
+            The dmm response.
+        """
+        t0 = time.monotonic()
+        #each instrument is timed on its own thread, 'read back' is how long the loop waited for both
+        futures = {
+            'frequency counter': self.fetch_pool.submit(self.latency.timed, 'keysight fetch', self.freq_counter.query, freq_cmd),
+            'dmm': self.fetch_pool.submit(self.latency.timed, 'dmm fetch', self.dmm.ask, dmm_cmd),
+        }
+        #the instruments' own timeouts end a slow read, this only catches a driver that never returns
+        waitForFetches(futures.values(), timeout=max(self.keysight_timeout, self.dmm_timeout) + FETCH_GRACE)
+        errors = {}
+        for (name, future) in futures.items():
+            if (not future.done()):
+                errors[name] = TimeoutError('The ' + name + ' read back never returned')
+            elif (future.exception() is not None):
+                errors[name] = future.exception()
+        if (len(errors) > 0):
+            self.resetInstruments(list(errors))
+            (name, error) = list(errors.items())[0]
+            raise RuntimeError('Reading back the ' + name + ' failed: ' + str(error))
+        self.latency.add('read back', time.monotonic() - t0)
+        return futures['frequency counter'].result(), futures['dmm'].result()
+
+    def resetInstruments(self, names):
+        """
+        Drops the connections to instruments whose read back failed, and the read back threads, so nothing reuses them.
+        A read that timed out may still be in flight on its thread, and VISA sessions can't be shared between threads,
+        so the instrument is only used again after a fresh connection, made by collectPoints before the next point.
+
+        Parameters
+        ----------
+        names : [str]
+            'frequency counter', 'dmm', or both.
+        """
+        #don't wait on a read that is stuck, its thread is left to finish (or fail) against the closed connection
+        if (self.fetch_pool is not None):
+            self.fetch_pool.shutdown(wait=False)
+            self.fetch_pool = None
+        if ('frequency counter' in names):
+            self.session.closeFrequencyCounter()
+            self.freq_counter = None
+        if ('dmm' in names):
+            self.session.closeDMM()
+            self.adapter = None
+            self.dmm = None
+        self.needs_reconnect = True
+        self.status('Reconnecting to the ' + ' and '.join(names) + ' before the next point')
+
+    def collectPoints(self):
+        """
+        Collects the next point, or the next batch of points in buffered or hardware timed mode.
+
+        Returns
+        -------
+        points : [(float, float, float)]
+            The points collected, as (frequency, voltage, time interval).
+        """
+        if (self.needs_reconnect):
+            self.connectInstruments()
+        if (self.hardware_timing):
+            return self.collectTimedBatch()
+        if (self.trig_count > 1):
+            return self.collectBatch()
+        return [self.collectPoint()]
+
+    def run(self, max_points=None):
+        """
+        Collects data until stop() is called (or max_points valid points have been collected), then finishes the data files.
+        The instrument connections are kept open for the next run, unless the run stopped because of errors.
+        connect() must have been called first. In buffered mode the current batch is always finished before stopping.
+
+        Parameters
+        ----------
+        max_points : int, optional
+            Stop after this many valid points. Runs until stop() is called by default.
+        """
+        self.running = True
+        self.status("Collecting data")
+        while(self.running):
+            try:
+                t0 = time.perf_counter()
+                points = self.collectPoints()
+                t1 = time.perf_counter()
+                for (y, y2, x) in points:
+                    #check that it's not an error value
+                    #only add a new data point if both the keysight and the dmm return valid values
+                    if((abs(y) < kse.overflow_threshold) and (abs(y2) < kse.overflow_threshold)):
+                        #hand the point to the writer thread, this never waits on the disk
+                        #the raw and processed files are both written from there
+                        self.writer.put((y, y2, x))
+                        self.points_collected = self.points_collected + 1
+                        self.addToStats(y, y2)
+                        #send the data to the plot, but only if both keysight and dmm provide acceptable data
+                        if (self.on_point is not None):
+                            self.on_point(y, x)
+                self.writerStatus()
+                self.statsStatus()
+                t2 = time.perf_counter()
+                self.latency.add('handoff', t2 - t1)
+                self.latency.add('cycle', t2 - t0)
+                self.latencyStatus()
+                #reset the error counter if you get through the whole try block successfully
+                self.error_counter = 0
+
+            except Exception as error:
+                #if you can't read the data try again??? idk why it's erroring sometimes
+                self.error_counter = self.error_counter+1
+                self.status("Error collecting data point: "+ str(error))
+
+                #if I reach a certain threshold of errors in a row when trying to read data, stop and close the connections.
+                # I need to figure out how to distinguish which types of errors are happening because only some require a shutdown
+                if(self.error_counter == self.error_threshold):
+                    self.running = False
+
+            if ((max_points is not None) and (self.points_collected >= max_points)):
+                self.running = False
+
+        #outside the while loop, if we get here then the run is over
+        self.finishRun()
+        #after repeated errors don't trust the connections, the next run starts from scratch
+        if (self.error_counter >= self.error_threshold):
+            self.close()
+
+    def stop(self):
+        """
+        Asks the collection loop to finish the current point (or batch) and stop.
+        """
+        self.running = False
+
+    def writeSamples(self, samples):
+        """
+        Runs on the writer thread. Records go straight into the open raw data file and get converted
+        for the processed file at the same time, flush once per batch.
+
+        Parameters
+        ----------
+        samples : [(float, float, float)]
+            The points to write, as (frequency, voltage, time interval).
+        """
+        t0 = time.perf_counter()
+        for (f, v, t) in samples:
+            self.outfile.append(f, v, t)
+            self.live_processor.addPoint(f, v, t)
+        self.outfile.flush()
+        self.latency.add('disk write', time.perf_counter() - t0)
+
+    def syncRawFile(self):
+        """
+        Runs on the writer thread when no points have arrived for a while. Syncs the raw data file if a sync is due,
+        since RawDataWriter only checks that when points are appended.
+        """
+        self.outfile.syncIfDue()
+
+    def addToStats(self, freq, volts):
+        """
+        Adds a valid point to the running statistics. The first point is the dmm baseline, same as the processed file.
+        """
+        if (self.initial_V is None):
+            self.initial_V = volts
+            self.coefficients = kse.getConversionCoefficients(self.alkali_metal, self.energy_level, freq, self.apply_corrections)
+        self.freq_stats.add(freq)
+        self.adjusted_stats.add(freq - kse.convertVoltageChange(volts - self.initial_V, self.coefficients))
+
+    def statsStatus(self):
+        """
+        Passes the running statistics on to on_stats.
+        """
+        if (self.on_stats is not None):
+            self.on_stats(self.freq_stats.getSummaryString() + '\n' + self.adjusted_stats.getSummaryString())
+
+    def latencyStatus(self):
+        """
+        Passes the latency percentiles of each phase on to on_latency.
+        """
+        if (self.on_latency is not None):
+            self.on_latency(self.latency.getSummaryString())
+
+    def writeMetrics(self, outfile):
+        """
+        Writes the latency of each phase of the run, and how the disk writes went, to the run's _metrics.json file.
+
+        Parameters
+        ----------
+        outfile : raw_data_store.RawDataWriter
+            The run's (closed) raw data file, for the fsync counts.
+        """
+        write_queue = self.writer.getStatus()
+        if (write_queue['last_error'] is not None):
+            write_queue['last_error'] = str(write_queue['last_error'])
+        extra = {
+            'raw_file': self.filename,
+            'processed_file': self.processed_filename,
+            'points_collected': self.points_collected,
+            'points_per_arm': self.points_per_arm,
+            'hardware_timing': self.hardware_timing,
+            'apply_corrections': self.apply_corrections,
+            'high_time': self.high_time,
+            'low_time': self.low_time,
+            'init_pulse_time': self.init_pulse_time,
+            'write_queue': write_queue,
+            'sync_count': outfile.sync_count,
+            'sync_time_s': outfile.sync_time,
+        }
+        self.latency.writeMetricsFile(os.path.join(self.folder, self.metrics_filename), extra)
+
+    def writerStatus(self):
+        """
+        Passes the state of the disk write queue on to on_writer_status.
+        """
+        if (self.on_writer_status is not None):
+            self.on_writer_status(self.writer.getStatusString())
+
+    def finishRun(self):
+        """
+        Finishes writing the data files of the current run. The instrument connections are left open for the next run.
+        """
+        #don't wait on a read that is stuck, the session checks the connections before the next run anyway
+        if (self.fetch_pool is not None):
+            self.fetch_pool.shutdown(wait=False)
+            self.fetch_pool = None
+        #finish writing whatever is still queued, then close the data files
+        if (self.writer is not None):
+            self.writer.stop()
+            self.writerStatus()
+            outfile = self.outfile
+            self.closeDataFiles()
+            self.status(outfile.getSyncStatusString())
+            try:
+                self.writeMetrics(outfile)
+            except Exception as error:
+                self.status('Could not write the metrics file: ' + str(error))
+            self.writer = None
+        self.closeDataFiles()
+
+    def close(self):
+        """
+        Finishes the current run and closes the DAQ task and every instrument connection. Safe to call more than once.
+        """
+        self.finishRun()
+        self.session.close()
+        self.rm = None
+        self.freq_counter = None
+        self.task = None
+        self.adapter = None
+        self.dmm = None
+
+    def processCollectedData(self):
+        """
+        Redoes the conversion of the last run from the raw data file. The processed file is written live during collection,
+        so this is only needed to regenerate it. Unchanged runs come straight out of the processed data cache.
+        """
+        filepath_raw = os.path.join(self.folder, self.filename)
+        filepath_converted = os.path.join(self.folder, self.processed_filename)
+        df = cache.processCached(filepath_raw, self.alkali_metal, self.energy_level, store.processRawDataFile, None, self.apply_corrections)
+        kse.createCSVProcessedData(filepath_converted, df)
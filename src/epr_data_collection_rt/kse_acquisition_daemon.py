@@ -0,0 +1,340 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import time
+
+from threading import Thread, Lock
+
+try:
+    from . import instrument_backends as backends
+    from . import kse_acquisition as acq
+    from . import utilities as util
+except ImportError:
+    import instrument_backends as backends
+    import kse_acquisition as acq
+    import utilities as util
+
+########## HEADLESS ACQUISITION DAEMON ############################################################################################################
+# Runs the realtime collection loop (kse_acquisition) without the Qt GUI, for long unattended runs. There is no event loop
+# or live plot, and the running statistics are only summarized when someone asks for them, so the only work done per point
+# is the collection itself and writing the same raw (.bin) and _processed.csv files the GUI writes.
+#
+# Settings come from a json config file, command line arguments, or both (the command line wins). The keys in the config file
+# are the RealtimeAcquisition attribute names in SETTINGS, e.g.
+#       {"folder": "D:/data", "keysight_addr": "USB0::...::INSTR", "dmm_addr": "ASRL3::INSTR", "daq_path": "Dev1/ao0",
+#        "alkali_metal": "rb85", "energy_level": "high", "points_per_arm": 10}
+#
+# The daemon is controlled over a local TCP socket, one command per line, with a one line json reply:
+#       start       connect to the instruments and start a new run (new data files)
+#       stop        finish the current point (or batch) and close the data files, the connections stay open for the next run
+#       status      whether a run is going, the files, the points collected, the write queue, the running statistics, and the loop latencies
+#       shutdown    stop any run, close the instruments, and exit
+#
+# To run it (add --start to begin collecting straight away):
+#       python kse_acquisition_daemon.py --config run_settings.json
+# and to control it from another terminal:
+#       python kse_acquisition_daemon.py --send status
+# Set KSE_INSTRUMENT_BACKEND=simulated (or pass --simulated) to try it without any instruments attached,
+# and --list to see the instrument addresses and DAQ channels to put in the config.
+
+DEFAULT_HOST = '127.0.0.1' #only accept connections from this computer
+DEFAULT_PORT = 50321
+
+# the settings that can be given in the config file or on the command line, and their types
+SETTINGS = {
+    'folder': str,
+    'keysight_addr': str,
+    'dmm_addr': str,
+    'daq_path': str,
+    'alkali_metal': str,
+    'energy_level': str,
+    'points_per_arm': int,
+    'hardware_timing': bool,
+    'gpib_channel_no': int,
+    'high_V': float,
+    'low_V': float,
+    'high_time': float,
+    'low_time': float,
+    'init_pulse_time': float,
+    'daq_sample_rate': float,
+    'keysight_timeout': float,
+    'dmm_timeout': float,
+    'write_queue_size': int,
+    'sync_every': int,
+    'sync_interval': float,
+    'error_threshold': int,
+    'stats_window': int,
+    'apply_corrections': bool,
+}
+
+########################################################################################################################################
+
+
+def loadSettings(fp):
+    """
+    Reads acquisition settings from a json config file.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the config file as a string.
+
+    Returns
+    -------
+    settings : dict
+        The settings, keyed by RealtimeAcquisition attribute name.
+    """
+    with open(fp, 'r') as infile:
+        settings = json.load(infile)
+    unknown = [k for k in settings if k not in SETTINGS]
+    if (len(unknown) > 0):
+        raise ValueError(fp + ' has unknown settings ' + str(unknown))
+    return settings
+
+def applySettings(acquisition, settings):
+    """
+    Copies settings onto a RealtimeAcquisition, converted to the type each one should have.
+    Switches have to be given as true or false, bool() would turn a string like "false" into True.
+
+    Parameters
+    ----------
+    acquisition : kse_acquisition.RealtimeAcquisition
+        The acquisition to configure.
+    settings : dict
+        The settings, keyed by RealtimeAcquisition attribute name.
+    """
+    for (name, value) in settings.items():
+        kind = SETTINGS[name]
+        if ((kind is bool) and (not isinstance(value, bool))):
+            raise ValueError(name + ' must be true or false, not ' + json.dumps(value))
+        setattr(acquisition, name, kind(value))
+
+def sendCommand(command, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=30.0):
+    """
+    Sends one command to a running daemon and returns its reply.
+
+    Parameters
+    ----------
+    command : str
+        start, stop, status, or shutdown.
+    host : str
+        The address the daemon is listening on.
+    port : int
+        The port the daemon is listening on.
+    timeout : float
+        How long to wait for the reply, in seconds. stop waits for the current point (or batch) to finish.
+
+    Returns
+    -------
+    reply : dict
+        The daemon's reply. 'ok' is False if the command failed, with the reason in 'error'.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as conn:
+        conn.sendall((command + '\n').encode('utf-8'))
+        with conn.makefile('r', encoding='utf-8') as infile:
+            return json.loads(infile.readline())
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """
+    Reads commands from one client connection, one per line, and writes back one json line per command.
+    """
+    def handle(self):
+        daemon = self.server.daemon
+        for line in self.rfile:
+            command = line.decode('utf-8', 'replace').strip()
+            if (command == ''):
+                continue
+            reply = daemon.handleCommand(command)
+            self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+            if (command == 'shutdown'):
+                #serve_forever has to be shut down from a different thread than the one it runs on
+                Thread(target=self.server.shutdown).start()
+                return
+
+
+class CommandServer(socketserver.ThreadingTCPServer):
+    """
+    The control socket, each client connection is handled on its own thread.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, daemon):
+        self.daemon = daemon
+        socketserver.ThreadingTCPServer.__init__(self, address, CommandHandler)
+
+
+class AcquisitionDaemon:
+    """
+    Runs a RealtimeAcquisition on a background thread and answers start/stop/status/shutdown commands over a local socket.
+
+    Parameters
+    ----------
+    acquisition : kse_acquisition.RealtimeAcquisition
+        The configured acquisition.
+    host : str
+        The address to listen on.
+    port : int
+        The port to listen on. 0 picks a free one, see self.port.
+    """
+    def __init__(self, acquisition, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.acquisition = acquisition
+        self.acquisition.on_status = self.status
+        #nothing listens between status requests, so don't build plot points or statistics strings for every point
+        self.acquisition.on_point = None
+        self.acquisition.on_writer_status = None
+        self.acquisition.on_stats = None
+        self.acquisition.on_latency = None
+        self.last_status = ''
+        self.thread = None
+        self.lock = Lock() #held while starting, asking to stop, or closing, so two starts can't race each other. status doesn't need it
+        self.server = CommandServer((host, port), self)
+        self.port = self.server.server_address[1]
+
+    def status(self, msg):
+        self.last_status = msg
+        print(time.strftime('%Y-%m-%d %H:%M:%S') + ' ' + msg, flush=True)
+
+    def isRunning(self):
+        return (self.thread is not None) and self.thread.is_alive()
+
+    def handleCommand(self, command):
+        """
+        Carries out one control command.
+
+        Parameters
+        ----------
+        command : str
+            start, stop, status, or shutdown.
+
+        Returns
+        -------
+        reply : dict
+            'ok' and the status, or 'ok' False and an 'error' message.
+        """
+        try:
+            if (command == 'start'):
+                self.start()
+            elif (command == 'stop'):
+                self.stop()
+            elif (command == 'shutdown'):
+                self.stop()
+                with self.lock:
+                    self.acquisition.close()
+            elif (command != 'status'):
+                raise ValueError('Unknown command ' + command + ', expected start, stop, status, or shutdown')
+        except Exception as error:
+            return {'ok': False, 'error': str(error)}
+        return dict({'ok': True}, **self.getStatus())
+
+    def start(self):
+        """
+        Connects to the instruments and starts a new run on the collection thread.
+        """
+        with self.lock:
+            if (self.isRunning()):
+                raise RuntimeError('Data collection is already running')
+            missing = self.acquisition.getMissingSetting()
+            if (missing is not None):
+                raise ValueError(missing + ' has not been set')
+            self.acquisition.connect()
+            self.thread = Thread(target=self.acquisition.run, name='kse-acquisition')
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stops the current run and waits for the data files to be finished.
+        The lock is only held while asking the run to stop, a hardware timed batch can take a while to finish
+        and status requests are still answered in the meantime.
+        """
+        with self.lock:
+            thread = self.thread
+            if ((thread is None) or (not thread.is_alive())):
+                return
+            self.acquisition.stop()
+        thread.join()
+
+    def getStatus(self):
+        """
+        Returns the state of the daemon and the current (or last) run.
+        """
+        a = self.acquisition
+        writer = a.writer
+        return {
+            'running': self.isRunning(),
+            'folder': a.folder,
+            'raw_file': a.filename,
+            'processed_file': a.processed_filename,
+            'points_collected': a.points_collected,
+            'write_queue': writer.getStatusString() if writer is not None else '',
+            'statistics': [a.freq_stats.getSummaryString(), a.adjusted_stats.getSummaryString()],
+            'latency_ms': a.latency.getSummary(),
+            'last_status': self.last_status,
+        }
+
+    def serve(self):
+        """
+        Answers commands until shutdown is sent (or ctrl+c), then closes everything.
+        """
+        self.status('Listening for commands on ' + str(self.server.server_address[0]) + ':' + str(self.port))
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            self.stop()
+            self.acquisition.close()
+            self.status('Daemon stopped')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run realtime data collection without the GUI, controlled over a local socket.')
+    parser.add_argument('--config', default=None, help='json file of acquisition settings')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='address to listen on (or send to)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on (or send to)')
+    parser.add_argument('--start', action='store_true', help='start collecting as soon as the daemon is up')
+    parser.add_argument('--send', default=None, help='send start, stop, status, or shutdown to a running daemon and print the reply')
+    parser.add_argument('--list', action='store_true', help='print the connected instruments and DAQ channels and exit')
+    parser.add_argument('--simulated', action='store_true', help='use simulated instruments')
+    for (name, kind) in SETTINGS.items():
+        flag = '--' + name.replace('_', '-')
+        if (kind is bool):
+            parser.add_argument(flag, action='store_true', default=None, dest=name)
+        else:
+            parser.add_argument(flag, type=kind, default=None, dest=name)
+    args = parser.parse_args()
+
+    if (args.send is not None):
+        print(json.dumps(sendCommand(args.send, args.host, args.port), indent=2))
+        return
+    if (args.simulated):
+        backends.useSimulatedInstruments()
+    if (args.list):
+        for addr in util.get_connected_instruments(backends.getResourceManager()):
+            print('instrument: ' + addr)
+        for channel in util.get_daq_ao_channels(backends.getLocalSystem()):
+            print('DAQ channel: ' + channel)
+        return
+
+    settings = loadSettings(args.config) if args.config is not None else {}
+    for name in SETTINGS:
+        if (getattr(args, name) is not None):
+            settings[name] = getattr(args, name)
+    acquisition = acq.RealtimeAcquisition()
+    applySettings(acquisition, settings)
+    if (acquisition.folder != ''):
+        os.makedirs(acquisition.folder, exist_ok=True)
+    daemon = AcquisitionDaemon(acquisition, args.host, args.port)
+    if (args.start):
+        reply = daemon.handleCommand('start')
+        if (not reply['ok']):
+            daemon.status('Could not start data collection: ' + reply['error'])
+    daemon.serve()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,53 +1,51 @@
-import nidaqmx
 import time
-import pyvisa as visa
-import pandas as pd
-import nidaqmx.system as sys
+startup_t0 = time.perf_counter() #start of the startup timing report, before any of the slow imports
 
-import kse_experiment_utils as kse
+import instrument_backends as backends
+import kse_acquisition as acq
+import plot_decimation as decimation
 import utilities as util
 
 from os import path
-from pymeasure.instruments.keithley import Keithley2000
-from pymeasure.adapters import PrologixAdapter
 from threading import Thread
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QVBoxLayout, QHBoxLayout, QGridLayout, QWidget, QPushButton, QComboBox, QFileDialog, QMessageBox
-from pglive.sources.data_connector import DataConnector
-from pglive.sources.live_plot import LiveLinePlot
-from pglive.sources.live_plot_widget import LivePlotWidget
+# pglive (and pyqtgraph with it) is imported in create_plot, after the window is up, and pandas is only imported by the
+# functions that use it, so the window shows up without waiting on either one
 
 
 class MainWindow(QMainWindow):
+    #sent from the discovery thread with the instrument addresses, the DAQ channels, and an error message ('' if it worked)
+    instruments_found = pyqtSignal(list, list, str)
+    #the collection loop and the writer run on their own threads, so their messages get to the labels through signals
+    status_changed = pyqtSignal(str)
+    writer_status_changed = pyqtSignal(str)
+    stats_changed = pyqtSignal(str)
+    latency_changed = pyqtSignal(str)
+
     def __init__(self, *args, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
+        #how long each stage of starting up took, shown in the feedback label once the plot is ready and the instruments have been found
+        self.startup_times = [('imports', time.perf_counter() - startup_t0)]
 
 
         ### INTERNAL VARIABLES NEEDED TO RUN THE APP ###################################################
         # resource manager, system settings, options for dropdowns
-        self.rm = visa.ResourceManager()
-        self.system = sys.System.local()
-        self.my_instruments = util.get_connected_instruments(self.rm) #list of available instruments 
-        self.ao_daq_channels = util.get_daq_ao_channels(self.system) #list of analog out channels available from virtual and physical daqs
+        # set KSE_INSTRUMENT_BACKEND=simulated to run the app without any instruments attached
+        # the instruments and DAQ channels are found on a separate thread (discover_instruments), the dropdowns are filled in when it's done
+        self.rm = None
+        self.system = None
+        self.my_instruments = [] #list of available instruments
+        self.ao_daq_channels = [] #list of analog out channels available from virtual and physical daqs
         self.metal_types = ['rb85', 'rb87','cs133']
         self.energy_levels = ['high', 'low']
-        # Collection parameters
-        ## parameters that will remain hard coded
-        self.trig_count = 1
-        self.trig_count_cmd = 'TRIG:COUN '+ str(self.trig_count)
-        self.trig_source = 'EXT'
-        self.trig_source_cmd = 'TRIG:SOUR '+ self.trig_source
-        # Note about the timeing: the high and low times are set such that in conjunction with the initializaion cycle
-        # which now has to happen each time we get a point, the total time between points will be ~.8s. these an all be adjusted if needed
-        self.high_V = 2.0
-        self.low_V = 0.0
-        self.high_time = 0.1 
-        self.low_time = 0.7 
-        ## parameters that could become user entered later
-        self.csv_write_batch_num = 10
-        self.error_threshold = 3
-        self.gpib_channel_no = 1 #the channel number for the GPIB connection from the dmm. this can be set on the dmm to anything between 1 and 16
+        self.points_per_arm_options = ['1', '5', '10', '25', '50']
+        self.trigger_timing_options = ['Software', 'DAQ Clock']
+        self.plot_view_options = ['Last Minute', 'Last 10 Minutes', 'Last Hour', 'Whole Run']
+        self.plot_view_windows = [60, 600, 3600, None] #seconds of data shown for each option, None shows everything
+        # Collection parameters (trigger timing, error threshold, gpib channel, etc.) live on the acquisition object
+        self.acquisition = acq.RealtimeAcquisition()
         #user entered fields required to start collection
         self.folder = ''#'Data\\kseExperiment' #defaults to saving here if nothing is specified. 
         self.keysight_addr = ''#'USB0::0x0957::0x1807::MY58430132::INSTR' #name/address for the keysight connected to the computer
@@ -55,12 +53,15 @@ class MainWindow(QMainWindow):
         self.dmm_addr = ''#'ASRL6::INSTR' #address of USB connected to computer
         self.alkali_metal = ''
         self.energy_level = ''
-        #variables for storing collected data until it is saved to the correct location(s)
-        self.start_time = None
-        self.times = [] #the timestamps will go here
-        self.frequencies = []
-        self.dmm_vals = []
-        self.time_intervals = [] #human readable time intervals go here
+        self.points_per_arm = 1
+        self.hardware_timing = False
+        #every point of the run is kept here, the plot only gets a min/max decimated copy of the part being viewed
+        self.plot_decimator = decimation.MinMaxDecimator()
+        self.plot_window = self.plot_view_windows[0]
+        #the collection thread only adds points to the decimator, the plot is redrawn from it on a timer on the GUI thread,
+        #so the redraw rate doesn't depend on how fast points come in
+        self.plot_refresh_ms = 66 #about 15 redraws a second
+        self.plot_drawn_points = 0 #how many points the decimator held at the last redraw
 
         ### GUI STUFF - EVERYTHING IN THIS SECTION WILL BE VISIBLE TO THE USER AS WIDGETS IN THE APP  ######################################
         self.setWindowTitle("K_se Data Collection")
@@ -80,17 +81,14 @@ class MainWindow(QMainWindow):
         #freq counter select
         self.select_freq_counter_drpdn = QComboBox()
         self.select_freq_counter_drpdn.addItems(['Select Keysight Location'])
-        self.select_freq_counter_drpdn.addItems(self.my_instruments)
         self.select_freq_counter_drpdn.activated.connect(self.select_fc)
         #dmm select
         self.select_dmm_drpdn = QComboBox()
         self.select_dmm_drpdn.addItems(['Select DMM Location'])
-        self.select_dmm_drpdn.addItems(self.my_instruments)
         self.select_dmm_drpdn.activated.connect(self.select_dmm)
         #daq channels
         self.select_daq_drpdn = QComboBox()
         self.select_daq_drpdn.addItems(['Select DAQ Channel'])
-        self.select_daq_drpdn.addItems(self.ao_daq_channels)
         self.select_daq_drpdn.activated.connect(self.select_daq)
         #labels for the dropdowns
         self.fc_lbl = QLabel('Frequency Counter: ', self)
@@ -99,6 +97,24 @@ class MainWindow(QMainWindow):
         self.dmm_lbl.setFont(QFont('Arial', 11))
         self.daq_lbl = QLabel('DAQ Analog Output Channel: ', self)
         self.daq_lbl.setFont(QFont('Arial', 11))
+        #points per arm, anything above 1 collects in buffered batches
+        self.select_points_per_arm_drpdn = QComboBox()
+        self.select_points_per_arm_drpdn.addItems(self.points_per_arm_options)
+        self.select_points_per_arm_drpdn.activated.connect(self.select_points_per_arm)
+        self.points_per_arm_lbl = QLabel('Points per Arm: ', self)
+        self.points_per_arm_lbl.setFont(QFont('Arial', 11))
+        #trigger timing, DAQ Clock has the DAQ play out the trigger pulses on its own sample clock
+        self.select_trigger_timing_drpdn = QComboBox()
+        self.select_trigger_timing_drpdn.addItems(self.trigger_timing_options)
+        self.select_trigger_timing_drpdn.activated.connect(self.select_trigger_timing)
+        self.trigger_timing_lbl = QLabel('Trigger Timing: ', self)
+        self.trigger_timing_lbl.setFont(QFont('Arial', 11))
+        #how much of the run the plot shows, always drawn with about the same number of points
+        self.select_plot_view_drpdn = QComboBox()
+        self.select_plot_view_drpdn.addItems(self.plot_view_options)
+        self.select_plot_view_drpdn.activated.connect(self.select_plot_view)
+        self.plot_view_lbl = QLabel('Plot View: ', self)
+        self.plot_view_lbl.setFont(QFont('Arial', 11))
               
         ### DATA PROCESSING SETTINGS
         self.proc_settings_lbl = QLabel('Data Processing Settings', self)
@@ -123,6 +139,15 @@ class MainWindow(QMainWindow):
         #create some labels so I can give feedback to the user as they take actions
         self.user_feedback_lbl_2 = QLabel('Select instrument locations and processing parameters. Then click "Start Data Collection" to begin. \nTo stop collection click "Stop Data Collection"', self)
         self.user_feedback_lbl_2.setFont(QFont('Arial', 12))
+        #shows how far behind the disk writes are, and whether any points had to be dropped
+        self.writer_status_lbl = QLabel('Write queue: not started', self)
+        self.writer_status_lbl.setFont(QFont('Arial', 11))
+        #running mean, standard deviation, and percent error, for the whole run and the most recent points
+        self.stats_lbl = QLabel('Statistics: not started', self)
+        self.stats_lbl.setFont(QFont('Arial', 11))
+        #p50/p95/p99/max time of each phase of the collection loop, the same numbers go in the _metrics.json file at the end of the run
+        self.latency_lbl = QLabel('Latency: not started', self)
+        self.latency_lbl.setFont(QFont('Arial', 10))
         #Data Collection Buttons
         #initialize collection/connect to everything
         self.initialize_data_collection_btn = QPushButton("Initialize Data Collection")
@@ -136,11 +161,20 @@ class MainWindow(QMainWindow):
     
 
         ####DATA PLOTTING
-        self.plot_widget = LivePlotWidget(title="Frequency (Hz) vs. Time (s )")
-        self.plot_curve = LiveLinePlot()
-        self.plot_widget.addItem(self.plot_curve)
-        self.running = True
-        self.data_connector = DataConnector(self.plot_curve, max_points=150)
+        #the plot itself is made by create_plot once the window is showing, this holds its place until then
+        self.plot_widget = QLabel('Loading plot...', self)
+        self.plot_curve = None
+        self.data_connector = None
+
+        #feedback from the collection loop goes to the labels, through signals since it comes from the collection and writer threads
+        self.status_changed.connect(self.user_feedback_lbl_2.setText)
+        self.writer_status_changed.connect(self.writer_status_lbl.setText)
+        self.stats_changed.connect(self.stats_lbl.setText)
+        self.latency_changed.connect(self.latency_lbl.setText)
+        self.acquisition.on_status = self.status_changed.emit
+        self.acquisition.on_writer_status = self.writer_status_changed.emit
+        self.acquisition.on_stats = self.stats_changed.emit
+        self.acquisition.on_latency = self.latency_changed.emit
 
         ### APP LAYOUT ###################################################################################
         gridlayout = QGridLayout()
@@ -172,12 +206,32 @@ class MainWindow(QMainWindow):
         daq_drp.addWidget(self.select_daq_drpdn)
         daq_drp_container = QWidget()
         daq_drp_container.setLayout(daq_drp)
+        #points per arm
+        ppa_drp = QHBoxLayout()
+        ppa_drp.addWidget(self.points_per_arm_lbl)
+        ppa_drp.addWidget(self.select_points_per_arm_drpdn)
+        ppa_drp_container = QWidget()
+        ppa_drp_container.setLayout(ppa_drp)
+        #trigger timing
+        tt_drp = QHBoxLayout()
+        tt_drp.addWidget(self.trigger_timing_lbl)
+        tt_drp.addWidget(self.select_trigger_timing_drpdn)
+        tt_drp_container = QWidget()
+        tt_drp_container.setLayout(tt_drp)
+        #plot view
+        pv_drp = QHBoxLayout()
+        pv_drp.addWidget(self.plot_view_lbl)
+        pv_drp.addWidget(self.select_plot_view_drpdn)
+        pv_drp_container = QWidget()
+        pv_drp_container.setLayout(pv_drp)
         #combining all the dropdowns
         dropdown = QVBoxLayout()
         dropdown.addWidget(self.inst_settings_lbl)
         dropdown.addWidget(fc_drp_container)
         dropdown.addWidget(dmm_drp_container)
         dropdown.addWidget(daq_drp_container)
+        dropdown.addWidget(ppa_drp_container)
+        dropdown.addWidget(tt_drp_container)
         drpdn_container = QWidget()
         drpdn_container.setLayout(dropdown)
 
@@ -197,6 +251,7 @@ class MainWindow(QMainWindow):
         data_proc.addWidget(self.proc_settings_lbl)
         data_proc.addWidget(data_proc_metal_container)
         data_proc.addWidget(data_proc_energy_container)
+        data_proc.addWidget(pv_drp_container)
         data_proc_container = QWidget()
         data_proc_container.setLayout(data_proc)
         
@@ -213,6 +268,9 @@ class MainWindow(QMainWindow):
         gridlayout.addWidget(data_proc_container, 1, 1, 1, 1, Qt.AlignTop) #processing settings
         gridlayout.addWidget(btn_container, 2, 0, 1, 2) #collection buttons
         gridlayout.addWidget(self.user_feedback_lbl_2, 3, 0, 1, 1) #user feedback
+        gridlayout.addWidget(self.writer_status_lbl, 4, 0, 1, 2) #disk write status
+        gridlayout.addWidget(self.stats_lbl, 5, 0, 1, 2) #running statistics
+        gridlayout.addWidget(self.latency_lbl, 6, 0, 1, 2) #loop timing
         grid_container = QWidget()
         grid_container.setLayout(gridlayout)
 
@@ -226,9 +284,69 @@ class MainWindow(QMainWindow):
         #unclear if I actually need this, but I think this shows all the available widgets?
         self.show()
         app.aboutToQuit.connect(self.close_event)
+        self.startup_times.append(('window', time.perf_counter() - startup_t0))
+
+        #look for instruments in the background, and make the plot as soon as the event loop is running
+        for drpdn in [self.select_freq_counter_drpdn, self.select_dmm_drpdn, self.select_daq_drpdn]:
+            drpdn.setEnabled(False)
+        self.instruments_found.connect(self.fill_instrument_dropdowns)
+        Thread(target=self.discover_instruments, daemon=True).start()
+        QTimer.singleShot(0, self.create_plot)
+        self.plot_timer = QTimer(self)
+        self.plot_timer.timeout.connect(self.refresh_plot)
+        self.plot_timer.start(self.plot_refresh_ms)
 
     #### FUNCTIONS! #############################################
 
+    #### Start Up ####################
+    def discover_instruments(self):
+        #runs on its own thread, listing resources can take a while (especially with GPIB/serial adapters attached)
+        try:
+            self.rm = backends.getResourceManager()
+            self.system = backends.getLocalSystem()
+            self.instruments_found.emit(util.get_connected_instruments(self.rm), util.get_daq_ao_channels(self.system), '')
+        except Exception as error:
+            self.instruments_found.emit([], [], str(error))
+
+    def fill_instrument_dropdowns(self, instruments, channels, error):
+        #back on the GUI thread
+        self.my_instruments = instruments
+        self.ao_daq_channels = channels
+        self.select_freq_counter_drpdn.addItems(self.my_instruments)
+        self.select_dmm_drpdn.addItems(self.my_instruments)
+        self.select_daq_drpdn.addItems(self.ao_daq_channels)
+        for drpdn in [self.select_freq_counter_drpdn, self.select_dmm_drpdn, self.select_daq_drpdn]:
+            drpdn.setEnabled(True)
+        if (error != ''):
+            self.user_feedback_lbl_2.setText('Could not list the connected instruments: ' + error)
+        self.startup_times.append(('instruments', time.perf_counter() - startup_t0))
+        self.startup_report()
+
+    def create_plot(self):
+        from pglive.sources.data_connector import DataConnector
+        from pglive.sources.live_plot import LiveLinePlot
+        from pglive.sources.live_plot_widget import LivePlotWidget
+        plot_widget = LivePlotWidget(title="Frequency (Hz) vs. Time (s )")
+        self.plot_curve = LiveLinePlot()
+        plot_widget.addItem(self.plot_curve)
+        #no point limit on the connector, the decimator decides what gets plotted
+        self.data_connector = DataConnector(self.plot_curve)
+        self.centralWidget().layout().replaceWidget(self.plot_widget, plot_widget)
+        self.plot_widget.deleteLater()
+        self.plot_widget = plot_widget
+        #anything collected before the plot existed
+        self.update_plot()
+        self.startup_times.append(('plot', time.perf_counter() - startup_t0))
+        self.startup_report()
+
+    def startup_report(self):
+        #shown once both the plot and the instrument discovery have finished, times are from when the app was launched
+        #added under the instructions (or the discovery error) in the feedback label instead of replacing them
+        if (len(self.startup_times) < 4):
+            return
+        report = 'Startup times (s): ' + ', '.join(name + ' ' + str(round(t, 3)) for (name, t) in self.startup_times)
+        self.user_feedback_lbl_2.setText(self.user_feedback_lbl_2.text() + '\n' + report)
+
     #### User Input and Setup ####################
     def open_file_dialog(self):
         self.folder = QFileDialog.getExistingDirectory(self, 'Select Folder')
@@ -279,194 +397,90 @@ class MainWindow(QMainWindow):
             self.energy_level = self.energy_levels[index]
         else:
             self.energy_level = ''
+
+    def select_points_per_arm(self, s):
+        self.points_per_arm = int(self.points_per_arm_options[s])
+
+    def select_trigger_timing(self, s):
+        self.hardware_timing = (self.trigger_timing_options[s] == 'DAQ Clock')
+
+    def select_plot_view(self, s):
+        self.plot_window = self.plot_view_windows[s]
+        self.update_plot()
     #### End of User Input and Setup ####################
 
     #### Data collection functions
 
     def start_collection(self):
-         # Start data collection in new Thread and send data to data_connector
-        Thread(target=self.get_frequency_data, args=(self.data_connector,)).start()
-
-    
-    def freq_initialization_pass(self):
-        self.freq_counter.write('INIT')
-        #do one trigger cycle to get rid of the empty data point that apparently gets collected for reasons?
-        #I hate that this is a thing, but it appears to be a thing, so we're going to roll with it
-        self.task.write(2.0)
-        time.sleep(0.05)
-        self.task.write(0.0)
-        time.sleep(0.05)
-        self.freq_counter.query('R?')#remove the empty data point from the data register, so our time stamps will match up with the frequencies collected
-        #initialize the DMM
-        self.dmm.write('INIT')
-
-
-    def get_frequency_data(self, connector):
-        self.connect_to_instruments()
-        self.user_feedback_lbl_2.setText("Collecting data")
-        self.error_counter = 0
-        while(self.running):
-            
-            self.freq_initialization_pass()
-
-            self.task.write(self.high_V) #high voltage value to send (probably stay below 5V in general)
-            t1=time.time()
-            self.times.append(t1)
-            time.sleep(self.high_time) #how long do we want to stay at the hight voltage
-            self.task.write(self.low_V) #usually this will be 0V
-            time.sleep(self.low_time) #how long do we want to stay at the low voltage
-            #set the start time  
-            if (len(self.times)==1):
-                self.start_time = self.times[0]
-            #time interval is last value of times minus start time value
-            x = t1-self.start_time
-
-            try:
-                #get the frequency data  
-                y = float(self.freq_counter.query('FETC?'))
-                #get dmm data
-                y2 = float(self.dmm.ask('FETC?'))#self.dmm.ask('TRAC:DATA?')
-
-                #check that it's not an error value
-                #only add a new data point to the set of arrays if both the keysight and the dmm return valid values
-                if((y < 100000000000) and (y2 < 100000000000)):
-                    self.frequencies.append(y)
-                    self.dmm_vals.append(y2)
-                    self.time_intervals.append(x)
-                    #send the data to the connector, but only if both keysight and dmm provide acceptable data
-                    connector.cb_append_data_point(y, x)
-                #increment the count so that I can batch update the csv instead of doing it each round
-                #hopefully this is more efficient?
-                #update when length of array is 10, clear storage arrays after update
-                if (len(self.frequencies)==self.csv_write_batch_num):
-                    self.update_csv(self.frequencies, self.dmm_vals, self.time_intervals)
-                    self.frequencies=[]
-                    self.dmm_vals=[] 
-                    self.time_intervals=[]
-                elif ((len(self.frequencies) != 0) and (self.running == False)):
-                    self.update_csv(self.frequencies, self.dmm_vals, self.time_intervals)
-                    self.frequencies=[]
-                    self.dmm_vals=[] 
-                    self.time_intervals=[]
-                    #only reset the times array at the end!
-                    self.times = []
-                #reset the error counter if you get through the whole try block successfully
-                self.error_counter = 0
-
-            except Exception as error:  
-                #if you can't read the data try again??? idk why it's erroring sometimes
-                self.error_counter = self.error_counter+1
-                self.user_feedback_lbl_2.setText("Error collecting data point: "+ str(error))
-
-                #if I reach a certain threshold of errors in a row when trying to read data, close the connections. 
-                #for now I will set the threshold at 1
-                # I need to figure out how to distinguish which types of errors are happening because only some require a shutdown
-                if(self.error_counter == self.error_threshold):
-                    self.closing_tasks()
-
-        #outside the while loop, if we get here then close all the connections
-        self.closing_tasks()
+         # Start data collection in new Thread, points go to the plot through add_plot_point
+        Thread(target=self.get_frequency_data).start()
+
+
+    def get_frequency_data(self):
+        if (not self.connect_to_instruments()):
+            return
+        #the collection loop itself lives in kse_acquisition so it can also run without the GUI
+        self.acquisition.on_point = self.add_plot_point
+        self.acquisition.run()
+
+    def add_plot_point(self, freq, time_interval):
+        #called from the collection thread, the plot picks the point up on its next refresh
+        #the decimator is indexed by time, so time goes on x and frequency on y
+        self.plot_decimator.append(time_interval, freq)
+
+    def refresh_plot(self):
+        #on the GUI thread, from plot_timer. only redraw when points have come in since the last time
+        if (len(self.plot_decimator) != self.plot_drawn_points):
+            self.update_plot()
+
+    def update_plot(self):
+        #send the plot the decimated points for the selected window, ending at the newest point
+        self.plot_drawn_points = len(self.plot_decimator)
+        x_first, x_last = self.plot_decimator.getRange()
+        if ((x_last is None) or (self.data_connector is None)):
+            return
+        x_min = None if self.plot_window is None else x_last - self.plot_window
+        x, y = self.plot_decimator.getView(x_min)
+        self.data_connector.cb_set_data(y, x)
 
     def connect_to_instruments(self):
         #first we need to check that we have all the necessary inputs from the user 
         #if any of these are missing warn the user, via pop up probably
-        if(self.folder==''):
-            self.missing_info_warning_popup('Data Collection File Location')
-        elif(self.keysight_addr==''):
-            self.missing_info_warning_popup('Keysight Address')
-        elif(self.dmm_addr==''):
-            self.missing_info_warning_popup('DMM Address')
-        elif(self.daq_path==''):
-            self.missing_info_warning_popup('DAQ Channel')
-        elif(self.alkali_metal==''):
-            self.missing_info_warning_popup('Alkali Metal')
-        elif(self.energy_level==''):
-            self.missing_info_warning_popup('Energy Level')
-        else:
-            self.error_counter = 0
-            #reset the data connector?
-            self.data_connector = DataConnector(self.plot_curve, max_points=60)
-            #do all the document prep at the beginning so it doesn't slow down collection later
-            #create a new csv file at the specified location
-            self.filename = util.dtStringForFilename()+'.csv'
-            self.fp = self.folder + '\\' + self.filename
-            self.outfile = open(self.fp, mode='a')
-            #create an empty data frame and save the headers to the file
-            self.df_headers = pd.DataFrame({'Frequencies': [], 'Voltages': [], 'Time Interval':[]})
-            self.df_headers.to_csv(self.fp, mode='a', index=False)
-            
-            # Keysight connection setup
-            self.freq_counter = self.rm.open_resource(self.keysight_addr)
-            self.freq_counter.write('*RST')
-            self.freq_counter.encoding = 'latin_1'
-            self.freq_counter.source_channel = 'CH1'
-
-            # Keysight data collection set up
-            ## reset everything and clear the event queues
-            self.freq_counter.write('STAT:PRES')
-            self.freq_counter.write('*CLS')
-            ## set the type of measurement to frequency
-            self.freq_counter.write('CONF:FREQ')
-            self.freq_counter.write(self.trig_source_cmd)
-            self.freq_counter.write('TRIG:SLOP POS')
-            #self.freq_counter.write(self.trig_count_cmd)
-
-            # DAQ Setup and task initialization
-            self.task = nidaqmx.Task()
-            self.task.ao_channels.add_ao_voltage_chan(self.daq_path)
-            self.task.start()
-            self.task.write(0.0)#make sure we are starting at 0V
-
-            #Keithley dmm connection set up
-            self.adapter = PrologixAdapter(self.dmm_addr, self.gpib_channel_no) #create prologix adapter and connect to GPIB w/ address 1
-            self.dmm = Keithley2000(self.adapter) #create the instrument using the adapter
-
-            # Keithley data collection set up
-            ## reset everything and clear the event queues
-            self.dmm.reset()
-            ## need to set trigger type to external
-            self.dmm.write(self.trig_source_cmd)
-            ## set trigger count to the desired number of datapoints per collection cycle
-            self.dmm.write(self.trig_count_cmd)
-            ## set sample count to 1 (this is one sample per trigger)
-            self.dmm.write('SAMP:COUN 1')
-            self.user_feedback_lbl_2.setText("Connected to frequency counter and dmm")
+        self.acquisition.folder = self.folder
+        self.acquisition.keysight_addr = self.keysight_addr
+        self.acquisition.dmm_addr = self.dmm_addr
+        self.acquisition.daq_path = self.daq_path
+        self.acquisition.alkali_metal = self.alkali_metal
+        self.acquisition.energy_level = self.energy_level
+        self.acquisition.points_per_arm = self.points_per_arm
+        self.acquisition.hardware_timing = self.hardware_timing
+        missing = self.acquisition.getMissingSetting()
+        if (missing is not None):
+            self.missing_info_warning_popup(missing)
+            return False
+        #start the plot over for the new run
+        self.plot_decimator.clear()
+        try:
+            self.acquisition.connect()
+        except Exception as error:
+            self.acquisition.status('Could not connect to the instruments: ' + str(error))
+            return False
+        return True
     
     def stop_collection(self):
-        self.running = False
-        self.user_feedback_lbl_2.setText("Ending data collection")
-        time.sleep(1)#allow the program to finish writing any remaining data to the csv before processing it
-        self.process_collected_data()
-        self.user_feedback_lbl_2.setText("Data processing complete. ")    
-
-    def update_csv(self, f, v, t):
-        df = pd.DataFrame({
-                'Frequency': f,
-                'Voltage': v,
-                'Time Interval': t
-            })
-        df.to_csv(self.fp, mode='a', index=False, header=False)
+        self.acquisition.stop()
+        #the collection loop writes out whatever is left in the write queue on its way out,
+        #and the processed file is already up to date, so there is nothing left to wait for here
+        self.user_feedback_lbl_2.setText("Ending data collection. Processed data saved to "+self.acquisition.processed_filename)
 
     ### End of data collection functions section
            
     ### Clean up functions #############
-    #I've copied and pasted this block enough that it should have been it's own function ages ago       
     def closing_tasks(self):
-        #outside the while loop, if we get here then close all the connections
-        #close the DAQ taks
-        self.task.close()
-        #close the csv file
-        self.outfile.close()
-        #close the connections
-        self.openres = self.rm.list_opened_resources()
-        self.user_feedback_lbl_2.setText('Closing Connection with ', str(self.openres))
-        self.freq_counter.close()
-        self.adapter.close()
-        self.rm.close()
+        self.acquisition.close()
 
     def close_event(self):
-        if (self.running == True):
-            self.running == False
+        self.acquisition.stop()
         time.sleep(0.3)#allow data collection to finish current cycle
         try: 
             self.closing_tasks()
@@ -476,13 +490,9 @@ class MainWindow(QMainWindow):
     ### End of Clean up functions #############
 
     ### Data Processing ########################
+    # the processed file is written live during collection, this is only needed to redo the conversion from the raw file
     def process_collected_data(self):
-        filepath_raw = self.folder + '\\' + self.filename
-        fn_arry = (self.filename).split('.')
-        fn = fn_arry[0]+'.'+fn_arry[1]+'_processed.csv'
-        filepath_converted = self.folder + '\\' + fn
-        processed_data = kse.processAllData_rt(filepath_raw, 'rb85', 'high')
-        kse.createCSVProcessedData(filepath_converted, processed_data)
+        self.acquisition.processCollectedData()
     
 
 
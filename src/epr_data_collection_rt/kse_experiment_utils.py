@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 import csv
 
 ###TO DO
@@ -7,6 +6,8 @@ import csv
 # look at the spreadsheet for this and see if we need to add that calculation into this program
 # figure out of the change is large enough that we need to account for that here
 # linear correction term for freq and quadratic in field
+#   -> both are in now, see quadratic_field_coefficients and reference_frequencies below.
+#      They are only applied when asked for (apply_corrections=True), by default the conversion is the original linear one
 
 ########## IMPORTANT CONTSANTS ############################################################################################################
 
@@ -23,6 +24,53 @@ conv_fact_V = 0.1 #Volts
 conv_fact_G = 0.01 #Gauss
 B_field_gain = 1/100
 
+# registry of conversion coefficients for every (metal, energy) we know about
+# frequency change = gyromagnetic ratio * dB + quadratic coefficient * dB^2, with dB the change in field in Gauss
+gyromagnetic_ratios = { #Hz/Gauss
+    ('rb87', 'high'): rb87_gyromagnetic_ratio_HE,
+    ('rb85', 'high'): rb85_gyromagnetic_ratio_HE,
+    ('cs133', 'high'): cs133_gyromagnetic_ratio_HE,
+    ('rb87', 'low'): rb87_gyromagnetic_ratio_LE,
+    ('rb85', 'low'): rb85_gyromagnetic_ratio_LE,
+    ('cs133', 'low'): cs133_gyromagnetic_ratio_LE,
+}
+# The gyromagnetic ratios above are the slopes of the end resonances (F=I+1/2, m=+-F <-> +-(F-1)) at about 27 G,
+# so the field dependence of the slope comes from the same Breit-Rabi formula:
+## quadratic_field_coefficients is (1/2) d^2f/dB^2 of each resonance at the field where its slope is the ratio above.
+##      to leading order this is -+ 2I/(2I+1)^2 * ((gJ-gI)*muB/h)^2 / hyperfine splitting, negative for the high energy resonance
+## reference_frequencies is the resonance frequency at that field, the one the ratios hold at. A run whose baseline keysight
+##      frequency is somewhere else gets its slope corrected linearly in frequency, ratio + 2*quadratic*(f - reference)/ratio
+# Both corrections are off unless apply_corrections=True is passed to the processing functions, so processed data matches
+# what the linear conversion has always given unless the corrections are asked for.
+# gJ, gI and the hyperfine splittings are from D. A. Steck, "Rubidium 87 D Line Data", "Rubidium 85 D Line Data", and "Cesium D Line Data"
+quadratic_field_coefficients = { #Hz/Gauss^2, anything not in here is 0
+    ('rb87', 'high'): -212.08,
+    ('rb85', 'high'): -341.49,
+    ('cs133', 'high'): -91.78,
+    ('rb87', 'low'): 219.24,
+    ('rb85', 'low'): 377.31,
+    ('cs133', 'low'): 95.24,
+}
+reference_frequencies = { #Hz, anything not in here gets no frequency correction
+    ('rb87', 'high'): 18870254.0,
+    ('rb85', 'high'): 12652676.0,
+    ('cs133', 'high'): 9462035.0,
+    ('rb87', 'low'): 18870870.0,
+    ('rb85', 'low'): 12548379.0,
+    ('cs133', 'low'): 9423391.0,
+}
+
+overflow_threshold = 100000000000 #any reading bigger than this (in magnitude) is an error value, not data
+instrument_overflow_val = 9.9e37 #what the keysight and the dmm report when a reading is out of range
+
+# Processing speed: processAllData and processAllData_rt are limited by parsing the csv text into floats, which no amount of
+# array arithmetic afterwards can get around. On one core with 1e6 rows the original row by row code took ~2.8 s,
+# the column based csv path takes ~0.5 s (about 5x, a bit better with pyarrow installed, which parses on several threads),
+# and the binary raw data files (raw_data_store.processRawDataFile) take ~0.05 s. Only the binary path gets to 10x or more.
+# benchmarks/benchmark_processing.py times both paths on the same synthetic data:
+#       python -m benchmarks.benchmark_processing --sizes 1e6 --only processAllData_rt processRawDataFile
+csv_engine = None #set the first time a csv is parsed, see getCSVEngine
+
 ########################################################################################################################################
 
 
@@ -84,24 +132,110 @@ def getVoltstoHzConversion(metal, energy):
     overall_conversion_factor : float
         The overall conversion factor for the specific metal, enegry, and magnetic field being used.   
     """
+    overall_conversion_factor = getConversionCoefficients(metal, energy)[0]
+    return overall_conversion_factor  
+
+def buildConversionTable():
+    """
+    Precomputes the voltage to frequency coefficients for every (metal, energy) in the registry, 
+    so converting data is a table lookup and a polynomial instead of recomputing the factors every call.  
+
+    Returns
+    -------
+    table : dict
+        (linear, quadratic) coefficients keyed by (metal, energy), such that frequency change = linear*dV + quadratic*dV^2, with dV in Volts.
+    frequency_table : dict
+        (slope, reference frequency) keyed by (metal, energy), the linear coefficient at a baseline frequency f is linear + slope*(f - reference).
+    """
     m_conv_f = getMagetometerConversionFactor(conv_fact_V, conv_fact_G, B_field_gain)
-    overall_conversion_factor = 0
-    if (energy == "low"):
-        if (metal=="rb87"):
-            overall_conversion_factor = m_conv_f*rb87_gyromagnetic_ratio_LE
-        elif (metal=="rb85"):
-            overall_conversion_factor = m_conv_f*rb85_gyromagnetic_ratio_LE
-        elif (metal=="cs133"):
-            overall_conversion_factor = m_conv_f*cs133_gyromagnetic_ratio_LE
-    elif(energy == "high"):
-        if (metal=="rb87"):
-            overall_conversion_factor = m_conv_f*rb87_gyromagnetic_ratio_HE
-        elif (metal=="rb85"):
-            overall_conversion_factor = m_conv_f*rb85_gyromagnetic_ratio_HE
-        elif (metal=="cs133"):
-            overall_conversion_factor = m_conv_f*cs133_gyromagnetic_ratio_HE
+    table = {}
+    frequency_table = {}
+    for key in gyromagnetic_ratios:
+        ratio = gyromagnetic_ratios[key]
+        quadratic = quadratic_field_coefficients.get(key, 0.0)
+        table[key] = (m_conv_f*ratio, m_conv_f*m_conv_f*quadratic)
+        if (key in reference_frequencies):
+            frequency_table[key] = (2*m_conv_f*quadratic/ratio, reference_frequencies[key])
+    return table, frequency_table
 
-    return overall_conversion_factor  
+conversion_table, frequency_correction_table = buildConversionTable()
+
+def registerConversion(metal, energy, gyromagnetic_ratio, quadratic_coefficient=0.0, reference_frequency=None):
+    """
+    Adds or replaces the conversion for a metal and energy level, and updates the precomputed table.  
+
+    Parameters
+    ----------
+    metal : str
+        The akali metal used in the cell.
+    energy : str
+        the type of energy transition.
+    gyromagnetic_ratio : float
+        The linear coefficient in Hz/Gauss.
+    quadratic_coefficient : float
+        The coefficient of the quadratic in field correction in Hz/Gauss^2.
+    reference_frequency : float, optional
+        The frequency in Hz that gyromagnetic_ratio holds at. No frequency correction if not given.
+    """
+    key = (metal, energy)
+    gyromagnetic_ratios[key] = gyromagnetic_ratio
+    quadratic_field_coefficients[key] = quadratic_coefficient
+    m_conv_f = getMagetometerConversionFactor(conv_fact_V, conv_fact_G, B_field_gain)
+    conversion_table[key] = (m_conv_f*gyromagnetic_ratio, m_conv_f*m_conv_f*quadratic_coefficient)
+    if (reference_frequency is None):
+        reference_frequencies.pop(key, None)
+        frequency_correction_table.pop(key, None)
+    else:
+        reference_frequencies[key] = reference_frequency
+        frequency_correction_table[key] = (2*m_conv_f*quadratic_coefficient/gyromagnetic_ratio, reference_frequency)
+
+def getConversionCoefficients(metal, energy, initial_freq=None, apply_corrections=False):
+    """
+    Looks up the precomputed voltage to frequency coefficients for a metal and energy level. 
+
+    Parameters
+    ----------
+    metal : str
+        The akali metal used in the cell. Allowed choices are: "rb87", "rb85", or "cs133"
+    energy : str
+        the type of energy transition. Allowed choices are: "high" or "low"
+    initial_freq : float, optional
+        The baseline keysight frequency in Hz. With apply_corrections, the linear coefficient is corrected for the difference from the reference frequency if given.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections. Otherwise the quadratic coefficient is 0 and the linear one is the gyromagnetic ratio alone.
+    
+    Returns
+    -------
+    coefficients : (float, float)
+        The (linear, quadratic) coefficients in Hz/V and Hz/V^2. Both are 0 for a metal or energy that isn't in the registry.
+    """
+    (linear, quadratic) = conversion_table.get((metal, energy), (0.0, 0.0))
+    if (not apply_corrections):
+        return (linear, 0.0)
+    if ((initial_freq is not None) and ((metal, energy) in frequency_correction_table)):
+        (slope, reference) = frequency_correction_table[(metal, energy)]
+        linear = linear + slope*(initial_freq - reference)
+    return (linear, quadratic)
+
+def convertVoltageChange(delta_V, coefficients):
+    """
+    Converts changes in dmm voltage into frequency changes, works on single values and on whole arrays. 
+    The quadratic term is always evaluated, so the cost is the same whether or not there is a field correction.
+
+    Parameters
+    ----------
+    delta_V : float or np.ndarray
+        The change in voltage from the baseline.
+    coefficients : (float, float)
+        The (linear, quadratic) coefficients from getConversionCoefficients.
+    
+    Returns
+    -------
+    dmm_freqs : float or np.ndarray
+        The frequency changes in Hz.
+    """
+    (c1, c2) = coefficients
+    return delta_V*(c1 + c2*delta_V)
 
 def getDMMChangeInVoltage(voltages):
     """
@@ -124,7 +258,7 @@ def getDMMChangeInVoltage(voltages):
         delta_Vs[i] = float(voltages[i])-initial_V
     return delta_Vs
 
-def convertDMMData(volts, metal, energy):
+def convertDMMData(volts, metal, energy, initial_freq=None, apply_corrections=False):
     """
     Converts the array of voltages collected from the DMM into an array of frequencies changes.   
 
@@ -132,19 +266,21 @@ def convertDMMData(volts, metal, energy):
     ----------
     voltages : [str]
         A string array of voltage readings from the DMM. 
+    initial_freq : float, optional
+        The baseline keysight frequency in Hz, for the frequency correction of the conversion.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections, see getConversionCoefficients.
     
     Returns
     -------
     dmm_freqs : [float]
         A float array of frequency changes, taking the first reading to be 0.    
     """
-    dmm_freqs = []
-    convf = getVoltstoHzConversion(metal, energy)
-    initial_V = float(volts[0])
-    for v in volts:
-        delta_V = float(v)-initial_V #convert raw voltage to change in voltage
-        dmm_freqs.append(delta_V*convf) #convert change in voltage to frequency value and add to array
-    return dmm_freqs
+    volts = np.asarray(volts, dtype=np.float64)
+    if (len(volts) == 0):
+        return []
+    #convert raw voltage to change in voltage, then change in voltage to frequency, over the whole array at once
+    return convertVoltageChange(volts-volts[0], getConversionCoefficients(metal, energy, initial_freq, apply_corrections)).tolist()
 
 def getRawDataFromCSV(fp, row_freq, row_dmm, row_time):
     """
@@ -244,7 +380,196 @@ def adjustKSfromDMM(ks, dmm):
         ks_adj.append(ks[i]-dmm[i])
     return ks_adj
 
-def processAllData(filepath, metal, energy):
+def getCSVEngine():
+    """
+    Returns the pandas csv engine to parse raw data csvs with: pyarrow (multithreaded) if it is installed, otherwise the C parser.
+    """
+    global csv_engine
+    if (csv_engine is None):
+        import importlib.util
+        csv_engine = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'c'
+    return csv_engine
+
+def getRawArraysFromCSV(fp, col_freq, col_dmm, col_time):
+    """
+    Reads raw data stored in a csv directly into float arrays, one array per column. 
+    This is the columnar counterpart of getRawDataFromCSV, the whole column is parsed in one pass instead of row by row.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string. 
+    col_freq : int
+        The index of the frequency column.
+    col_dmm : int
+        The index of the dmm column.
+    col_time : int
+        The index of the time column.
+    
+    Returns
+    -------
+    freq_counter : np.ndarray
+        A float64 array of frequency readings.    
+    dmm  : np.ndarray
+        A float64 array of dmm readings.
+    timestamps : np.ndarray
+        A float64 array of times.
+    """
+    import pandas as pd #pandas is imported where it is used, so the realtime app can start without loading it
+    cols = [col_freq, col_dmm, col_time]
+    data = pd.read_csv(fp, usecols=cols, dtype=np.float64, quotechar='|', engine=getCSVEngine())
+    #usecols hands the columns back in file order, so map them back to the order we asked for
+    by_index = dict(zip(sorted(cols), data.columns))
+    freq_counter = data[by_index[col_freq]].to_numpy()
+    dmm = data[by_index[col_dmm]].to_numpy()
+    timestamps = data[by_index[col_time]].to_numpy()
+    return freq_counter, dmm, timestamps
+
+def convertDMMArray(volts, metal, energy, initial_V=None, initial_freq=None, apply_corrections=False):
+    """
+    Converts an array of DMM voltages into an array of frequency changes using array arithmetic. 
+
+    Parameters
+    ----------
+    volts : np.ndarray
+        A float array of voltage readings from the DMM. 
+    metal : str
+        The akali metal used in the cell. Allowed choices are: "rb87", "rb85", or "cs133"
+    energy : str
+        the type of energy transition. Allowed choices are: "high" or "low"
+    initial_V : float, optional
+        The voltage taken to be 0. Defaults to the first reading in volts.
+    initial_freq : float, optional
+        The baseline keysight frequency in Hz, for the frequency correction of the conversion. No correction if not given.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections, see getConversionCoefficients.
+    
+    Returns
+    -------
+    dmm_freqs : np.ndarray
+        A float array of frequency changes relative to initial_V.    
+    """
+    volts = np.asarray(volts, dtype=np.float64)
+    if (initial_V is None):
+        initial_V = volts[0] if len(volts) > 0 else 0.0
+    dmm_freqs = convertVoltageChange(volts-initial_V, getConversionCoefficients(metal, energy, initial_freq, apply_corrections))
+    return dmm_freqs
+
+def getTimeIntervalsArray(times, initial_t=None):
+    """
+    Converts an array of timestamps into an array of time intervals using array arithmetic. 
+
+    Parameters
+    ----------
+    times : np.ndarray
+        A float array of timestamps.
+    initial_t : float, optional
+        The timestamp taken to be t=0. Defaults to the first timestamp in times.
+    
+    Returns
+    -------
+    delta_t : np.ndarray
+        A float array of time intervals relative to initial_t.   
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if (initial_t is None):
+        initial_t = times[0] if len(times) > 0 else 0.0
+    delta_t = times-initial_t
+    return delta_t
+
+def buildProcessedDataFrame(t_ints, freq_c, dmm_freqs):
+    """
+    Builds the processed data frame from time intervals, keysight frequencies, and dmm frequencies. 
+
+    Parameters
+    ----------
+    t_ints : np.ndarray
+        A float array of time intervals in seconds.
+    freq_c : np.ndarray
+        A float array of keysight frequency readings in Hz.
+    dmm_freqs : np.ndarray
+        A float array of dmm readings converted to frequency in Hz.
+    
+    Returns
+    -------
+    df : pandas.Dataframe
+        A pandas dataframe object containing the columns Time, Keysight, DMM, and Adjusted Keysight Data.  
+    """
+    import pandas as pd
+    df = pd.DataFrame({
+        'Time': t_ints,
+        'Keysight': freq_c,
+        'DMM': dmm_freqs,
+        'Adjusted Keysight Data': freq_c-dmm_freqs
+    })
+    return df
+
+def getOverflowMask(data_cols, col_names):
+    """
+    Finds the rows where any of the given columns holds an overflow value, in a single pass with one boolean mask. 
+
+    Parameters
+    ----------
+    data_cols : [np.ndarray]
+        The columns to check, all the same length.
+    col_names : [str]
+        The name of each column, used to report the number of rejected values.
+    
+    Returns
+    -------
+    valid : np.ndarray
+        A boolean array, True for the rows where none of the columns hold an overflow value.
+    rejected : dict
+        The number of overflow values found in each column, keyed by column name.
+    """
+    valid = np.ones(len(data_cols[0]), dtype=bool)
+    rejected = {}
+    for (col, name) in zip(data_cols, col_names):
+        overflow = np.abs(np.asarray(col)) > overflow_threshold
+        rejected[name] = int(np.count_nonzero(overflow))
+        valid &= ~overflow
+    return valid, rejected
+
+def processRawArrays(freq_c, dmm_v, times, metal, energy, time_is_interval, apply_corrections=False):
+    """
+    Removes the overflow rows from raw data columns and converts what is left into the processed format. 
+    The dmm baseline is the first valid voltage, time intervals are measured from the first row collected.
+
+    Parameters
+    ----------
+    freq_c : np.ndarray
+        The keysight frequency readings.
+    dmm_v : np.ndarray
+        The dmm voltage readings.
+    times : np.ndarray
+        The time intervals or timestamps.
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.  
+    time_is_interval : bool
+        True if times already holds time intervals, False if it holds timestamps that need converting.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see getConversionCoefficients.
+    
+    Returns
+    -------
+    df : pandas.Dataframe
+        A pandas dataframe object containing the columns Time, Keysight, DMM, and Adjusted Keysight Data.
+        df.attrs['rejected'] holds the number of overflow values found in each raw column, and df.attrs['rows_read'] the number of raw rows.
+    """
+    valid, rejected = getOverflowMask([freq_c, dmm_v], ['Frequencies', 'Voltages'])
+    t_ints = np.asarray(times, dtype=np.float64) if time_is_interval else getTimeIntervalsArray(times)
+    freq_c = np.asarray(freq_c, dtype=np.float64)[valid]
+    #the first valid point is the baseline of both the dmm and the frequency correction
+    initial_freq = freq_c[0] if len(freq_c) > 0 else None
+    dmm_freqs = convertDMMArray(np.asarray(dmm_v)[valid], metal, energy, None, initial_freq, apply_corrections)
+    df = buildProcessedDataFrame(t_ints[valid], freq_c, dmm_freqs)
+    df.attrs['rejected'] = rejected
+    df.attrs['rows_read'] = len(valid)
+    return df
+
+def processAllData(filepath, metal, energy, apply_corrections=False):
     """
     Takes a filepath, metal, and enegrgy and converts the data in that file into the proper format for analysis. 
     NOTE: this function is used by the BATCHED version of the data collection app
@@ -257,6 +582,8 @@ def processAllData(filepath, metal, energy):
         A string representing the alkali metal type used in the experiment.
     energy : str
         A string representing the appropriate energy level transition for the experiment.  
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see getConversionCoefficients.
     
     Returns
     -------
@@ -264,23 +591,13 @@ def processAllData(filepath, metal, energy):
         A pandas dataframe object containing the following columns: Time (time intervals in seconds), 
         Keysight (keysight frequency readings in Hz), DMM (dmm readings converted to frequency in Hz), 
         and Adjusted Keysight Data (frequency calculated by Keysight[i]-DMM[i] in Hz) 
+        Rows with an overflow value from either instrument are left out, the number rejected per column is in df.attrs['rejected'].
     """
-    freq_c, dmm_v, tstamps = getRawDataFromCSV(filepath, 0, 1, 3)
-    dmm_freqs = convertDMMData(dmm_v, metal, energy)
-    t_ints = convertTimestampstoInterval(tstamps)
-    freq_c = convertKSFreqstoFloat(freq_c)
-    freq_c_adj = adjustKSfromDMM(freq_c, dmm_freqs)
-
-    #make a data frame for these to live in
-    df = pd.DataFrame({
-        'Time': t_ints,
-        'Keysight': freq_c,
-        'DMM': dmm_freqs,
-        'Adjusted Keysight Data': freq_c_adj
-    })
+    freq_c, dmm_v, tstamps = getRawArraysFromCSV(filepath, 0, 1, 3)
+    df = processRawArrays(freq_c, dmm_v, tstamps, metal, energy, False, apply_corrections)
     return df
 
-def processAllData_rt(filepath, metal, energy):
+def processAllData_rt(filepath, metal, energy, apply_corrections=False):
     """
     Takes a filepath, metal, and enegrgy and converts the data in that file into the proper format for analysis. 
     NOTE: this function is used by the REALTIME version of the data collection app
@@ -293,6 +610,8 @@ def processAllData_rt(filepath, metal, energy):
         A string representing the alkali metal type used in the experiment.
     energy : str
         A string representing the appropriate energy level transition for the experiment.  
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see getConversionCoefficients.
     
     Returns
     -------
@@ -300,19 +619,10 @@ def processAllData_rt(filepath, metal, energy):
         A pandas dataframe object containing the following columns: Time (time intervals in seconds), 
         Keysight (keysight frequency readings in Hz), DMM (dmm readings converted to frequency in Hz), 
         and Adjusted Keysight Data (frequency calculated by Keysight[i]-DMM[i] in Hz) 
+        Rows with an overflow value from either instrument are left out, the number rejected per column is in df.attrs['rejected'].
     """
-    freq_c, dmm_v, t_ints = getRawDataFromCSV(filepath, 0, 1, 2)
-    dmm_freqs = convertDMMData(dmm_v, metal, energy)
-    freq_c = convertKSFreqstoFloat(freq_c)
-    freq_c_adj = adjustKSfromDMM(freq_c, dmm_freqs)
-
-    #make a data frame for these to live in
-    df = pd.DataFrame({
-        'Time': t_ints,
-        'Keysight': freq_c,
-        'DMM': dmm_freqs,
-        'Adjusted Keysight Data': freq_c_adj
-    })
+    freq_c, dmm_v, t_ints = getRawArraysFromCSV(filepath, 0, 1, 2)
+    df = processRawArrays(freq_c, dmm_v, t_ints, metal, energy, True, apply_corrections)
     return df
 
 
@@ -334,6 +644,205 @@ def createCSVProcessedData(fp, data):
     data.to_csv(outfile, index=False, header=True)
     outfile.close()
 
+def streamRawDataToCSV(filepath_raw, filepath_processed, metal, energy, col_time, time_is_interval, chunk_size=100000, rejected=None, apply_corrections=False):
+    """
+    Converts a raw data csv to a processed data csv one chunk at a time, so memory use does not grow with the size of the file. 
+    The first valid DMM voltage and the first timestamp in the file are kept as the baseline for every chunk.
+    Rows with an overflow value from either instrument are left out.
+
+    Parameters
+    ----------
+    filepath_raw : str
+        A string representing the filepath to raw data csv. 
+    filepath_processed : str
+        A string representing the filepath where the processed data is to be saved. 
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.  
+    col_time : int
+        The index of the time column in the raw data.
+    time_is_interval : bool
+        True if the time column already holds time intervals, False if it holds timestamps that need converting.
+    chunk_size : int
+        The number of rows to read from the raw file at a time.
+    rejected : dict, optional
+        If given, the number of overflow values found in each raw column is added to it, keyed by column name.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see getConversionCoefficients.
+    
+    Returns
+    -------
+    num_rows : int
+        The number of processed rows written to filepath_processed.
+    """
+    import pandas as pd
+    cols = [0, 1, col_time]
+    reader = pd.read_csv(filepath_raw, usecols=cols, dtype=np.float64, quotechar='|', chunksize=chunk_size)
+    initial_V = None
+    initial_freq = None
+    initial_t = None
+    num_rows = 0
+    with open(filepath_processed, 'w', newline='') as outfile:
+        header = True
+        for chunk in reader:
+            by_index = dict(zip(sorted(cols), chunk.columns))
+            freq_c = chunk[by_index[0]].to_numpy()
+            dmm_v = chunk[by_index[1]].to_numpy()
+            times = chunk[by_index[col_time]].to_numpy()
+            if (len(freq_c) == 0):
+                continue
+            #the time baseline comes from the very first row of the file, not the first row of each chunk
+            if (initial_t is None):
+                initial_t = 0.0 if time_is_interval else times[0]
+            valid, chunk_rejected = getOverflowMask([freq_c, dmm_v], ['Frequencies', 'Voltages'])
+            if (rejected is not None):
+                for name in chunk_rejected:
+                    rejected[name] = rejected.get(name, 0) + chunk_rejected[name]
+            freq_c = freq_c[valid]
+            dmm_v = dmm_v[valid]
+            times = times[valid]
+            if (len(freq_c) == 0):
+                continue
+            #the dmm and frequency baselines are the first valid point in the file
+            if (initial_V is None):
+                initial_V = dmm_v[0]
+                initial_freq = freq_c[0]
+            dmm_freqs = convertDMMArray(dmm_v, metal, energy, initial_V, initial_freq, apply_corrections)
+            t_ints = getTimeIntervalsArray(times, initial_t)
+            df = buildProcessedDataFrame(t_ints, freq_c, dmm_freqs)
+            df.to_csv(outfile, index=False, header=header)
+            header = False
+            num_rows = num_rows + len(df)
+        if (header):
+            #empty raw file, still leave a processed file with the right columns behind
+            buildProcessedDataFrame(np.zeros(0), np.zeros(0), np.zeros(0)).to_csv(outfile, index=False, header=True)
+    return num_rows
+
+def streamAllData(filepath_raw, filepath_processed, metal, energy, chunk_size=100000, rejected=None, apply_corrections=False):
+    """
+    Streaming version of processAllData followed by createCSVProcessedData, with memory use bounded by chunk_size. 
+    NOTE: this function is used by the BATCHED version of the data collection app
+
+    Parameters
+    ----------
+    filepath_raw : str
+        A string representing the filepath to raw data csv. 
+    filepath_processed : str
+        A string representing the filepath where the processed data is to be saved. 
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.  
+    chunk_size : int
+        The number of rows to read from the raw file at a time.
+    rejected : dict, optional
+        If given, the number of overflow values found in each raw column is added to it, keyed by column name.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see getConversionCoefficients.
+    
+    Returns
+    -------
+    num_rows : int
+        The number of processed rows written to filepath_processed.
+    """
+    return streamRawDataToCSV(filepath_raw, filepath_processed, metal, energy, 3, False, chunk_size, rejected, apply_corrections)
+
+def streamAllData_rt(filepath_raw, filepath_processed, metal, energy, chunk_size=100000, rejected=None, apply_corrections=False):
+    """
+    Streaming version of processAllData_rt followed by createCSVProcessedData, with memory use bounded by chunk_size. 
+    NOTE: this function is used by the REALTIME version of the data collection app
+
+    Parameters
+    ----------
+    filepath_raw : str
+        A string representing the filepath to raw data csv. 
+    filepath_processed : str
+        A string representing the filepath where the processed data is to be saved. 
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.  
+    chunk_size : int
+        The number of rows to read from the raw file at a time.
+    rejected : dict, optional
+        If given, the number of overflow values found in each raw column is added to it, keyed by column name.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see getConversionCoefficients.
+    
+    Returns
+    -------
+    num_rows : int
+        The number of processed rows written to filepath_processed.
+    """
+    return streamRawDataToCSV(filepath_raw, filepath_processed, metal, energy, 2, True, chunk_size, rejected, apply_corrections)
+
+class LiveDataProcessor:
+    """
+    Converts raw points into processed rows as they are collected and appends them to a processed data csv right away, 
+    so the raw file never has to be re-read once collection ends.
+    NOTE: this is used by the REALTIME version of the data collection app
+
+    Parameters
+    ----------
+    fp : str
+        A string representing the filepath where the processed data is to be saved. 
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.  
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see getConversionCoefficients.
+    """
+    def __init__(self, fp, metal, energy, apply_corrections=False):
+        self.fp = fp
+        self.metal = metal
+        self.energy = energy
+        self.apply_corrections = apply_corrections
+        self.coefficients = None #set from the first point, the baseline of the frequency correction
+        self.initial_V = None
+        self.num_rows = 0
+        self.outfile = open(fp, 'w', newline='')
+        self.writer = csv.writer(self.outfile)
+        self.writer.writerow(['Time', 'Keysight', 'DMM', 'Adjusted Keysight Data'])
+        self.outfile.flush()
+
+    def addPoint(self, freq, volts, t_int):
+        """
+        Converts a single raw point and appends it to the processed data file. 
+
+        Parameters
+        ----------
+        freq : float
+            The keysight frequency reading in Hz.
+        volts : float
+            The dmm voltage reading.
+        t_int : float
+            The time interval since the start of collection in seconds.
+        
+        Returns
+        -------
+        row : [float]
+            The processed row in the form [time, keysight, dmm, adjusted keysight].
+        """
+        #the first point collected is the baseline for the dmm and the frequency correction, same as processRawArrays
+        if (self.initial_V is None):
+            self.initial_V = volts
+            self.coefficients = getConversionCoefficients(self.metal, self.energy, freq, self.apply_corrections)
+        dmm_freq = convertVoltageChange(volts-self.initial_V, self.coefficients)
+        row = [t_int, freq, dmm_freq, freq-dmm_freq]
+        self.writer.writerow(row)
+        self.outfile.flush()
+        self.num_rows = self.num_rows + 1
+        return row
+
+    def close(self):
+        """
+        Closes the processed data file. 
+        """
+        if (not self.outfile.closed):
+            self.outfile.close()
+
 
 def findOverflowVals(data, target_column):
     """
@@ -351,7 +860,7 @@ def findOverflowVals(data, target_column):
     rows : list
         A list of rows containing data that exceed the threshold.
     """
-    rows = data[data[target_column] > 100000000000].index.tolist()
+    rows = data.index[np.abs(data[target_column].to_numpy()) > overflow_threshold].tolist()
     return rows
 
 def removeDMMOverflowVals(fp):
@@ -368,9 +877,7 @@ def removeDMMOverflowVals(fp):
     clean_data : pandas.Dataframe
         A pandas Dataframe with all rows containing DMM overflow values removed.
     """
-    data = pd.read_csv(fp)
-    to_remove = findOverflowVals(data, 'Voltages')
-    clean_data = data.drop(to_remove)
+    clean_data = removeAllOverflowVals(fp, ['Voltages'])
     return clean_data
 
 def removeFreqCounterOverflowVals(fp):
@@ -387,9 +894,7 @@ def removeFreqCounterOverflowVals(fp):
     clean_data : pandas.Dataframe
         A pandas Dataframe with all rows containing frequency counter overflow values removed.
     """
-    data = pd.read_csv(fp)
-    to_remove = findOverflowVals(data, 'Frequencies')
-    clean_data = data.drop(to_remove)
+    clean_data = removeAllOverflowVals(fp, ['Frequencies'])
     return clean_data
 
 def removeAllOverflowVals(fp, list_cols):
@@ -407,12 +912,15 @@ def removeAllOverflowVals(fp, list_cols):
     -------
     clean_data : pandas.Dataframe
         A pandas Dataframe with all rows containing overflow values in the specified columns removed.
+        clean_data.attrs['rejected'] holds the number of overflow values found in each of the specified columns.
     """
+    import pandas as pd
     data = pd.read_csv(fp)
-    for col in list_cols:
-        to_remove = findOverflowVals(data, col)
-        data = data.drop(to_remove)
-    return data
+    #one mask over all the columns, so the data is only copied once
+    valid, rejected = getOverflowMask([data[col].to_numpy() for col in list_cols], list_cols)
+    clean_data = data[valid]
+    clean_data.attrs['rejected'] = rejected
+    return clean_data
 
 def getAvgAndStdDev(data_set):
     """
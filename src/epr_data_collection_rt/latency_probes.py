@@ -0,0 +1,197 @@
+import json
+import math
+import os
+import time
+
+########## LATENCY PROBES ############################################################################################################
+# Timing of each phase of the acquisition loop (arming, trigger pulses, reading back each instrument, writing to disk),
+# so high_time/low_time can be tuned and slow instruments caught with real numbers.
+#
+# Every phase gets a histogram with log spaced bins, BINS_PER_DECADE per factor of 10 between MIN_LATENCY and MAX_LATENCY.
+# Adding a sample is a log10 and a list increment, nothing is kept per sample, so the probes can stay on for multi-day runs.
+# Percentiles come from the bins, so they are accurate to one bin width (about 12% with 20 bins per decade).
+# The count, mean and max are exact.
+
+BINS_PER_DECADE = 20
+MIN_LATENCY = 1e-6 #seconds, anything faster goes in the first bin
+MAX_LATENCY = 1e4 #seconds, anything slower goes in the last bin
+PERCENTILES = [50, 95, 99]
+
+########################################################################################################################################
+
+_num_bins = int(round(math.log10(MAX_LATENCY/MIN_LATENCY)*BINS_PER_DECADE))
+_log_min = math.log10(MIN_LATENCY)
+
+
+def getBinIndex(seconds):
+    """
+    Returns the histogram bin a latency falls in.
+    """
+    if (seconds <= MIN_LATENCY):
+        return 0
+    return min(int((math.log10(seconds) - _log_min)*BINS_PER_DECADE), _num_bins - 1)
+
+def getBinUpperEdge(index):
+    """
+    Returns the largest latency in a histogram bin, in seconds.
+    """
+    return 10**(_log_min + (index + 1)/BINS_PER_DECADE)
+
+
+class LatencyHistogram:
+    """
+    A log binned histogram of the latencies of one phase.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.counts = [0]*_num_bins
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """
+        Adds one latency.
+
+        Parameters
+        ----------
+        seconds : float
+            How long the phase took.
+        """
+        self.counts[getBinIndex(seconds)] += 1
+        self.count = self.count + 1
+        self.total = self.total + seconds
+        if (seconds > self.max):
+            self.max = seconds
+
+    def getMean(self):
+        if (self.count == 0):
+            return math.nan
+        return self.total/self.count
+
+    def getPercentile(self, p):
+        """
+        Returns the p-th percentile latency, the upper edge of the bin it falls in (never more than the max).
+
+        Parameters
+        ----------
+        p : float
+            The percentile, between 0 and 100.
+
+        Returns
+        -------
+        seconds : float
+            The latency, nan if nothing has been added.
+        """
+        if (self.count == 0):
+            return math.nan
+        target = max(1, math.ceil(self.count*p/100))
+        seen = 0
+        for (index, n) in enumerate(self.counts):
+            seen = seen + n
+            if (seen >= target):
+                return min(getBinUpperEdge(index), self.max)
+        return self.max
+
+    def getSummary(self):
+        """
+        Returns the count, mean, percentiles, and max in ms, for the metrics file. Only the count if nothing has been added.
+        """
+        if (self.count == 0):
+            return {'count': 0}
+        summary = {'count': self.count, 'mean_ms': 1000*self.getMean()}
+        for p in PERCENTILES:
+            summary['p' + str(p) + '_ms'] = 1000*self.getPercentile(p)
+        summary['max_ms'] = 1000*self.max
+        return summary
+
+
+class LatencyProbes:
+    """
+    One LatencyHistogram per phase. Phases are listed in the order given, then in the order any others were first timed.
+    Each phase should only be timed from one thread at a time, different phases can be timed from different threads.
+
+    Parameters
+    ----------
+    phases : [str], optional
+        The phases to list first, so the summary is in the same order every run.
+    """
+    def __init__(self, phases=()):
+        self.phases = list(phases)
+        self.clear()
+
+    def clear(self):
+        self.histograms = {phase: LatencyHistogram() for phase in self.phases}
+
+    def add(self, phase, seconds):
+        """
+        Adds one latency to a phase.
+
+        Parameters
+        ----------
+        phase : str
+            The name of the phase.
+        seconds : float
+            How long it took.
+        """
+        histogram = self.histograms.get(phase)
+        if (histogram is None):
+            histogram = LatencyHistogram()
+            self.histograms[phase] = histogram
+        histogram.add(seconds)
+
+    def timed(self, phase, func, *args):
+        """
+        Calls func(*args), adds how long it took to phase, and returns what it returned. Nothing is added if it raises.
+        """
+        t0 = time.perf_counter()
+        result = func(*args)
+        self.add(phase, time.perf_counter() - t0)
+        return result
+
+    def getSummary(self):
+        """
+        Returns the summary of every phase, keyed by phase name.
+        """
+        return {phase: histogram.getSummary() for (phase, histogram) in list(self.histograms.items())}
+
+    def getSummaryString(self):
+        """
+        Returns one line per phase with the percentiles and max in ms, for the GUI.
+        """
+        lines = []
+        for (phase, s) in self.getSummary().items():
+            if (s['count'] == 0):
+                continue
+            lines.append(phase + ': ' + ', '.join('p' + str(p) + ' ' + str(round(s['p' + str(p) + '_ms'], 2)) for p in PERCENTILES)
+                         + ', max ' + str(round(s['max_ms'], 2)) + ' ms (' + str(s['count']) + ')')
+        if (len(lines) == 0):
+            return 'Latency: no data yet'
+        return '\n'.join(lines)
+
+    def writeMetricsFile(self, fp, extra=None):
+        """
+        Writes the summary of every phase to a json file. Written to a temporary file first, so a failed write never leaves half a metrics file.
+
+        Parameters
+        ----------
+        fp : str
+            The file path to the metrics file as a string.
+        extra : dict, optional
+            Anything else about the run to include, e.g. the data file names and number of points.
+            Values json can't hold (like an exception) are written as their string.
+        """
+        metrics = dict(extra) if extra is not None else {}
+        metrics['bins_per_decade'] = BINS_PER_DECADE
+        metrics['phases'] = self.getSummary()
+        tmp = fp + '.' + str(os.getpid()) + '.tmp'
+        try:
+            with open(tmp, 'w') as outfile:
+                json.dump(metrics, outfile, indent=2, default=str)
+            os.replace(tmp, fp)
+        except Exception:
+            if (os.path.exists(tmp)):
+                os.remove(tmp)
+            raise
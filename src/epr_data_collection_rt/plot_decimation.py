@@ -0,0 +1,222 @@
+from threading import Lock
+
+import numpy as np
+
+########## PLOT DECIMATION ############################################################################################################
+# Keeps every point of a run and a min/max pyramid over it, so a plot of any stretch of the run (the last minute or the whole
+# thing) can be drawn from a bounded number of points. Level 1 keeps the lowest and highest point of every LEVEL_FACTOR
+# points, level 2 of every LEVEL_FACTOR level 1 buckets, and so on. The pyramid is extended as points come in, each new point
+# costs a few comparisons. Keeping both the min and the max of every bucket means spikes and dropouts never disappear from the plot.
+
+LEVEL_FACTOR = 4
+DEFAULT_MAX_POINTS = 2000
+
+########################################################################################################################################
+
+
+class GrowableArray:
+    """
+    A numpy array that can be appended to, doubling its capacity whenever it fills up.
+    """
+    def __init__(self, dtype=np.float64, capacity=1024):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if (self.size == len(self.data)):
+            self.data = np.concatenate((self.data, np.zeros(len(self.data), dtype=self.data.dtype)))
+        self.data[self.size] = value
+        self.size = self.size + 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        needed = self.size + len(values)
+        if (needed > len(self.data)):
+            grown = np.zeros(max(needed, 2*len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def view(self):
+        return self.data[:self.size]
+
+    def __len__(self):
+        return self.size
+
+
+class MinMaxDecimator:
+    """
+    Stores the points of a run and hands back a decimated copy of any part of it for plotting.
+    Points have to be added in order of increasing x. Safe to add points from one thread while another reads views.
+
+    Parameters
+    ----------
+    factor : int
+        How many buckets of one level make up a bucket of the next level.
+    """
+    def __init__(self, factor=LEVEL_FACTOR):
+        self.factor = factor
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Forgets every point, ready for a new run.
+        """
+        with self.lock:
+            self.x = GrowableArray()
+            self.y = GrowableArray()
+            #levels[l-1] holds the indexes of the lowest and highest point in each complete bucket of factor**l points
+            self.level_min = []
+            self.level_max = []
+
+    def __len__(self):
+        return len(self.x)
+
+    def getRange(self):
+        """
+        Returns the first and last x, or (None, None) if there are no points yet.
+        """
+        with self.lock:
+            if (len(self.x) == 0):
+                return None, None
+            xs = self.x.view()
+            return xs[0], xs[-1]
+
+    def append(self, x, y):
+        """
+        Adds a single point and extends every level whose newest bucket it completes.
+
+        Parameters
+        ----------
+        x : float
+            The time of the point.
+        y : float
+            The value of the point.
+        """
+        with self.lock:
+            self.x.append(x)
+            self.y.append(y)
+            n = len(self.y)
+            level = 1
+            while (n % (self.factor**level) == 0):
+                self.addBucket(level)
+                level = level + 1
+
+    def extend(self, xs, ys):
+        """
+        Adds several points in order, e.g. one collection cycle.
+
+        Parameters
+        ----------
+        xs : [float]
+            The times of the points.
+        ys : [float]
+            The values of the points.
+        """
+        for (x, y) in zip(xs, ys):
+            self.append(x, y)
+
+    def addBucket(self, level):
+        """
+        Adds the newest complete bucket of a level, from the last factor buckets of the level below it.
+        """
+        y = self.y.view()
+        if (level > len(self.level_min)):
+            self.level_min.append(GrowableArray(np.int64))
+            self.level_max.append(GrowableArray(np.int64))
+        if (level == 1):
+            start = len(y) - self.factor
+            mins = maxs = np.arange(start, len(y))
+        else:
+            mins = self.level_min[level-2].view()[-self.factor:]
+            maxs = self.level_max[level-2].view()[-self.factor:]
+        self.level_min[level-1].append(mins[np.argmin(y[mins])])
+        self.level_max[level-1].append(maxs[np.argmax(y[maxs])])
+
+    def setData(self, x, y):
+        """
+        Replaces all the points at once and builds every level with array operations, e.g. to plot a whole run from a file.
+
+        Parameters
+        ----------
+        x : np.ndarray
+            The times of the points, in increasing order.
+        y : np.ndarray
+            The values of the points.
+        """
+        self.clear()
+        with self.lock:
+            self.x.extend(x)
+            self.y.extend(y)
+            y = self.y.view()
+            mins = maxs = np.arange(len(y))
+            while (len(mins) >= self.factor):
+                m = (len(mins)//self.factor)*self.factor
+                mins = mins[:m].reshape(-1, self.factor)
+                maxs = maxs[:m].reshape(-1, self.factor)
+                rows = np.arange(len(mins))
+                mins = mins[rows, np.argmin(y[mins], axis=1)]
+                maxs = maxs[rows, np.argmax(y[maxs], axis=1)]
+                level_min = GrowableArray(np.int64)
+                level_min.extend(mins)
+                level_max = GrowableArray(np.int64)
+                level_max.extend(maxs)
+                self.level_min.append(level_min)
+                self.level_max.append(level_max)
+
+    def getIndexes(self, level, i_from, i_to):
+        """
+        Returns the indexes of the points to plot between two point indexes, using buckets from the given level where they fit
+        completely and finer levels for the partial buckets at either end.
+        """
+        if (i_from >= i_to):
+            return []
+        if (level == 0):
+            return [np.arange(i_from, i_to)]
+        size = self.factor**level
+        b_from = -(-i_from//size) #first bucket that starts inside the range
+        b_to = min(i_to//size, len(self.level_min[level-1])) #one past the last complete bucket inside the range
+        if (b_from >= b_to):
+            return self.getIndexes(level-1, i_from, i_to)
+        mins = self.level_min[level-1].view()[b_from:b_to]
+        maxs = self.level_max[level-1].view()[b_from:b_to]
+        #each bucket gives two points, in the order they were collected so the line is drawn left to right
+        pairs = np.sort(np.column_stack((mins, maxs)), axis=1).ravel()
+        return self.getIndexes(level-1, i_from, b_from*size) + [pairs] + self.getIndexes(level-1, b_to*size, i_to)
+
+    def getView(self, x_min=None, x_max=None, max_points=DEFAULT_MAX_POINTS):
+        """
+        Returns the points to plot between x_min and x_max, no more than about max_points of them.
+
+        Parameters
+        ----------
+        x_min : float, optional
+            The start of the view. Defaults to the first point.
+        x_max : float, optional
+            The end of the view. Defaults to the last point.
+        max_points : int
+            How many points the plot should get. The partial buckets at the ends of the view can add a few more.
+
+        Returns
+        -------
+        x : np.ndarray
+            The times of the points to plot.
+        y : np.ndarray
+            The values of the points to plot.
+        """
+        with self.lock:
+            xs = self.x.view()
+            ys = self.y.view()
+            i_from = 0 if x_min is None else int(np.searchsorted(xs, x_min, side='left'))
+            i_to = len(xs) if x_max is None else int(np.searchsorted(xs, x_max, side='right'))
+            #use the finest level that still fits in max_points
+            level = 0
+            while ((level < len(self.level_min)) and ((i_to - i_from)*2/(self.factor**level) > max_points)):
+                level = level + 1
+            indexes = self.getIndexes(level, i_from, i_to)
+            if (len(indexes) == 0):
+                return np.zeros(0), np.zeros(0)
+            indexes = np.concatenate(indexes)
+            return xs[indexes].copy(), ys[indexes].copy()
@@ -0,0 +1,349 @@
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+
+try:
+    from . import kse_experiment_utils as kse
+except ImportError:
+    import kse_experiment_utils as kse
+
+########## PROCESSED DATA CACHE ############################################################################################################
+# Keeps processed results on disk, keyed by a hash of the raw file contents plus everything that affects the conversion
+# (metal, energy, the conversion constants, and the processing code). Reprocessing a run that hasn't changed
+# loads the saved result instead of converting the raw file again.
+#
+# The processing code is keyed by the source of the module the processing function is in and of kse_experiment_utils,
+# so editing either one (e.g. processRawArrays) makes the old results unused without bumping anything by hand.
+#
+# The raw file hash is remembered against the file's size and modification time, so a file that hasn't been touched
+# isn't even re-read. Each raw file's hash is saved in its own file under hashes/, so processes working through
+# different files (batch_processing) never overwrite each other's hashes. The cache is limited in size,
+# the least recently used results are removed first.
+#
+# The cache lives in ~/.kse_cache unless KSE_CACHE_DIR is set.
+
+CACHE_DIR_ENV_VAR = 'KSE_CACHE_DIR'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.kse_cache')
+DEFAULT_MAX_BYTES = 2*1024**3
+CACHE_VERSION = 3 #bump this when the format of the saved results changes, so old entries are never used
+CACHE_EXT = '.npz'
+HASH_CHUNK = 1024*1024
+HASHES_DIRNAME = 'hashes'
+
+########################################################################################################################################
+
+
+def hashFile(fp):
+    """
+    Returns the sha256 hash of a file's contents, reading it in chunks.
+
+    Parameters
+    ----------
+    fp : str
+        The path to the file.
+
+    Returns
+    -------
+    digest : str
+        The hash as a hex string.
+    """
+    h = hashlib.sha256()
+    with open(fp, 'rb') as infile:
+        chunk = infile.read(HASH_CHUNK)
+        while (chunk):
+            h.update(chunk)
+            chunk = infile.read(HASH_CHUNK)
+    return h.hexdigest()
+
+def getSourceHash(process):
+    """
+    Returns a hash of the code a processing function runs, the source of its module and of kse_experiment_utils.
+
+    Parameters
+    ----------
+    process : function
+        The processing function.
+
+    Returns
+    -------
+    digest : str
+        The hash as a hex string.
+    """
+    h = hashlib.sha256()
+    for fp in sorted({os.path.abspath(inspect.getsourcefile(process)), os.path.abspath(kse.__file__)}):
+        with open(fp, 'rb') as infile:
+            h.update(infile.read())
+    return h.hexdigest()
+
+def getConversionSettings(metal, energy, apply_corrections=False):
+    """
+    Returns everything besides the raw data that the processed result depends on.
+
+    Parameters
+    ----------
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.
+    apply_corrections : bool
+        Whether the quadratic in field and frequency corrections are applied to the dmm conversion.
+
+    Returns
+    -------
+    settings : dict
+        The metal, energy, whether the corrections are applied, conversion constants and coefficients, and overflow threshold.
+    """
+    return {
+        'version': CACHE_VERSION,
+        'metal': metal,
+        'energy': energy,
+        'conv_fact_V': kse.conv_fact_V,
+        'conv_fact_G': kse.conv_fact_G,
+        'B_field_gain': kse.B_field_gain,
+        'apply_corrections': apply_corrections,
+        'volts_to_hz': list(kse.getConversionCoefficients(metal, energy, None, apply_corrections)),
+        'frequency_correction': list(kse.frequency_correction_table.get((metal, energy), ())) if apply_corrections else [],
+        'overflow_threshold': kse.overflow_threshold,
+    }
+
+
+class ProcessedDataCache:
+    """
+    A size limited, least recently used cache of processed data frames on disk.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Where to keep the cached results. Defaults to KSE_CACHE_DIR, or ~/.kse_cache.
+    max_bytes : int
+        The cache is trimmed back to this size, oldest results first, whenever a result is added.
+    """
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        if (cache_dir is None):
+            cache_dir = os.environ.get(CACHE_DIR_ENV_VAR, DEFAULT_CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hashes_dir = os.path.join(self.cache_dir, HASHES_DIRNAME)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.hashes_dir, exist_ok=True)
+
+    def getHashEntryPath(self, path):
+        """
+        Returns where the saved hash of a raw data file is kept, one small json file per raw file.
+        """
+        return os.path.join(self.hashes_dir, hashlib.sha256(path.encode('utf-8')).hexdigest()[:32] + '.json')
+
+    def loadHashEntry(self, path):
+        """
+        Returns the saved size, modification time and hash of a raw data file, or None if there isn't one.
+        """
+        try:
+            with open(self.getHashEntryPath(path)) as infile:
+                entry = json.load(infile)
+        except (OSError, ValueError):
+            return None
+        if (entry.get('path') != path):
+            return None
+        return entry
+
+    def saveHashEntry(self, path, entry):
+        """
+        Saves the hash of one raw data file. Written to a temporary file first so a reader never sees half an entry.
+        """
+        fp = self.getHashEntryPath(path)
+        tmp = fp + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'w') as outfile:
+            json.dump(dict(entry, path=path), outfile)
+        os.replace(tmp, fp)
+
+    def pruneHashes(self):
+        """
+        Forgets the hashes of raw files that have been moved or deleted, so the saved hashes don't grow forever.
+
+        Returns
+        -------
+        removed : int
+            The number of hashes removed.
+        """
+        removed = 0
+        for fn in os.listdir(self.hashes_dir):
+            fp = os.path.join(self.hashes_dir, fn)
+            try:
+                with open(fp) as infile:
+                    path = json.load(infile).get('path')
+                if ((path is None) or (not os.path.exists(path))):
+                    os.remove(fp)
+                    removed = removed + 1
+            except (OSError, ValueError):
+                continue
+        return removed
+
+    def getRawFileHash(self, fp):
+        """
+        Returns the hash of a raw data file, reusing the saved hash if the file's size and modification time haven't changed.
+
+        Parameters
+        ----------
+        fp : str
+            The path to the raw data file.
+
+        Returns
+        -------
+        digest : str
+            The sha256 hash of the file contents.
+        """
+        path = os.path.abspath(fp)
+        st = os.stat(path)
+        entry = self.loadHashEntry(path)
+        if ((entry is not None) and (entry['size'] == st.st_size) and (entry['mtime_ns'] == st.st_mtime_ns)):
+            return entry['sha256']
+        digest = hashFile(path)
+        self.saveHashEntry(path, {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest})
+        return digest
+
+    def getKey(self, fp, metal, energy, process, apply_corrections=False):
+        """
+        Returns the cache key for processing a raw data file with the given settings.
+
+        Parameters
+        ----------
+        fp : str
+            The path to the raw data file.
+        metal :  str
+            A string representing the alkali metal type used in the experiment.
+        energy : str
+            A string representing the appropriate energy level transition for the experiment.
+        process : function
+            The processing function, its name and the source it runs are part of the key.
+        apply_corrections : bool
+            Whether the quadratic in field and frequency corrections are applied to the dmm conversion.
+
+        Returns
+        -------
+        key : str
+            A hex string identifying the processed result.
+        """
+        settings = getConversionSettings(metal, energy, apply_corrections)
+        settings['raw_sha256'] = self.getRawFileHash(fp)
+        settings['process'] = process.__module__.split('.')[-1] + '.' + process.__name__
+        settings['source_sha256'] = getSourceHash(process)
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+    def getEntryPath(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_EXT)
+
+    def get(self, key):
+        """
+        Returns the cached data frame for a key, or None if it isn't cached. A hit marks the entry as recently used.
+        """
+        fp = self.getEntryPath(key)
+        try:
+            with np.load(fp, allow_pickle=False) as saved:
+                data = saved['data']
+                columns = [str(c) for c in saved['columns']]
+                attrs = json.loads(str(saved['attrs']))
+        except (OSError, KeyError, ValueError):
+            self.misses = self.misses + 1
+            return None
+        os.utime(fp)
+        self.hits = self.hits + 1
+        import pandas as pd
+        df = pd.DataFrame(data, columns=columns)
+        df.attrs.update(attrs)
+        return df
+
+    def put(self, key, df):
+        """
+        Saves a processed data frame under a key, then trims the cache back to max_bytes.
+        """
+        fp = self.getEntryPath(key)
+        tmp = fp + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'wb') as outfile:
+            np.savez(outfile, data=df.to_numpy(dtype=np.float64), columns=np.array(df.columns, dtype=str), attrs=np.array(json.dumps(df.attrs)))
+        os.replace(tmp, fp)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used results until the cache is no bigger than max_bytes, and the hashes of raw files that are gone.
+
+        Returns
+        -------
+        removed : int
+            The number of results removed.
+        """
+        entries = []
+        for fn in os.listdir(self.cache_dir):
+            if (fn.endswith(CACHE_EXT)):
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, fn))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fn))
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for (mtime, size, fn) in sorted(entries):
+            if (total <= self.max_bytes):
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, fn))
+            except OSError:
+                continue
+            total = total - size
+            removed = removed + 1
+        self.pruneHashes()
+        return removed
+
+    def getSize(self):
+        """
+        Returns the total size of the cached results, in bytes.
+        """
+        return sum(os.path.getsize(os.path.join(self.cache_dir, fn)) for fn in os.listdir(self.cache_dir) if fn.endswith(CACHE_EXT))
+
+    def clear(self):
+        """
+        Removes every cached result and the saved raw file hashes.
+        """
+        for fn in os.listdir(self.cache_dir):
+            if (fn.endswith(CACHE_EXT)):
+                os.remove(os.path.join(self.cache_dir, fn))
+        for fn in os.listdir(self.hashes_dir):
+            os.remove(os.path.join(self.hashes_dir, fn))
+
+
+def processCached(fp, metal, energy, process, cache=None, apply_corrections=False):
+    """
+    Processes a raw data file, or loads the result from the cache if the same file has already been processed with the same settings.
+
+    Parameters
+    ----------
+    fp : str
+        The path to the raw data file.
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.
+    process : function
+        Called as process(fp, metal, energy, apply_corrections) on a cache miss, e.g. kse.processAllData_rt.
+    cache : ProcessedDataCache, optional
+        The cache to use. Uses the default cache if not given.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see kse.getConversionCoefficients.
+
+    Returns
+    -------
+    df : pandas.Dataframe
+        The processed data.
+    """
+    if (cache is None):
+        cache = ProcessedDataCache()
+    key = cache.getKey(fp, metal, energy, process, apply_corrections)
+    df = cache.get(key)
+    if (df is None):
+        df = process(fp, metal, energy, apply_corrections)
+        cache.put(key, df)
+    return df
@@ -0,0 +1,198 @@
+import queue
+import time
+
+from threading import Thread, Lock
+
+
+class QueuedWriter:
+    """
+    Moves disk writes off the acquisition thread. The acquisition loop puts samples into a bounded queue
+    and a separate writer thread drains the queue and hands the samples to the write function in batches.
+    Putting a sample never blocks: if the queue is full the sample is dropped and counted instead, so a slow
+    disk can never stretch the trigger timing.
+
+    Parameters
+    ----------
+    write_batch : function
+        Called from the writer thread with a list of samples. This is where the actual file writes happen.
+    maxsize : int
+        The maximum number of samples waiting to be written before new samples are dropped.
+    batch_size : int
+        The maximum number of samples handed to write_batch at once.
+    on_idle : function, optional
+        Called from the writer thread with no arguments whenever nothing has been queued for idle_interval seconds,
+        for work that has to happen even when no samples arrive (like syncing a file after acquisition stalls).
+    idle_interval : float, optional
+        How long the writer thread waits for a sample before calling on_idle, in seconds. on_idle is never called if either is None.
+    """
+    _stop = object()
+
+    def __init__(self, write_batch, maxsize=1000, batch_size=100, on_idle=None, idle_interval=None):
+        self.write_batch = write_batch
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.on_idle = on_idle
+        self.idle_interval = idle_interval
+        self.queue = queue.Queue(maxsize)
+        self.lock = Lock()
+        self.dropped = 0
+        self.written = 0
+        self.high_water = 0
+        self.write_errors = 0
+        self.last_error = None
+        self.last_write_time = 0.0
+        self.thread = Thread(target=self.run, name='QueuedWriter', daemon=True)
+        self.stopped = False
+
+    def start(self):
+        """
+        Starts the writer thread.
+        """
+        self.thread.start()
+
+    def put(self, sample):
+        """
+        Queues a sample to be written without waiting.
+
+        Parameters
+        ----------
+        sample : object
+            The sample to hand to write_batch later.
+
+        Returns
+        -------
+        queued : bool
+            True if the sample was queued, False if the queue was full and the sample was dropped.
+        """
+        try:
+            self.queue.put_nowait(sample)
+        except queue.Full:
+            with self.lock:
+                self.dropped = self.dropped + 1
+            return False
+        depth = self.queue.qsize()
+        if (depth > self.high_water):
+            self.high_water = depth
+        return True
+
+    def run(self):
+        """
+        Writer thread loop. Blocks until there is something to write, then writes everything that is waiting, up to batch_size at a time.
+        Calls on_idle every idle_interval seconds while there is nothing to write.
+        """
+        if ((self.on_idle is None) or (self.idle_interval is None)):
+            timeout = None
+        else:
+            timeout = self.idle_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self.idle()
+                continue
+            if (item is self._stop):
+                break
+            batch = [item]
+            done = False
+            while (len(batch) < self.batch_size):
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if (item is self._stop):
+                    done = True
+                    break
+                batch.append(item)
+            self.write(batch)
+            if (done):
+                break
+
+    def write(self, batch):
+        """
+        Hands a batch of samples to write_batch and keeps track of how it went.
+
+        Parameters
+        ----------
+        batch : list
+            The samples to write.
+        """
+        t0 = time.perf_counter()
+        try:
+            self.write_batch(batch)
+        except Exception as error:
+            #keep draining the queue even if a write fails, the acquisition loop can see the error through getStatus
+            with self.lock:
+                self.write_errors = self.write_errors + 1
+                self.last_error = error
+        else:
+            with self.lock:
+                self.written = self.written + len(batch)
+        self.last_write_time = time.perf_counter() - t0
+
+    def idle(self):
+        """
+        Calls on_idle, counting a failure the same way as a failed write.
+        """
+        try:
+            self.on_idle()
+        except Exception as error:
+            with self.lock:
+                self.write_errors = self.write_errors + 1
+                self.last_error = error
+
+    def stop(self, timeout=None):
+        """
+        Writes everything still in the queue and stops the writer thread. Safe to call more than once.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            How long to wait for the writer thread to finish, in seconds. Waits until it is done by default.
+        """
+        if (self.stopped):
+            return
+        self.stopped = True
+        if (self.thread.is_alive()):
+            self.queue.put(self._stop)
+            self.thread.join(timeout)
+
+    def getStatus(self):
+        """
+        Returns the current state of the queue, for display in the GUI.
+
+        Returns
+        -------
+        status : dict
+            depth (samples waiting), maxsize, high_water (most samples ever waiting), dropped, written,
+            write_errors, last_error, and last_write_time (seconds the last batch took to write).
+        """
+        with self.lock:
+            status = {
+                'depth': self.queue.qsize(),
+                'maxsize': self.maxsize,
+                'high_water': self.high_water,
+                'dropped': self.dropped,
+                'written': self.written,
+                'write_errors': self.write_errors,
+                'last_error': self.last_error,
+                'last_write_time': self.last_write_time
+            }
+        return status
+
+    def getStatusString(self):
+        """
+        Returns the current state of the queue as a short string for a status label.
+
+        Returns
+        -------
+        status_str : str
+            The queue depth, peak depth, dropped count, and write error count.
+        """
+        status = self.getStatus()
+        status_str = ('Write queue: ' + str(status['depth']) + '/' + str(status['maxsize'])
+                      + ' (peak ' + str(status['high_water']) + ')'
+                      + ', written: ' + str(status['written'])
+                      + ', dropped: ' + str(status['dropped']))
+        if (status['write_errors'] > 0):
+            status_str = status_str + ', write errors: ' + str(status['write_errors']) + ' (' + str(status['last_error']) + ')'
+        return status_str
@@ -0,0 +1,558 @@
+import os
+import struct
+import time
+import numpy as np
+
+try:
+    from . import utilities as util
+    from . import kse_experiment_utils as kse
+except ImportError:
+    import utilities as util
+    import kse_experiment_utils as kse
+
+########## RAW DATA FILE FORMAT ############################################################################################################
+# Raw data is stored as an append-only log of fixed size records, one record per data point.
+# Every record is the same number of little endian float64 values, so the file can be memory mapped
+# and read without any parsing. The layout of the file is:
+#       magic (8 bytes) | number of columns (uint32) | header size in bytes (uint32) | column names (utf-8, comma separated, zero padded)
+#       record 0 | record 1 | ...
+# The header size is always a multiple of 8 so the records start on an 8 byte boundary.
+#
+# Durability: RawDataWriter fsyncs the file in groups, once sync_every points have been appended or sync_interval seconds
+# have passed since the last sync (whichever comes first), instead of after every point. After a crash or power cut
+# everything up to the last sync is on disk, and at most the points since then are lost. The number of syncs and the
+# time spent in them are kept so the cost is known. A crash partway through a write can leave a torn record at the end of the file,
+# recoverRawDataFile cuts it off, and the apps run recoverRawDataFolder on their data folder before every run.
+#
+# Locking: a RawDataWriter holds an operating system lock on <file>.lock (RawFileLock) for as long as the file is open,
+# and recoverRawDataFolder only touches files it can take the same lock on. So a GUI or daemon starting a run never cuts
+# the end off a file another instance is still appending to in the same folder. The operating system drops the lock
+# when the process holding it dies, so a file left behind by a crash is always recoverable.
+
+RAW_FILE_MAGIC = b'KSERAW01'
+RAW_FILE_EXT = '.bin'
+LOCK_SUFFIX = '.lock'
+DEFAULT_SYNC_EVERY = 100 #points between fsyncs
+DEFAULT_SYNC_INTERVAL = 1.0 #seconds between fsyncs
+
+# column layouts used by the two apps
+RT_COLUMNS = ['Frequencies', 'Voltages', 'Time Interval']
+BATCHED_COLUMNS = ['Frequencies', 'Voltages', 'Timestamps']
+
+_header_prefix = struct.Struct('<8sII')
+
+########################################################################################################################################
+
+
+def buildRawFileHeader(columns):
+    """
+    Builds the header for a raw data file with the specified columns.
+
+    Parameters
+    ----------
+    columns : [str]
+        The names of the columns stored in each record.
+
+    Returns
+    -------
+    header : bytes
+        The header, padded to a multiple of 8 bytes.
+    """
+    names = ','.join(columns).encode('utf-8')
+    header_size = _header_prefix.size + len(names)
+    header_size = header_size + (-header_size % 8)
+    header = _header_prefix.pack(RAW_FILE_MAGIC, len(columns), header_size) + names
+    header = header.ljust(header_size, b'\x00')
+    return header
+
+def readRawFileHeader(fp):
+    """
+    Reads the header of a raw data file.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string.
+
+    Returns
+    -------
+    columns : [str]
+        The names of the columns stored in each record.
+    header_size : int
+        The size of the header in bytes, which is also the offset of the first record.
+    """
+    with open(fp, 'rb') as infile:
+        prefix = infile.read(_header_prefix.size)
+        if (len(prefix) < _header_prefix.size):
+            raise ValueError(fp + ' is too short to be a raw data file')
+        magic, ncols, header_size = _header_prefix.unpack(prefix)
+        if (magic != RAW_FILE_MAGIC):
+            raise ValueError(fp + ' is not a raw data file')
+        names = infile.read(header_size - _header_prefix.size)
+    columns = names.rstrip(b'\x00').decode('utf-8').split(',')
+    if (len(columns) != ncols):
+        raise ValueError(fp + ' has a corrupted header')
+    return columns, header_size
+
+def isRawDataFile(fp):
+    """
+    Checks whether a file is a binary raw data file (as opposed to a csv).
+
+    Parameters
+    ----------
+    fp : str
+        The file path to check.
+
+    Returns
+    -------
+    is_raw : bool
+        True if the file starts with the raw data file magic.
+    """
+    with open(fp, 'rb') as infile:
+        return infile.read(len(RAW_FILE_MAGIC)) == RAW_FILE_MAGIC
+
+def rawFileHasData(fp):
+    """
+    Checks whether a file exists and is not empty.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to check.
+
+    Returns
+    -------
+    has_data : bool
+        True if the file exists and has at least one byte in it.
+    """
+    return os.path.exists(fp) and os.path.getsize(fp) > 0
+
+
+def recoverRawDataFile(fp):
+    """
+    Cuts a torn record (a partially written data point, from a crash or power cut partway through a write) off the end of a raw data file.
+    A file that was cut off before its header was complete holds no data, it is emptied so it can be started over.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string.
+
+    Returns
+    -------
+    removed : int
+        The number of bytes cut off the end of the file, 0 if the file was intact.
+    """
+    size = os.path.getsize(fp)
+    with open(fp, 'rb') as infile:
+        start = infile.read(_header_prefix.size)
+    if (start[:len(RAW_FILE_MAGIC)] != RAW_FILE_MAGIC[:len(start)]):
+        raise ValueError(fp + ' is not a raw data file')
+    keep = 0
+    if (len(start) == _header_prefix.size):
+        magic, ncols, header_size = _header_prefix.unpack(start)
+        if (size >= header_size):
+            columns, header_size = readRawFileHeader(fp)
+            record_size = 8*len(columns)
+            keep = size - (size - header_size) % record_size
+    if (keep == size):
+        return 0
+    with open(fp, 'r+b') as outfile:
+        outfile.truncate(keep)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    return size - keep
+
+def recoverRawDataFolder(folder, skipped=None):
+    """
+    Runs recoverRawDataFile on every raw data file in a folder that isn't being written. Only the header of each file is read,
+    so this is quick even for long runs. Files whose lock is held (another RawDataWriter, in this or another program, still has them open) are left alone.
+
+    Parameters
+    ----------
+    folder : str
+        The folder to check.
+    skipped : [str], optional
+        If given, the names of the files that were left alone because they are being written are appended to it.
+
+    Returns
+    -------
+    recovered : {str: int}
+        The files that had a torn record and the number of bytes cut off each one.
+    """
+    recovered = {}
+    if (not os.path.isdir(folder)):
+        return recovered
+    for name in sorted(os.listdir(folder)):
+        fp = os.path.join(folder, name)
+        if (name.endswith(RAW_FILE_EXT) and os.path.isfile(fp) and os.path.getsize(fp) > 0):
+            lock = RawFileLock(fp)
+            if (not lock.acquire()):
+                if (skipped is not None):
+                    skipped.append(name)
+                continue
+            try:
+                removed = recoverRawDataFile(fp)
+            except ValueError:
+                continue #not one of ours
+            finally:
+                lock.release()
+            if (removed > 0):
+                recovered[name] = removed
+    return recovered
+
+
+class RawFileLock:
+    """
+    An operating system lock on <file>.lock, held by whoever is writing or recovering a raw data file.
+    It is dropped by the operating system if the process holding it dies, so a crash never leaves a file locked.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string.
+    """
+    def __init__(self, fp):
+        self.path = fp + LOCK_SUFFIX
+        self.lockfile = None
+
+    def acquire(self):
+        """
+        Takes the lock without waiting.
+
+        Returns
+        -------
+        acquired : bool
+            True if the lock was taken, False if someone else holds it.
+        """
+        lockfile = open(self.path, 'a+b')
+        try:
+            if (os.name == 'nt'):
+                import msvcrt
+                lockfile.seek(0)
+                msvcrt.locking(lockfile.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lockfile.close()
+            return False
+        self.lockfile = lockfile
+        return True
+
+    def release(self):
+        """
+        Releases the lock and removes the lock file. Safe to call more than once.
+        """
+        if (self.lockfile is None):
+            return
+        #windows can't remove a file that is open, elsewhere it is removed while still locked so nobody can lock it on its way out
+        if (os.name != 'nt'):
+            self.removeLockFile()
+        self.lockfile.close()
+        self.lockfile = None
+        if (os.name == 'nt'):
+            self.removeLockFile()
+
+    def removeLockFile(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass #someone else has just opened it, they will remove it
+
+
+class RawDataWriter:
+    """
+    Appends data points to a binary raw data file. Points are packed straight into the file buffer,
+    so there is no per-batch DataFrame or reopening of the file.
+    The file is fsynced in groups, see sync_every and sync_interval. An existing file is recovered (recoverRawDataFile) before appending to it.
+    The file's RawFileLock is held until the writer is closed, so recoverRawDataFolder leaves the file alone while it is being written.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string. A new file is created if it does not exist, otherwise points are appended.
+    columns : [str]
+        The names of the columns stored in each record.
+    sync_every : int or None
+        fsync once this many points have been appended since the last sync. 1 syncs every point, None only syncs on time.
+    sync_interval : float or None
+        fsync when points are appended this many seconds or more after the last sync. None only syncs on the number of points.
+        With both None the file is only synced when it is closed.
+    """
+    def __init__(self, fp, columns, sync_every=DEFAULT_SYNC_EVERY, sync_interval=DEFAULT_SYNC_INTERVAL):
+        self.fp = fp
+        self.columns = list(columns)
+        self.record = struct.Struct('<' + str(len(self.columns)) + 'd')
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.unsynced = 0 #points appended since the last sync
+        self.sync_count = 0
+        self.sync_time = 0.0 #total seconds spent in fsync
+        self.recovered = 0 #bytes of a torn record cut off an existing file
+        self.lock = RawFileLock(fp)
+        if (not self.lock.acquire()):
+            raise ValueError(fp + ' is already being written')
+        try:
+            if (rawFileHasData(fp)):
+                self.recovered = recoverRawDataFile(fp)
+            if (rawFileHasData(fp)):
+                existing, header_size = readRawFileHeader(fp)
+                if (existing != self.columns):
+                    raise ValueError(fp + ' already holds columns ' + str(existing))
+                self.outfile = open(fp, 'ab')
+            else:
+                self.outfile = open(fp, 'wb')
+                self.outfile.write(buildRawFileHeader(self.columns))
+                self.sync()
+        except Exception:
+            self.lock.release()
+            raise
+        self.last_sync = time.monotonic()
+        self.closed = False
+
+    def append(self, *values):
+        """
+        Appends a single data point.
+
+        Parameters
+        ----------
+        *values : float
+            One value per column, in column order.
+        """
+        self.outfile.write(self.record.pack(*values))
+        self.unsynced = self.unsynced + 1
+        self.syncIfDue()
+
+    def appendRows(self, rows):
+        """
+        Appends several data points at once.
+
+        Parameters
+        ----------
+        rows : 2D array
+            The data to append, one row per data point and one column per file column.
+        """
+        rows = np.ascontiguousarray(rows, dtype='<f8')
+        if (rows.ndim != 2 or rows.shape[1] != len(self.columns)):
+            raise ValueError('expected rows with ' + str(len(self.columns)) + ' columns')
+        self.outfile.write(rows.tobytes())
+        self.unsynced = self.unsynced + len(rows)
+        self.syncIfDue()
+
+    def syncIfDue(self):
+        """
+        Syncs if sync_every points have been appended or sync_interval seconds have passed since the last sync.
+        """
+        if (self.unsynced == 0):
+            return
+        if ((self.sync_every is not None) and (self.unsynced >= self.sync_every)):
+            self.sync()
+        elif ((self.sync_interval is not None) and (time.monotonic() - self.last_sync >= self.sync_interval)):
+            self.sync()
+
+    def sync(self):
+        """
+        Flushes and fsyncs the file, so every point appended so far survives a crash or power cut.
+        """
+        t0 = time.monotonic()
+        self.outfile.flush()
+        os.fsync(self.outfile.fileno())
+        self.last_sync = time.monotonic()
+        self.sync_time = self.sync_time + (self.last_sync - t0)
+        self.sync_count = self.sync_count + 1
+        self.unsynced = 0
+
+    def getSyncStatusString(self):
+        """
+        Returns how many times the file has been synced and how long that took, for the user feedback messages.
+        """
+        if (self.sync_count == 0):
+            return 'Raw data not synced to disk yet'
+        return ('Raw data synced to disk ' + str(self.sync_count) + ' times, ' + str(round(1000*self.sync_time/self.sync_count, 3))
+                + ' ms per sync, ' + str(round(self.sync_time, 3)) + ' s total')
+
+    def flush(self):
+        """
+        Flushes any buffered points to the operating system. They are only safe from a power cut once synced.
+        """
+        self.outfile.flush()
+
+    def close(self):
+        """
+        Syncs and closes the raw data file, and releases its lock.
+        """
+        if (not self.closed):
+            try:
+                self.sync()
+                self.outfile.close()
+            finally:
+                self.lock.release()
+            self.closed = True
+
+def loadRawData(fp):
+    """
+    Memory maps a raw data file for analysis. Nothing is read from disk until the data is used.
+    A partially written record at the end of the file is ignored.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string.
+
+    Returns
+    -------
+    columns : [str]
+        The names of the columns stored in each record.
+    data : np.ndarray
+        A read-only (num_points x num_columns) float64 array backed by the file.
+    """
+    columns, header_size = readRawFileHeader(fp)
+    record_size = 8*len(columns)
+    num_points = (os.path.getsize(fp) - header_size)//record_size
+    if (num_points == 0):
+        return columns, np.zeros((0, len(columns)))
+    data = np.memmap(fp, dtype='<f8', mode='r', offset=header_size, shape=(num_points, len(columns)))
+    return columns, data
+
+def getRawDataColumns(fp):
+    """
+    Returns the frequency, voltage, and time columns of a raw data file, and whether the times are intervals or timestamps.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string.
+
+    Returns
+    -------
+    freq_counter : np.ndarray
+        The frequency readings.
+    dmm  : np.ndarray
+        The dmm readings.
+    times : np.ndarray
+        The time intervals or timestamps.
+    time_is_interval : bool
+        True if the file holds time intervals (realtime app), False if it holds timestamps (batched app).
+    """
+    columns, data = loadRawData(fp)
+    time_is_interval = 'Time Interval' in columns
+    time_col = columns.index('Time Interval') if time_is_interval else columns.index('Timestamps')
+    return data[:, columns.index('Frequencies')], data[:, columns.index('Voltages')], data[:, time_col], time_is_interval
+
+def processRawDataFile(fp, metal, energy, apply_corrections=False):
+    """
+    Converts the data in a binary raw data file into the same processed format as kse.processAllData and kse.processAllData_rt.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string.
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see kse.getConversionCoefficients.
+
+    Returns
+    -------
+    df : pandas.Dataframe
+        A pandas dataframe object containing the columns Time, Keysight, DMM, and Adjusted Keysight Data.
+        Rows with an overflow value from either instrument are left out, the number rejected per column is in df.attrs['rejected'].
+    """
+    freq_c, dmm_v, times, time_is_interval = getRawDataColumns(fp)
+    df = kse.processRawArrays(freq_c, dmm_v, times, metal, energy, time_is_interval, apply_corrections)
+    return df
+
+def streamRawDataFileToCSV(fp, filepath_processed, metal, energy, chunk_size=100000, rejected=None, apply_corrections=False):
+    """
+    Converts a binary raw data file to a processed data csv one chunk at a time, so memory use does not grow with the size of the file.
+    Rows with an overflow value from either instrument are left out.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string.
+    filepath_processed : str
+        A string representing the filepath where the processed data is to be saved.
+    metal :  str
+        A string representing the alkali metal type used in the experiment.
+    energy : str
+        A string representing the appropriate energy level transition for the experiment.
+    chunk_size : int
+        The number of rows to convert at a time.
+    rejected : dict, optional
+        If given, the number of overflow values found in each raw column is added to it, keyed by column name.
+    apply_corrections : bool
+        Apply the quadratic in field and frequency corrections to the dmm conversion, see kse.getConversionCoefficients.
+
+    Returns
+    -------
+    num_rows : int
+        The number of processed rows written to filepath_processed.
+    """
+    freq_c, dmm_v, times, time_is_interval = getRawDataColumns(fp)
+    initial_V = None
+    initial_freq = None
+    initial_t = 0.0 if (time_is_interval or len(times) == 0) else times[0]
+    num_rows = 0
+    with open(filepath_processed, 'w', newline='') as outfile:
+        kse.buildProcessedDataFrame(np.zeros(0), np.zeros(0), np.zeros(0)).to_csv(outfile, index=False, header=True)
+        for start in range(0, len(freq_c), chunk_size):
+            end = start + chunk_size
+            valid, chunk_rejected = kse.getOverflowMask([freq_c[start:end], dmm_v[start:end]], ['Frequencies', 'Voltages'])
+            if (rejected is not None):
+                for name in chunk_rejected:
+                    rejected[name] = rejected.get(name, 0) + chunk_rejected[name]
+            chunk_freqs = np.array(freq_c[start:end])[valid]
+            chunk_volts = np.array(dmm_v[start:end])[valid]
+            if (len(chunk_freqs) == 0):
+                continue
+            #the dmm and frequency baselines are the first valid point in the file
+            if (initial_V is None):
+                initial_V = chunk_volts[0]
+                initial_freq = chunk_freqs[0]
+            dmm_freqs = kse.convertDMMArray(chunk_volts, metal, energy, initial_V, initial_freq, apply_corrections)
+            t_ints = kse.getTimeIntervalsArray(np.array(times[start:end])[valid], initial_t)
+            df = kse.buildProcessedDataFrame(t_ints, chunk_freqs, dmm_freqs)
+            df.to_csv(outfile, index=False, header=False)
+            num_rows = num_rows + len(df)
+    return num_rows
+
+def exportRawDataToCSV(fp, filepath_csv, chunk_size=100000):
+    """
+    Exports a binary raw data file to the csv layout the apps used to write directly.
+    Realtime files become Frequencies, Voltages, Time Interval.
+    Batched files become Frequencies, Voltages, Times, Timestamps with the human readable times filled in from the timestamps.
+
+    Parameters
+    ----------
+    fp : str
+        The file path to the raw data file as a string.
+    filepath_csv : str
+        A string representing the filepath where the csv is to be saved.
+    chunk_size : int
+        The number of rows to export at a time.
+
+    Returns
+    -------
+    num_rows : int
+        The number of rows written to filepath_csv.
+    """
+    import pandas as pd
+    columns, data = loadRawData(fp)
+    with_times = 'Timestamps' in columns
+    with open(filepath_csv, 'w', newline='') as outfile:
+        header = list(columns)
+        if (with_times):
+            header.insert(columns.index('Timestamps'), 'Times')
+        outfile.write(','.join(header) + '\n')
+        for start in range(0, len(data), chunk_size):
+            chunk = np.array(data[start:start+chunk_size])
+            df = pd.DataFrame(chunk, columns=columns)
+            if (with_times):
+                hrdates, hrtimes = util.formatTimestampsForCSV(df['Timestamps'])
+                df.insert(columns.index('Timestamps'), 'Times', hrtimes)
+            df.to_csv(outfile, index=False, header=False)
+    return len(data)
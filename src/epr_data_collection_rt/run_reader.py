@@ -0,0 +1,310 @@
+import functools
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import raw_data_store as store
+except ImportError:
+    import raw_data_store as store
+
+########## RUN READER ############################################################################################################
+# Reads just the rows in a time window out of a run file, without loading the whole run.
+#
+# Binary raw data files (.bin) are memory mapped and the window is found with a binary search on the time column.
+# Csv files (processed, or raw from either app) get a small index saved next to them as <file>.idx.npz, holding the time
+# and byte offset of every INDEX_EVERY-th row. A window read seeks straight to the nearest indexed row and only parses
+# the rows around the window. The index is extended, not rebuilt, when more rows are appended to the file.
+#
+# Times are in seconds from the start of the run, the same as the Time column of a processed file.
+# The time column has to be in increasing order, which it always is for files written by the apps.
+#
+# readRunWindow keeps the last READER_CACHE_SIZE readers, keyed by file, size and modification time, so repeated windows
+# of the same file don't reload the index or remap the file. Callers doing many reads can also hold on to a RunReader themselves.
+
+INDEX_EVERY = 1000
+INDEX_SUFFIX = '.idx.npz'
+SCAN_BLOCK = 16*1024*1024
+TIME_COLUMNS = ['Time', 'Time Interval', 'Timestamps'] #in order of preference
+READER_CACHE_SIZE = 8
+
+########################################################################################################################################
+
+
+def findTimeColumn(columns):
+    """
+    Picks the time column out of a run file's columns.
+
+    Parameters
+    ----------
+    columns : [str]
+        The column names of the file.
+
+    Returns
+    -------
+    col : int
+        The index of the time column.
+    is_timestamp : bool
+        True if the column holds timestamps rather than seconds from the start of the run.
+    """
+    for name in TIME_COLUMNS:
+        if (name in columns):
+            return columns.index(name), (name == 'Timestamps')
+    raise ValueError('No time column found, expected one of ' + ', '.join(TIME_COLUMNS))
+
+def scanCSVRows(fp, time_col, start_offset, start_row, every=INDEX_EVERY):
+    """
+    Scans a csv from start_offset to its last complete line, noting the time and byte offset of every every-th row.
+
+    Parameters
+    ----------
+    fp : str
+        The path to the csv file.
+    time_col : int
+        The index of the time column.
+    start_offset : int
+        The byte offset of the first row to scan, must be the start of a line.
+    start_row : int
+        The row number of the row at start_offset, counting from the first row after the header.
+    every : int
+        Note every this many rows.
+
+    Returns
+    -------
+    times : [float]
+        The time of each noted row.
+    offsets : [int]
+        The byte offset of each noted row.
+    num_rows : int
+        The number of complete rows in the file.
+    end_offset : int
+        The byte offset just past the last complete row.
+    """
+    times = []
+    offsets = []
+    pos = start_offset
+    row = start_row
+    carry = b''
+    with open(fp, 'rb') as infile:
+        infile.seek(start_offset)
+        block = infile.read(SCAN_BLOCK)
+        while (block):
+            buf = carry + block
+            newlines = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == 10)
+            if (len(newlines) > 0):
+                starts = np.concatenate(([0], newlines[:-1] + 1))
+                rows = row + np.arange(len(starts))
+                for i in np.flatnonzero(rows % every == 0):
+                    line = buf[starts[i]:newlines[i]]
+                    times.append(float(line.split(b',')[time_col]))
+                    offsets.append(pos + int(starts[i]))
+                row = row + len(starts)
+                consumed = int(newlines[-1]) + 1
+                pos = pos + consumed
+                carry = buf[consumed:]
+            else:
+                carry = buf
+            block = infile.read(SCAN_BLOCK)
+    return times, offsets, row, pos
+
+
+class RunReader:
+    """
+    Random access to time windows of a single run file, csv or binary.
+
+    Parameters
+    ----------
+    fp : str
+        The path to the run file.
+    save_index : bool
+        Save the csv index next to the file so the next reader doesn't have to scan the file again.
+    """
+    def __init__(self, fp, save_index=True):
+        self.fp = fp
+        self.save_index = save_index
+        self.binary = store.isRawDataFile(fp)
+        if (self.binary):
+            self.columns, self.data = store.loadRawData(fp)
+            self.time_col, self.is_timestamp = findTimeColumn(self.columns)
+        else:
+            self.columns = list(pd.read_csv(fp, nrows=0, quotechar='|').columns)
+            self.time_col, self.is_timestamp = findTimeColumn(self.columns)
+            with open(fp, 'rb') as infile:
+                infile.readline()
+                self.data_start = infile.tell()
+            self.index_times = np.zeros(0)
+            self.index_offsets = np.zeros(0, dtype=np.int64)
+            self.num_rows = 0
+            self.end_offset = self.data_start
+            self.indexed_size = -1
+            self.loadIndex()
+        self.refresh()
+
+    def getIndexPath(self):
+        return self.fp + INDEX_SUFFIX
+
+    def loadIndex(self):
+        """
+        Loads the saved csv index, if there is one that still matches the start of the file.
+        """
+        try:
+            with np.load(self.getIndexPath()) as saved:
+                times = saved['times']
+                offsets = saved['offsets']
+                num_rows = int(saved['num_rows'])
+                end_offset = int(saved['end_offset'])
+        except (OSError, KeyError, ValueError):
+            return
+        #the file can only have grown since the index was saved, otherwise it has been replaced and the index is no good
+        if ((os.path.getsize(self.fp) < end_offset) or (len(offsets) == 0) or (offsets[0] != self.data_start)):
+            return
+        self.index_times = times
+        self.index_offsets = offsets
+        self.num_rows = num_rows
+        self.end_offset = end_offset
+
+    def refresh(self):
+        """
+        Picks up rows that have been appended to the file since the reader was created.
+        """
+        if (self.binary):
+            self.columns, self.data = store.loadRawData(self.fp)
+            times = self.data[:, self.time_col]
+            self.t_offset = times[0] if (self.is_timestamp and len(times) > 0) else 0.0
+            return
+        size = os.path.getsize(self.fp)
+        if (size == self.indexed_size):
+            return
+        times, offsets, num_rows, end_offset = scanCSVRows(self.fp, self.time_col, self.end_offset, self.num_rows)
+        if (len(offsets) > 0):
+            self.index_times = np.concatenate((self.index_times, times))
+            self.index_offsets = np.concatenate((self.index_offsets, np.array(offsets, dtype=np.int64)))
+        self.num_rows = num_rows
+        self.end_offset = end_offset
+        self.indexed_size = size
+        self.t_offset = self.index_times[0] if (self.is_timestamp and len(self.index_times) > 0) else 0.0
+        if (self.save_index and len(offsets) > 0):
+            tmp = self.getIndexPath() + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp, 'wb') as outfile:
+                np.savez(outfile, times=self.index_times, offsets=self.index_offsets, num_rows=self.num_rows, end_offset=self.end_offset)
+            os.replace(tmp, self.getIndexPath())
+
+    def getNumRows(self):
+        """
+        Returns the number of rows in the run.
+        """
+        return len(self.data) if self.binary else self.num_rows
+
+    def getTimeRange(self):
+        """
+        Returns the first and last time in the run, in seconds from the start of the run.
+
+        Returns
+        -------
+        t_first : float
+            The time of the first row.
+        t_last : float
+            The time of the last row, found without reading the whole file.
+        """
+        if (self.getNumRows() == 0):
+            return 0.0, 0.0
+        if (self.binary):
+            times = self.data[:, self.time_col]
+            return float(times[0] - self.t_offset), float(times[-1] - self.t_offset)
+        last = self.readRows(self.index_offsets[-1], self.end_offset)
+        return float(self.index_times[0] - self.t_offset), float(last.iloc[-1, self.time_col] - self.t_offset)
+
+    def readRows(self, start, end):
+        """
+        Parses the csv rows between two byte offsets.
+        """
+        with open(self.fp, 'rb') as infile:
+            infile.seek(start)
+            raw = infile.read(end - start)
+        return pd.read_csv(io.BytesIO(raw), header=None, names=self.columns, quotechar='|')
+
+    def readWindow(self, t_start, t_end):
+        """
+        Returns the rows with a time between t_start and t_end (inclusive), in seconds from the start of the run.
+        Only the part of the file around the window is read.
+
+        Parameters
+        ----------
+        t_start : float
+            The start of the window.
+        t_end : float
+            The end of the window.
+
+        Returns
+        -------
+        window : pandas.Dataframe
+            The rows in the window, with the same columns as the file.
+        """
+        if (self.binary):
+            times = self.data[:, self.time_col]
+            i0 = np.searchsorted(times, t_start + self.t_offset, side='left')
+            i1 = np.searchsorted(times, t_end + self.t_offset, side='right')
+            return pd.DataFrame(np.array(self.data[i0:i1]), columns=self.columns)
+        if (self.num_rows == 0):
+            return pd.DataFrame(columns=self.columns)
+        #start from the last indexed row at or before t_start, stop at the first indexed row after t_end
+        b0 = max(np.searchsorted(self.index_times, t_start + self.t_offset, side='right') - 1, 0)
+        b1 = np.searchsorted(self.index_times, t_end + self.t_offset, side='right')
+        end = self.index_offsets[b1] if b1 < len(self.index_offsets) else self.end_offset
+        rows = self.readRows(self.index_offsets[b0], end)
+        times = rows.iloc[:, self.time_col] - self.t_offset
+        return rows[(times >= t_start) & (times <= t_end)].reset_index(drop=True)
+
+
+@functools.lru_cache(maxsize=READER_CACHE_SIZE)
+def getRunReader(fp, mtime_ns, size):
+    """
+    Returns a RunReader for a file, reusing the last one made for the same file, modification time, and size.
+    A file that has been appended to gets a new reader, which picks up the saved index and only scans the new rows.
+
+    Parameters
+    ----------
+    fp : str
+        The absolute path to the run file.
+    mtime_ns : int
+        The file's modification time in ns.
+    size : int
+        The file's size in bytes.
+
+    Returns
+    -------
+    reader : RunReader
+        The reader for the file.
+    """
+    return RunReader(fp)
+
+def clearReaderCache():
+    """
+    Forgets the cached readers, which closes the binary files they have mapped (needed on Windows before deleting or truncating them).
+    """
+    getRunReader.cache_clear()
+
+def readRunWindow(fp, t_start, t_end):
+    """
+    Returns the rows of a run file with a time between t_start and t_end (in seconds from the start of the run),
+    without loading the whole file. The reader is cached, see getRunReader.
+
+    Parameters
+    ----------
+    fp : str
+        The path to the run file, a processed csv, a raw csv, or a binary raw data file.
+    t_start : float
+        The start of the window.
+    t_end : float
+        The end of the window.
+
+    Returns
+    -------
+    window : pandas.Dataframe
+        The rows in the window, with the same columns as the file.
+    """
+    path = os.path.abspath(fp)
+    st = os.stat(path)
+    return getRunReader(path, st.st_mtime_ns, st.st_size).readWindow(t_start, t_end)
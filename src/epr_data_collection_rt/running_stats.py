@@ -0,0 +1,155 @@
+import math
+
+import numpy as np
+
+try:
+    from . import utilities as util
+except ImportError:
+    import utilities as util
+
+########## RUNNING STATISTICS ############################################################################################################
+# Statistics that are updated one sample at a time while data is being collected, so convergence can be watched live
+# without keeping or rescanning the run. RunningStats covers every sample since the start of the run (Welford's algorithm),
+# WindowedStats only the last N samples (a fixed size ring buffer, updated as the oldest sample is replaced).
+# Standard deviations are population standard deviations, the same as getAvgAndStdDev in kse_experiment_utils.
+
+DEFAULT_WINDOW = 100
+RECOMPUTE_EVERY = 100000 #windowed sums are recomputed from the ring buffer this often, so rounding errors can't build up
+
+########################################################################################################################################
+
+
+class RunningStats:
+    """
+    Mean, standard deviation, min and max of every sample added so far, using Welford's algorithm. Each sample costs O(1).
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 #sum of squared differences from the mean
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        """
+        Adds one sample.
+
+        Parameters
+        ----------
+        x : float
+            The sample.
+        """
+        self.count = self.count + 1
+        delta = x - self.mean
+        self.mean = self.mean + delta/self.count
+        self.m2 = self.m2 + delta*(x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def getVariance(self):
+        if (self.count == 0):
+            return math.nan
+        return self.m2/self.count
+
+    def getStdDev(self):
+        return math.sqrt(max(self.getVariance(), 0.0))
+
+    def getPercentError(self):
+        """
+        Returns the standard deviation as a percent of the mean, using util.percent_error.
+        """
+        if (self.count == 0 or self.mean == 0):
+            return math.nan
+        return util.percent_error(self.mean, self.getStdDev())
+
+
+class WindowedStats(RunningStats):
+    """
+    Mean and standard deviation of the last window samples. Each sample costs O(1), the samples are kept in a ring buffer
+    of size window and the oldest one is taken out of the mean and sum of squares as the new one goes in.
+    min and max are not tracked for the window, they would need the whole window rescanned.
+
+    Parameters
+    ----------
+    window : int
+        How many of the most recent samples to include.
+    """
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.clear()
+
+    def clear(self):
+        RunningStats.clear(self)
+        self.buffer = np.zeros(self.window)
+        self.next = 0 #where the next sample goes in the ring buffer
+        self.replaced = 0
+
+    def add(self, x):
+        """
+        Adds one sample, dropping the oldest one once the window is full.
+
+        Parameters
+        ----------
+        x : float
+            The sample.
+        """
+        if (self.count < self.window):
+            self.count = self.count + 1
+            delta = x - self.mean
+            self.mean = self.mean + delta/self.count
+            self.m2 = self.m2 + delta*(x - self.mean)
+        else:
+            old = self.buffer[self.next]
+            new_mean = self.mean + (x - old)/self.window
+            self.m2 = self.m2 + (x - old)*(x - new_mean + old - self.mean)
+            self.mean = new_mean
+            self.replaced = self.replaced + 1
+        self.buffer[self.next] = x
+        self.next = (self.next + 1) % self.window
+        if (self.replaced >= RECOMPUTE_EVERY):
+            self.mean = float(np.mean(self.buffer))
+            self.m2 = float(np.sum((self.buffer - self.mean)**2))
+            self.replaced = 0
+
+
+class RunStatistics:
+    """
+    Whole run and last window statistics for one quantity, with a one line summary for the GUI.
+
+    Parameters
+    ----------
+    name : str
+        What the quantity is called in the summary.
+    unit : str
+        The unit shown in the summary.
+    window : int
+        How many of the most recent samples the windowed statistics include.
+    """
+    def __init__(self, name, unit='Hz', window=DEFAULT_WINDOW):
+        self.name = name
+        self.unit = unit
+        self.total = RunningStats()
+        self.recent = WindowedStats(window)
+
+    def clear(self):
+        self.total.clear()
+        self.recent.clear()
+
+    def add(self, x):
+        self.total.add(x)
+        self.recent.add(x)
+
+    def getSummaryString(self):
+        """
+        Returns the mean, standard deviation, and percent error for the whole run and for the last window, on one line.
+        """
+        if (self.total.count == 0):
+            return self.name + ': no data yet'
+        def describe(stats):
+            return ('mean ' + util.formatter(stats.mean, 6) + ' ' + self.unit + ', std dev ' + util.formatter(stats.getStdDev(), 3) + ' ' + self.unit
+                    + ', ' + util.formatter(stats.getPercentError(), 2) + ' %')
+        return (self.name + ' (' + str(self.total.count) + ' points): ' + describe(self.total)
+                + ' | last ' + str(self.recent.count) + ': ' + describe(self.recent))
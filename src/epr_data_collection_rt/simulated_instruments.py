@@ -0,0 +1,604 @@
+import random
+import time
+
+from threading import Lock, Thread, Event
+
+########## SIMULATED INSTRUMENTS ############################################################################################################
+# Stand-ins for the pyvisa resource (Keysight 53220A frequency counter), the pymeasure Keithley2000 behind a
+# PrologixAdapter, and the nidaqmx analog output task, so the collection loops can be run and profiled without hardware.
+#
+# The DAQ task drives a simulated trigger line. Every rising edge through TRIGGER_THRESHOLD_V is a trigger for
+# both the frequency counter and the dmm, just like the BNC cable on the real setup. Only the commands the apps
+# actually send are understood; anything else is accepted and ignored.
+
+INSTRUMENT_OVERFLOW_VALUE = 9.9e37 #what the instruments report when a reading is out of range
+TRIGGER_THRESHOLD_V = 1.0
+
+KEYSIGHT_ADDR = 'USB0::0x0957::0x1807::SIM00001::INSTR'
+DMM_ADDR = 'ASRL99::INSTR'
+DAQ_DEVICE = 'SimDev1'
+
+########################################################################################################################################
+
+
+class SimulatedInstrumentError(Exception):
+    """
+    Raised by simulated instruments for injected failures and for reads that would time out on the real instrument.
+    """
+    pass
+
+
+class SimulationSettings:
+    """
+    Settings for the simulated instruments. Times are in seconds.
+
+    Parameters
+    ----------
+    keysight_latency : float
+        How long every query to the frequency counter takes.
+    dmm_latency : float
+        How long every ask to the dmm takes.
+    latency_jitter : float
+        A random extra delay between 0 and latency_jitter is added to every query.
+    write_latency : float
+        How long every write to either instrument takes.
+    base_frequency : float
+        The frequency reported by the frequency counter, in Hz.
+    frequency_noise : float
+        Standard deviation of the gaussian noise added to each frequency reading, in Hz.
+    frequency_drift : float
+        Linear drift of the frequency, in Hz per trigger.
+    base_voltage : float
+        The voltage reported by the dmm, in V.
+    voltage_noise : float
+        Standard deviation of the gaussian noise added to each voltage reading, in V.
+    overflow_probability : float
+        Chance that any single reading is the overflow value 9.9e37 instead of a real value.
+    failure_probability : float
+        Chance that any single query raises a SimulatedInstrumentError.
+    seed : int, optional
+        Seed for the random numbers, for repeatable runs.
+    """
+    def __init__(self, keysight_latency=0.0, dmm_latency=0.0, latency_jitter=0.0, write_latency=0.0,
+                 base_frequency=3.2e6, frequency_noise=1.0, frequency_drift=0.0,
+                 base_voltage=0.1, voltage_noise=1e-5,
+                 overflow_probability=0.0, failure_probability=0.0, seed=None):
+        self.keysight_latency = keysight_latency
+        self.dmm_latency = dmm_latency
+        self.latency_jitter = latency_jitter
+        self.write_latency = write_latency
+        self.base_frequency = base_frequency
+        self.frequency_noise = frequency_noise
+        self.frequency_drift = frequency_drift
+        self.base_voltage = base_voltage
+        self.voltage_noise = voltage_noise
+        self.overflow_probability = overflow_probability
+        self.failure_probability = failure_probability
+        self.seed = seed
+
+
+class SimulatedBench:
+    """
+    The simulated lab bench: owns the trigger line and creates the simulated instruments that listen to it.
+
+    Parameters
+    ----------
+    settings : SimulationSettings, optional
+        The settings to use for every instrument on the bench. Uses the defaults if not given.
+    """
+    def __init__(self, settings=None):
+        self.settings = settings if settings is not None else SimulationSettings()
+        self.rng = random.Random(self.settings.seed)
+        self.lock = Lock()
+        self.listeners = []
+        self.trigger_count = 0
+        self.line_voltage = 0.0
+
+    def newRandom(self):
+        """
+        Returns a random number generator for a single instrument, seeded from the bench so runs are repeatable.
+
+        Returns
+        -------
+        rng : random.Random
+            A new random number generator.
+        """
+        with self.lock:
+            return random.Random(self.rng.random())
+
+    def setLineVoltage(self, volts):
+        """
+        Sets the voltage on the trigger line, triggering every instrument on a rising edge.
+
+        Parameters
+        ----------
+        volts : float
+            The new voltage on the trigger line.
+        """
+        rising = (self.line_voltage < TRIGGER_THRESHOLD_V) and (volts >= TRIGGER_THRESHOLD_V)
+        self.line_voltage = volts
+        if (rising):
+            with self.lock:
+                self.trigger_count = self.trigger_count + 1
+                #instruments from earlier runs that were closed stop listening
+                self.listeners = [i for i in self.listeners if i.isConnected()]
+                listeners = list(self.listeners)
+            for instrument in listeners:
+                instrument.trigger()
+
+    def attach(self, instrument):
+        """
+        Connects an instrument to the trigger line.
+        """
+        with self.lock:
+            self.listeners.append(instrument)
+
+    def detach(self, instrument):
+        """
+        Disconnects an instrument from the trigger line.
+        """
+        with self.lock:
+            if (instrument in self.listeners):
+                self.listeners.remove(instrument)
+
+    def getResourceManager(self):
+        """
+        Returns a simulated pyvisa resource manager.
+        """
+        return SimulatedResourceManager(self)
+
+    def getSystem(self):
+        """
+        Returns a simulated nidaqmx system.
+        """
+        return SimulatedSystem()
+
+    def createTask(self):
+        """
+        Returns a simulated DAQ task that drives the trigger line.
+        """
+        return SimulatedDAQTask(self)
+
+    def createAdapter(self, address, gpib_channel_no):
+        """
+        Returns a simulated Prologix adapter.
+        """
+        return SimulatedAdapter(address, gpib_channel_no)
+
+    def createDMM(self, adapter):
+        """
+        Returns a simulated Keithley 2000 listening to the trigger line.
+        """
+        return SimulatedKeithley2000(self, adapter)
+
+
+class SimulatedInstrument:
+    """
+    Shared behaviour of the simulated instruments: latency, failure injection, and overflow injection.
+    """
+    def __init__(self, bench, latency):
+        self.bench = bench
+        self.settings = bench.settings
+        self.latency = latency
+        self.rng = bench.newRandom()
+        self.lock = Lock()
+        self.closed = False
+
+    def getTimeout(self):
+        """
+        Returns how long a query can take before it times out, in seconds, or None for no timeout.
+        """
+        return None
+
+    def delay(self, latency):
+        """
+        Sleeps for the configured latency plus a random amount of jitter.
+        Like a real instrument, gives up with a timeout error if that is longer than the connection's timeout.
+        """
+        with self.lock:
+            jitter = self.rng.random()*self.settings.latency_jitter
+        timeout = self.getTimeout()
+        if ((timeout is not None) and (latency + jitter > timeout)):
+            time.sleep(timeout)
+            raise SimulatedInstrumentError('Timeout: no response within ' + str(timeout) + ' s')
+        if (latency + jitter > 0):
+            time.sleep(latency + jitter)
+
+    def checkFailure(self, cmd):
+        """
+        Raises a SimulatedInstrumentError if the connection is closed or if a failure is injected.
+        """
+        if (self.closed):
+            raise SimulatedInstrumentError('Connection is closed')
+        with self.lock:
+            failed = self.rng.random() < self.settings.failure_probability
+        if (failed):
+            raise SimulatedInstrumentError('Simulated failure on ' + cmd)
+
+    def reading(self, base, noise, drift=0.0, n=0):
+        """
+        Generates a single reading, or the overflow value if an overflow is injected.
+        """
+        with self.lock:
+            if (self.rng.random() < self.settings.overflow_probability):
+                return INSTRUMENT_OVERFLOW_VALUE
+            return base + drift*n + self.rng.gauss(0.0, noise)
+
+    def write(self, cmd):
+        """
+        Sends one or more ';' separated commands to the instrument.
+        """
+        if (self.closed):
+            raise SimulatedInstrumentError('Connection is closed')
+        self.delay(self.settings.write_latency)
+        for part in cmd.split(';'):
+            self.command(part.strip())
+
+    def command(self, cmd):
+        """
+        Handles a single command. Subclasses pick out the commands they care about.
+        """
+        pass
+
+    def isConnected(self):
+        """
+        Returns True while the instrument is still listening to the trigger line.
+        """
+        return not self.closed
+
+    def close(self):
+        """
+        Closes the connection to the instrument.
+        """
+        self.closed = True
+        self.bench.detach(self)
+
+
+class SimulatedFrequencyCounter(SimulatedInstrument):
+    """
+    Simulated Keysight 53220A frequency counter, as returned by SimulatedResourceManager.open_resource.
+    After INIT, the first trigger produces the empty reading the real counter produces, which the apps remove with R?.
+    """
+    def __init__(self, bench, address):
+        super(SimulatedFrequencyCounter, self).__init__(bench, bench.settings.keysight_latency)
+        self.address = address
+        self.encoding = 'ascii'
+        self.source_channel = None
+        self.timeout = 2000
+        self.trig_count = 1
+        self.armed = False
+        self.first_trigger = False
+        self.triggers_seen = 0
+        self.total_triggers = 0
+        self.readings = []
+        bench.attach(self)
+
+    def getTimeout(self):
+        return self.timeout/1000 #pyvisa timeouts are in ms
+
+    def command(self, cmd):
+        super(SimulatedFrequencyCounter, self).command(cmd)
+        upper = cmd.upper()
+        if (upper == '*RST'):
+            self.trig_count = 1
+            self.armed = False
+            self.readings = []
+        elif (upper.startswith('ABOR')):
+            self.armed = False
+        elif (upper.startswith('TRIG:COUN')):
+            self.trig_count = int(float(cmd.split()[1]))
+        elif (upper == 'INIT'):
+            with self.lock:
+                self.armed = True
+                self.first_trigger = True
+                self.triggers_seen = 0
+                self.readings = []
+
+    def trigger(self):
+        """
+        Called by the bench on every rising edge of the trigger line.
+        """
+        if (not self.armed):
+            return
+        self.total_triggers = self.total_triggers + 1
+        if (self.first_trigger):
+            #the real counter hands back an empty point for the first trigger after INIT
+            with self.lock:
+                self.first_trigger = False
+                self.readings.append('')
+            return
+        value = self.reading(self.settings.base_frequency, self.settings.frequency_noise, self.settings.frequency_drift, self.total_triggers)
+        with self.lock:
+            self.readings.append('%+.15E' % value)
+            self.triggers_seen = self.triggers_seen + 1
+            if (self.triggers_seen >= self.trig_count):
+                self.armed = False
+
+    def query(self, cmd):
+        """
+        Sends a query and returns the response, like pyvisa's Resource.query.
+        """
+        self.checkFailure(cmd)
+        self.delay(self.latency)
+        upper = cmd.strip().upper()
+        if (upper == '*IDN?'):
+            return 'Keysight Technologies,53220A,SIM00001,simulated\n'
+        if (upper.startswith('R?')):
+            #read and remove everything in memory, as an IEEE 488.2 definite length block
+            with self.lock:
+                data = ','.join(self.readings)
+                self.readings = []
+            length = str(len(data))
+            return '#' + str(len(length)) + length + data + '\n'
+        if (upper.startswith('FETC?') or upper.startswith('READ?')):
+            with self.lock:
+                readings = [r for r in self.readings if r != '']
+            if (len(readings) == 0):
+                raise SimulatedInstrumentError('Timeout: no readings available for ' + cmd)
+            return ','.join(readings) + '\n'
+        return '0\n'
+
+
+class SimulatedResourceManager:
+    """
+    Simulated pyvisa ResourceManager that knows about one frequency counter and one Prologix adapter.
+    """
+    def __init__(self, bench):
+        self.bench = bench
+        self.opened = []
+        self.closed = False
+
+    def list_resources(self):
+        return (KEYSIGHT_ADDR, DMM_ADDR)
+
+    def list_opened_resources(self):
+        return [r for r in self.opened if not r.closed]
+
+    def open_resource(self, address):
+        if (self.closed):
+            raise SimulatedInstrumentError('Resource manager is closed')
+        resource = SimulatedFrequencyCounter(self.bench, address)
+        self.opened.append(resource)
+        return resource
+
+    def close(self):
+        for r in self.opened:
+            r.close()
+        self.closed = True
+
+
+class SimulatedAdapter:
+    """
+    Simulated pymeasure PrologixAdapter.
+    """
+    def __init__(self, address, gpib_channel_no):
+        self.address = address
+        self.gpib_channel_no = gpib_channel_no
+        self.timeout = None #ms, like the pyvisa connection of the real adapter
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class SimulatedKeithley2000(SimulatedInstrument):
+    """
+    Simulated pymeasure Keithley2000. Takes one reading per trigger after INIT, up to TRIG:COUN readings,
+    and keeps them in the trace buffer when TRAC:FEED is set.
+    """
+    def __init__(self, bench, adapter):
+        super(SimulatedKeithley2000, self).__init__(bench, bench.settings.dmm_latency)
+        self.adapter = adapter
+        self.trig_count = 1
+        self.trace_points = 0
+        self.trace_enabled = False
+        self.armed = False
+        self.triggers_seen = 0
+        self.total_triggers = 0
+        self.last_reading = None
+        self.buffer = []
+        bench.attach(self)
+
+    def getTimeout(self):
+        if (self.adapter.timeout is None):
+            return None
+        return self.adapter.timeout/1000
+
+    def reset(self):
+        """
+        Resets the dmm, like pymeasure's Keithley2000.reset.
+        """
+        self.write('*RST')
+
+    def command(self, cmd):
+        super(SimulatedKeithley2000, self).command(cmd)
+        upper = cmd.upper()
+        if (upper == '*RST'):
+            self.trig_count = 1
+            self.trace_points = 0
+            self.trace_enabled = False
+            self.armed = False
+            self.buffer = []
+            self.last_reading = None
+        elif (upper.startswith('ABOR')):
+            self.armed = False
+        elif (upper.startswith('TRIG:COUN')):
+            self.trig_count = int(float(cmd.split()[1]))
+        elif (upper.startswith('TRAC:POIN')):
+            self.trace_points = int(float(cmd.split()[1]))
+        elif (upper.startswith('TRAC:CLE')):
+            self.buffer = []
+        elif (upper.startswith('TRAC:FEED') or upper.startswith('FEED:CONT')):
+            self.trace_enabled = not upper.endswith('NONE') and not upper.endswith('NEV')
+        elif (upper == 'INIT'):
+            with self.lock:
+                self.armed = True
+                self.triggers_seen = 0
+                self.last_reading = None
+                if (self.trace_enabled):
+                    self.buffer = []
+
+    def trigger(self):
+        """
+        Called by the bench on every rising edge of the trigger line.
+        """
+        if (not self.armed):
+            return
+        self.total_triggers = self.total_triggers + 1
+        value = self.reading(self.settings.base_voltage, self.settings.voltage_noise)
+        with self.lock:
+            self.last_reading = '%+.8E' % value
+            if (self.trace_enabled and len(self.buffer) < max(self.trace_points, 1)):
+                self.buffer.append(self.last_reading)
+            self.triggers_seen = self.triggers_seen + 1
+            if (self.triggers_seen >= self.trig_count):
+                self.armed = False
+
+    def ask(self, cmd):
+        """
+        Sends a query and returns the response, like pymeasure's Instrument.ask.
+        """
+        self.checkFailure(cmd)
+        self.delay(self.latency)
+        upper = cmd.strip().upper()
+        if (upper == '*IDN?'):
+            return 'KEITHLEY INSTRUMENTS INC.,MODEL 2000,SIM00002,simulated\n'
+        if (upper.startswith('TRAC:DATA?')):
+            with self.lock:
+                return ','.join(self.buffer) + '\n'
+        if (upper.startswith('FETC?') or upper.startswith('READ?')):
+            with self.lock:
+                reading = self.last_reading
+            if (reading is None):
+                raise SimulatedInstrumentError('Timeout: no reading available for ' + cmd)
+            return reading + '\n'
+        return '0\n'
+
+    def isConnected(self):
+        """
+        Returns True while the instrument and its adapter are open.
+        """
+        return (not self.closed) and (not self.adapter.closed)
+
+
+class SimulatedAOChannels:
+    def __init__(self):
+        self.channel_names = []
+
+    def add_ao_voltage_chan(self, physical_channel, *args, **kwargs):
+        self.channel_names.append(physical_channel)
+
+
+class SimulatedTiming:
+    def __init__(self):
+        self.samp_clk_rate = None
+        self.samp_quant_samp_mode = None
+        self.samp_quant_samp_per_chan = 0
+
+    def cfg_samp_clk_timing(self, rate, source='', active_edge=None, sample_mode=None, samps_per_chan=1000):
+        self.samp_clk_rate = float(rate)
+        self.samp_quant_samp_mode = sample_mode
+        self.samp_quant_samp_per_chan = samps_per_chan
+
+
+class SimulatedDAQTask:
+    """
+    Simulated nidaqmx.Task with a single analog output channel wired to the bench trigger line.
+    Without sample clock timing every write sets the line right away. Once cfg_samp_clk_timing has been called,
+    write() loads a finite waveform that start() plays out on a background thread at the sample clock rate.
+    """
+    def __init__(self, bench):
+        self.bench = bench
+        self.ao_channels = SimulatedAOChannels()
+        self.timing = SimulatedTiming()
+        self.running = False
+        self.closed = False
+        self.samples_written = 0
+        self.waveform = None
+        self.player = None
+        self.abort = Event()
+
+    def start(self):
+        if (self.closed):
+            raise SimulatedInstrumentError('Task is closed')
+        self.running = True
+        if ((self.timing.samp_clk_rate is not None) and (self.waveform is not None)):
+            self.abort.clear()
+            self.player = Thread(target=self.play, args=(self.waveform,), daemon=True)
+            self.player.start()
+
+    def play(self, waveform):
+        """
+        Plays out a waveform on the trigger line, one sample per sample clock tick.
+        Only changes in voltage are sent to the line, and each one is timed from the start so the clock doesn't drift.
+        """
+        period = 1.0/self.timing.samp_clk_rate
+        t0 = time.perf_counter()
+        last = None
+        for i in range(0, len(waveform)):
+            v = float(waveform[i])
+            if (v != last):
+                wait = t0 + i*period - time.perf_counter()
+                if (wait > 0 and self.abort.wait(wait)):
+                    return
+                self.bench.setLineVoltage(v)
+                last = v
+        #the last sample is held until the end of its clock period
+        wait = t0 + len(waveform)*period - time.perf_counter()
+        if (wait > 0):
+            self.abort.wait(wait)
+
+    def is_task_done(self):
+        if (self.closed):
+            raise SimulatedInstrumentError('Task is closed')
+        return (self.player is None) or (not self.player.is_alive())
+
+    def wait_until_done(self, timeout=10.0):
+        if (self.player is not None):
+            self.player.join(timeout)
+            if (self.player.is_alive()):
+                raise SimulatedInstrumentError('Waveform output did not finish within ' + str(timeout) + ' s')
+
+    def stop(self):
+        self.abort.set()
+        if ((self.player is not None) and (self.player.is_alive())):
+            self.player.join()
+        self.player = None
+        self.running = False
+
+    def write(self, data, auto_start=True, timeout=10.0):
+        if (self.closed):
+            raise SimulatedInstrumentError('Task is closed')
+        if (self.timing.samp_clk_rate is not None):
+            #hardware timed, load the waveform for the next start()
+            self.waveform = list(data)
+            self.samples_written = self.samples_written + len(self.waveform)
+            if (auto_start):
+                self.start()
+            return len(self.waveform)
+        self.bench.setLineVoltage(float(data))
+        self.samples_written = self.samples_written + 1
+        return 1
+
+    def close(self):
+        self.stop()
+        self.closed = True
+
+
+class SimulatedPhysicalChannels:
+    def __init__(self, names):
+        self.channel_names = names
+
+
+class SimulatedDevice:
+    def __init__(self, name):
+        self.name = name
+        self.ao_physical_chans = SimulatedPhysicalChannels([name + '/ao0', name + '/ao1'])
+
+
+class SimulatedSystem:
+    """
+    Simulated nidaqmx.system.System with a single DAQ device.
+    """
+    def __init__(self):
+        self.devices = [SimulatedDevice(DAQ_DEVICE)]
@@ -1,7 +1,7 @@
 import datetime
+import time
 import numpy as np
 import csv
-import pandas as pd
 
 from os import path
 from datetime import date
@@ -149,9 +149,34 @@ def stringToPandasSeries(strg, delimiter):
     #assumes a string where data can be broken up by a delimiter
     strg = strg.replace('\n', '')#check if there is a newline at the end of the string and remove if present
     arry = strg.split(delimiter)
+    import pandas as pd #imported here so the apps don't have to load pandas to start up
     series = pd.Series(arry)
     return series
 
+def parseDefiniteLengthBlock(resp):
+    """
+    Takes an IEEE 488.2 definite length block (what the keysight returns for R?) and returns the comma separated readings in it.
+    
+    Parameters
+    ----------
+    resp : str
+        The instrument response, of the form #<number of digits><length><data>.
+
+    Returns
+    -------
+    readings : [str]
+        The readings in the block, as strings. Empty readings are kept, so their position is not lost.
+    """
+    resp = resp.strip()
+    if (not resp.startswith('#')):
+        return resp.split(',')
+    n_digits = int(resp[1])
+    length = int(resp[2:2+n_digits])
+    data = resp[2+n_digits:2+n_digits+length]
+    if (data == ''):
+        return []
+    return data.split(',')
+
 def dtStringForFilename():
     """
     Returns the current datetime as a string, formatted for use in a filename.  
@@ -190,6 +215,7 @@ def timestampToArray(ts):
 def formatTimestampsForCSV(times):
     """
     Takes an array of timestamps and converts it to two arrays, one containing all the dates, the other containing all the times, to be used in data collection files. 
+    The whole array is converted at once with datetime64, the strings are the same as timestampToArray gives for each timestamp (local time).
     
     Parameters
     ---------- 
@@ -204,14 +230,46 @@ def formatTimestampsForCSV(times):
         A string array containing the collection times.
 
     """
-    arry_0 = []
-    arry_1 = []
-    for x in times:
-        temp = timestampToArray(x)
-        arry_0.append(temp[0])
-        arry_1.append(temp[1])
+    times = np.asarray(times, dtype=np.float64).ravel()
+    if (len(times) == 0):
+        return ([], [])
+    #split into whole seconds and microseconds the same way datetime.fromtimestamp does, so the rounding matches
+    secs = np.floor(times)
+    us = np.round((times - secs)*1e6).astype(np.int64)
+    #shift to local time, then let datetime64 do the calendar, giving YYYY-MM-DDTHH:MM:SS.ffffff
+    local_us = (secs.astype(np.int64) + getUTCOffsets(secs))*1000000 + us
+    stamps = np.datetime_as_string(local_us.astype('datetime64[us]'), unit='us')
+    arry_0 = stamps.astype('U10').tolist()
+    arry_1 = [s[11:] for s in stamps.tolist()]
+    #str(datetime) leaves the fraction off completely when it is exactly 0
+    for i in np.flatnonzero(us % 1000000 == 0):
+        arry_1[i] = arry_1[i][:8]
     return (arry_0, arry_1)
 
+def getUTCOffsets(secs):
+    """
+    Returns the local UTC offset in seconds for each timestamp, taking daylight saving changes into account.  
+    
+    Parameters
+    ---------- 
+    secs: np.ndarray
+        An array of timestamps in whole seconds. 
+
+    Returns
+    -------
+    offsets : np.ndarray or int
+        The offset for each timestamp, or a single offset if it is the same for all of them.
+    """
+    first = time.localtime(secs.min()).tm_gmtoff
+    last = time.localtime(secs.max()).tm_gmtoff
+    if ((first == last) and (secs.max() - secs.min() <= 86400)):
+        #the usual case, a run within a day that doesn't cross a daylight saving change
+        return first
+    #otherwise look the offset up once per 15 minutes of data, offset changes always happen on a 15 minute boundary
+    buckets, inverse = np.unique(np.floor(secs/900), return_inverse=True)
+    bucket_offsets = np.array([time.localtime(b*900).tm_gmtoff for b in buckets], dtype=np.int64)
+    return bucket_offsets[inverse.ravel()]
+
 def get_connected_instruments(rm):
     """
     Gets a list of all instruments connected to the computer via NiVisa. 
@@ -0,0 +1,27 @@
+import pytest
+
+import src.epr_data_collection_rt.instrument_backends as backends
+import src.epr_data_collection_rt.kse_acquisition as acq
+import src.epr_data_collection_rt.simulated_instruments as sim
+
+
+@pytest.fixture
+def acquisition(tmp_path):
+    """
+    A RealtimeAcquisition set up to run on the simulated instruments, with no waiting between trigger pulses.
+    """
+    backends.useSimulatedInstruments()
+    a = acq.RealtimeAcquisition()
+    a.folder = str(tmp_path)
+    a.keysight_addr = sim.KEYSIGHT_ADDR
+    a.dmm_addr = sim.DMM_ADDR
+    a.daq_path = sim.DAQ_DEVICE + '/ao0'
+    a.alkali_metal = 'rb85'
+    a.energy_level = 'high'
+    a.high_time = 0.0
+    a.low_time = 0.0
+    a.init_pulse_time = 0.0
+    a.on_status = None
+    yield a
+    a.close()
+    backends.useHardwareInstruments()
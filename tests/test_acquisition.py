@@ -0,0 +1,73 @@
+import os
+import threading
+
+import pytest
+
+import src.epr_data_collection_rt.kse_acquisition as acq
+
+
+def writerThreads():
+    return [t for t in threading.enumerate() if t.name == 'QueuedWriter' and t.is_alive()]
+
+
+def test_run_writes_files(acquisition):
+    acquisition.connect()
+    acquisition.run(max_points=20)
+    names = sorted(os.listdir(acquisition.folder))
+    assert acquisition.points_collected == 20
+    assert acquisition.filename in names
+    assert acquisition.processed_filename in names
+    assert acquisition.metrics_filename in names
+
+def test_failed_connect_leaves_no_files(acquisition):
+    def broken(*args):
+        raise RuntimeError('no dmm')
+    acquisition.session.getDMM = broken
+    before = len(writerThreads())
+    with pytest.raises(RuntimeError):
+        acquisition.connect()
+    assert os.listdir(acquisition.folder) == []
+    assert acquisition.writer is None
+    assert len(writerThreads()) == before
+
+def test_connecting_twice_finishes_the_first_files(acquisition):
+    acquisition.connect()
+    first_writer = acquisition.writer
+    acquisition.connect()
+    assert first_writer is not acquisition.writer
+    assert not first_writer.thread.is_alive()
+    acquisition.run(max_points=5)
+
+def test_dmm_timeout_reconnects_the_dmm(acquisition):
+    acquisition.dmm_timeout = 0.05
+    acquisition.connect()
+    slow_dmm = acquisition.dmm
+    slow_dmm.latency = 1.0 #longer than its timeout, so the first read back fails
+    acquisition.run(max_points=5)
+    assert acquisition.points_collected == 5
+    assert acquisition.dmm is not slow_dmm
+    assert acquisition.session.adapter.timeout == 50
+
+def test_stuck_read_is_not_reused(acquisition, monkeypatch):
+    monkeypatch.setattr(acq, 'FETCH_GRACE', 0.05)
+    acquisition.keysight_timeout = 0.05
+    acquisition.dmm_timeout = 0.05
+    acquisition.connect()
+    stuck_counter = acquisition.freq_counter
+    query = stuck_counter.query
+    release = threading.Event()
+    calls = []
+    def hang(cmd):
+        if (cmd != 'FETC?'):
+            return query(cmd)
+        calls.append(cmd)
+        release.wait(5) #a driver that ignores its timeout
+        return '0'
+    stuck_counter.query = hang
+    try:
+        acquisition.run(max_points=5)
+    finally:
+        release.set()
+    assert acquisition.points_collected == 5
+    assert len(calls) == 1
+    assert acquisition.freq_counter is not stuck_counter
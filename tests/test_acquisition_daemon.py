@@ -0,0 +1,58 @@
+import time
+from threading import Thread
+
+import pytest
+
+import src.epr_data_collection_rt.instrument_backends as backends
+import src.epr_data_collection_rt.kse_acquisition as acq
+import src.epr_data_collection_rt.kse_acquisition_daemon as kad
+import src.epr_data_collection_rt.simulated_instruments as sim
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    backends.useSimulatedInstruments()
+    a = acq.RealtimeAcquisition()
+    kad.applySettings(a, {'folder': str(tmp_path), 'keysight_addr': sim.KEYSIGHT_ADDR, 'dmm_addr': sim.DMM_ADDR,
+                          'daq_path': sim.DAQ_DEVICE + '/ao0', 'alkali_metal': 'rb85', 'energy_level': 'high',
+                          'high_time': 0.0, 'low_time': 0.0, 'init_pulse_time': 0.0})
+    d = kad.AcquisitionDaemon(a, port=0)
+    d.status = lambda msg: None
+    yield d
+    d.stop()
+    a.close()
+    d.server.server_close()
+    backends.useHardwareInstruments()
+
+
+def test_status_is_answered_while_stopping(daemon):
+    assert daemon.handleCommand('start')['running']
+    #a slow last point, like a long hardware timed batch
+    daemon.acquisition.low_time = 1.0
+    time.sleep(0.1)
+    stopping = Thread(target=daemon.handleCommand, args=('stop',))
+    stopping.start()
+    time.sleep(0.1)
+    t0 = time.monotonic()
+    reply = daemon.handleCommand('status')
+    assert time.monotonic() - t0 < 0.5
+    assert reply['ok']
+    stopping.join()
+    assert not daemon.handleCommand('status')['running']
+
+def test_start_twice_is_refused(daemon):
+    assert daemon.handleCommand('start')['ok']
+    reply = daemon.handleCommand('start')
+    assert not reply['ok']
+    assert 'already running' in reply['error']
+    assert daemon.handleCommand('stop')['ok']
+
+def test_bool_settings_must_be_bools():
+    a = acq.RealtimeAcquisition()
+    kad.applySettings(a, {'hardware_timing': True, 'points_per_arm': '5'})
+    assert a.hardware_timing is True
+    assert a.points_per_arm == 5
+    for value in ['false', 0, None]:
+        with pytest.raises(ValueError):
+            kad.applySettings(a, {'hardware_timing': value})
+    assert a.hardware_timing is True
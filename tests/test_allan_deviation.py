@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.epr_data_collection_rt.allan_deviation as ad
+
+
+def whiteFrequencyNoise(n, sigma=2.0):
+    rng = np.random.default_rng(6)
+    return 3.2e6 + rng.normal(0, sigma, n)
+
+def naiveAllanDeviation(y, m):
+    #straight from the definition, half the mean squared difference of adjacent m point averages, every start point
+    averages = np.array([np.mean(y[j:j+m]) for j in range(0, len(y) - m + 1)])
+    diffs = averages[m:] - averages[:-m]
+    return np.sqrt(np.mean(diffs**2)/2)
+
+def naiveModifiedAllanDeviation(y, m, tau0):
+    #NIST SP 1065 eq. 14, from the phase x with one explicit sum per term
+    x = np.concatenate(([0.0], np.cumsum(y - np.mean(y))*tau0))
+    n = len(x) - 3*m + 1
+    total = 0.0
+    for j in range(0, n):
+        inner = 0.0
+        for i in range(j, j + m):
+            inner = inner + x[i+2*m] - 2*x[i+m] + x[i]
+        total = total + inner**2
+    return np.sqrt(total/(2*m**4*tau0**2*n))
+
+
+def test_overlapping_matches_naive_reference(monkeypatch):
+    #small blocks, so the sums cross several block boundaries
+    monkeypatch.setattr(ad, 'BLOCK_SIZE', 97)
+    y = whiteFrequencyNoise(2000)
+    ms = np.array([1, 2, 5, 17, 100, 999])
+    taus, adev, errors = ad.overlappingAllanDeviation(y, 0.8, ms)
+    assert np.array_equal(taus, ms*0.8)
+    for (m, value) in zip(ms, adev):
+        assert value == pytest.approx(naiveAllanDeviation(y, m), rel=1e-9)
+
+def test_modified_matches_naive_reference(monkeypatch):
+    monkeypatch.setattr(ad, 'BLOCK_SIZE', 97)
+    y = whiteFrequencyNoise(600)
+    ms = np.array([1, 2, 5, 17, 100, 200])
+    taus, mdev, errors = ad.modifiedAllanDeviation(y, 0.8, ms)
+    assert len(mdev) == len(ms)
+    for (m, value) in zip(ms, mdev):
+        assert value == pytest.approx(naiveModifiedAllanDeviation(y, m, 0.8), rel=1e-9)
+
+def test_white_frequency_noise_averages_down():
+    #for white frequency noise the Allan deviation is sigma/sqrt(m), and the modified one is sigma/sqrt(2m) for large m
+    y = whiteFrequencyNoise(200000)
+    ms = np.array([1, 10, 100])
+    taus, adev, errors = ad.overlappingAllanDeviation(y, 1.0, ms)
+    assert adev == pytest.approx(2.0/np.sqrt(ms), rel=0.1)
+    taus, mdev, errors = ad.modifiedAllanDeviation(y, 1.0, np.array([100]))
+    assert mdev[0] == pytest.approx(2.0/np.sqrt(200), rel=0.1)
+
+def test_streaming_matches_batch():
+    y = whiteFrequencyNoise(500)
+    ms = [1, 3, 10, 40]
+    streaming = ad.StreamingAllanDeviation(0.8, ms)
+    streaming.addPoints(y)
+    taus, adev, mdev = streaming.getDeviations()
+    assert adev == pytest.approx(ad.overlappingAllanDeviation(y, 0.8, ms)[1], rel=1e-6)
+    assert mdev == pytest.approx(ad.modifiedAllanDeviation(y, 0.8, ms)[1], rel=1e-6)
+
+def test_processed_deviations_columns():
+    y = whiteFrequencyNoise(300)
+    df = pd.DataFrame({'Time': 0.8*np.arange(300), 'Keysight': y, 'Adjusted Keysight Data': y - 1.0})
+    deviations = ad.getProcessedAllanDeviations(df)
+    assert list(deviations.columns) == ['Tau', 'Keysight ADEV', 'Keysight MDEV', 'Adjusted Keysight Data ADEV', 'Adjusted Keysight Data MDEV']
+    assert deviations['Tau'].iloc[0] == pytest.approx(0.8)
+    assert np.allclose(deviations['Keysight ADEV'], deviations['Adjusted Keysight Data ADEV'])
@@ -0,0 +1,63 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+import src.epr_data_collection_rt.batch_processing as bp
+import src.epr_data_collection_rt.kse_experiment_utils as kse
+import src.epr_data_collection_rt.raw_data_store as store
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def makeRunFolder(folder):
+    """
+    A run folder with a good raw csv, a good binary raw file, a corrupt raw csv, and a file that isn't a run at all.
+    """
+    os.makedirs(folder)
+    good_csv = os.path.join(folder, '2026-01-01-10_00_00.123456.csv')
+    shutil.copy(os.path.join(DATA_DIR, 'raw_rt.csv'), good_csv)
+    good_bin = os.path.join(folder, '2026-01-01-11_00_00.000001.bin')
+    rng = np.random.default_rng(7)
+    writer = store.RawDataWriter(good_bin, store.RT_COLUMNS, None, None)
+    writer.appendRows(np.column_stack([3.2e6 + rng.normal(0, 5, 30), 0.1 + rng.normal(0, 1e-4, 30), 0.8*np.arange(30)]))
+    writer.close()
+    corrupt = os.path.join(folder, '2026-01-01-12_00_00.000002.csv')
+    with open(corrupt, 'w') as outfile:
+        outfile.write('Frequencies,Voltages,Time Interval\n12652680.1,0.1,0.0\nnot,a,number\n')
+    with open(os.path.join(folder, 'notes.csv'), 'w') as outfile:
+        outfile.write('not a run\n')
+    return good_csv, good_bin, corrupt
+
+
+def test_batch_processing_with_a_corrupt_file(tmp_path, monkeypatch):
+    folder = str(tmp_path / 'runs')
+    good_csv, good_bin, corrupt = makeRunFolder(folder)
+    summary_fp = str(tmp_path / 'summary.csv')
+    monkeypatch.setattr(sys, 'argv', ['batch_processing', folder, '--metal', 'rb85', '--energy', 'high', '--workers', '2',
+                                      '--cache-dir', str(tmp_path / 'cache'), '--summary', summary_fp])
+    bp.main()
+
+    #the good files are processed the same as processing them directly
+    for (fp, process) in [(good_csv, kse.processAllData_rt), (good_bin, store.processRawDataFile)]:
+        processed = pd.read_csv(bp.getProcessedFilename(fp))
+        expected = process(fp, 'rb85', 'high')
+        np.testing.assert_allclose(processed.to_numpy(), expected.to_numpy(), rtol=1e-15, atol=1e-9)
+    assert not os.path.exists(bp.getProcessedFilename(corrupt))
+
+    summary = pd.read_csv(summary_fp)
+    assert list(summary.columns) == bp.SUMMARY_COLUMNS
+    assert list(summary['File']) == [good_csv, good_bin, corrupt]
+    rows = summary.set_index('File')
+    assert rows.loc[good_csv, 'Rows'] == 8
+    assert rows.loc[good_csv, 'Rows Read'] == 12
+    assert rows.loc[good_csv, 'Frequency Overflows'] == 2
+    assert rows.loc[good_csv, 'DMM Overflows'] == 3
+    assert rows.loc[good_bin, 'Rows'] == 30
+    assert pd.isna(rows.loc[good_csv, 'Error'])
+    assert pd.isna(rows.loc[good_bin, 'Error'])
+    assert rows.loc[corrupt, 'Error'].startswith('ValueError')
+    assert pd.isna(rows.loc[corrupt, 'Rows'])
@@ -0,0 +1,78 @@
+import src.epr_data_collection_rt.instrument_backends as backends
+import src.epr_data_collection_rt.instrument_session as session
+import src.epr_data_collection_rt.simulated_instruments as sim
+
+
+CONFIG = ['CONF:FREQ', 'TRIG:SOUR EXT', 'TRIG:SLOP POS', 'TRIG:COUN 1']
+
+
+def test_nothing_to_send_when_unchanged():
+    assert session.getCommandsToSend(CONFIG, CONFIG) == []
+    assert session.getCommandsToSend(CONFIG, []) == []
+
+def test_everything_is_sent_to_a_new_connection():
+    assert session.getCommandsToSend([], CONFIG) == CONFIG
+
+def test_resending_starts_at_the_first_changed_command():
+    wanted = CONFIG[:3] + ['TRIG:COUN 10']
+    assert session.getCommandsToSend(CONFIG, wanted) == ['TRIG:COUN 10']
+    #an early change resends everything after it too, even the commands that are the same
+    wanted = ['CONF:FREQ', 'TRIG:SOUR IMM', 'TRIG:SLOP POS', 'TRIG:COUN 1']
+    assert session.getCommandsToSend(CONFIG, wanted) == wanted[1:]
+
+def test_added_commands_are_sent():
+    assert session.getCommandsToSend(CONFIG[:2], CONFIG) == CONFIG[2:]
+
+def test_session_only_sends_the_changes():
+    backends.useSimulatedInstruments()
+    s = session.InstrumentSession()
+    try:
+        counter = s.getFrequencyCounter(sim.KEYSIGHT_ADDR, CONFIG, 1.0)
+        sent = []
+        write = counter.write
+        def recordingWrite(cmd):
+            sent.append(cmd)
+            return write(cmd)
+        counter.write = recordingWrite
+        assert s.getFrequencyCounter(sim.KEYSIGHT_ADDR, CONFIG[:3] + ['TRIG:COUN 10'], 1.0) is counter
+        #the reused connection gets its measurement aborted, then only the changed trigger count
+        assert sent == ['ABOR', '*CLS', 'TRIG:COUN 10']
+    finally:
+        s.close()
+        backends.useHardwareInstruments()
+
+class VisaConnection:
+    #stands in for a pyvisa resource, timeouts in ms
+    visalib = None
+    timeout = 2000
+
+class SerialConnection:
+    #stands in for a pyserial port, timeouts in seconds
+    baudrate = 9600
+    timeout = 2.0
+
+class FakeAdapter:
+    def __init__(self, connection=None):
+        self.connection = connection
+
+def test_dmm_timeout_is_set_in_the_connections_unit():
+    backends.useHardwareInstruments()
+    adapter = FakeAdapter(VisaConnection())
+    assert backends.setDMMTimeout(adapter, 5.0)
+    assert adapter.connection.timeout == 5000
+    adapter = FakeAdapter(SerialConnection())
+    assert backends.setDMMTimeout(adapter, 5.0)
+    assert adapter.connection.timeout == 5.0
+    #anything else is left alone
+    assert not backends.setDMMTimeout(FakeAdapter(), 5.0)
+    assert not backends.setDMMTimeout(object(), 5.0)
+    unknown = FakeAdapter(type('Connection', (), {'timeout': 7})())
+    assert not backends.setDMMTimeout(unknown, 5.0)
+    assert unknown.connection.timeout == 7
+    backends.useSimulatedInstruments()
+    try:
+        adapter = sim.SimulatedAdapter(sim.DMM_ADDR, 1)
+        assert backends.setDMMTimeout(adapter, 5.0)
+        assert adapter.timeout == 5000
+    finally:
+        backends.useHardwareInstruments()
@@ -0,0 +1,192 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+
+import src.epr_data_collection_rt.kse_experiment_utils as kse
+
+
+M_CONV_F = kse.getMagetometerConversionFactor(kse.conv_fact_V, kse.conv_fact_G, kse.B_field_gain) #Gauss/V
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+RT_CSV = os.path.join(DATA_DIR, 'raw_rt.csv') #Frequencies, Voltages, Time Interval, with overflow rows
+BATCHED_CSV = os.path.join(DATA_DIR, 'raw_batched.csv') #Frequencies, Voltages, Times, Timestamps, the same readings
+
+
+def baselineProcess(fp, metal, energy, col_time, time_is_interval):
+    """
+    The original row by row processing, kept here as the reference for the vectorized version.
+    Overflow rows are dropped first, the way removeAllOverflowVals did before the data was processed.
+    """
+    with open(fp, 'r') as infile:
+        rows = list(csv.reader(infile, delimiter=",", quotechar='|'))[1:]
+    first_time = float(rows[0][col_time])
+    rows = [row for row in rows if abs(float(row[0])) <= kse.overflow_threshold and abs(float(row[1])) <= kse.overflow_threshold]
+    convf = M_CONV_F*kse.gyromagnetic_ratios[(metal, energy)]
+    initial_V = float(rows[0][1])
+    t_ints, freq_c, dmm_freqs, freq_c_adj = [], [], [], []
+    for row in rows:
+        t = float(row[col_time])
+        t_ints.append(t if time_is_interval else t - first_time)
+        freq_c.append(float(row[0]))
+        dmm_freqs.append((float(row[1])-initial_V)*convf)
+        freq_c_adj.append(freq_c[-1]-dmm_freqs[-1])
+    return t_ints, freq_c, dmm_freqs, freq_c_adj
+
+def assertMatchesBaseline(df, expected):
+    assert list(df.columns) == ['Time', 'Keysight', 'DMM', 'Adjusted Keysight Data']
+    for (col, values) in zip(df.columns, expected):
+        np.testing.assert_allclose(df[col].to_numpy(), values, rtol=1e-12, atol=1e-9)
+
+
+def test_conversion_table_matches_the_registry():
+    table, frequency_table = kse.buildConversionTable()
+    assert set(table) == set(kse.gyromagnetic_ratios)
+    for (key, ratio) in kse.gyromagnetic_ratios.items():
+        quadratic = kse.quadratic_field_coefficients.get(key, 0.0)
+        assert table[key] == pytest.approx((M_CONV_F*ratio, M_CONV_F*M_CONV_F*quadratic), rel=1e-15)
+        (slope, reference) = frequency_table[key]
+        assert slope == pytest.approx(2*M_CONV_F*quadratic/ratio, rel=1e-15)
+        assert reference == kse.reference_frequencies[key]
+    assert table == kse.conversion_table
+    assert frequency_table == kse.frequency_correction_table
+
+def test_register_conversion():
+    key = ('k39', 'high')
+    try:
+        kse.registerConversion('k39', 'high', -700000.0, -150.0, 15000000.0)
+        assert kse.getConversionCoefficients('k39', 'high') == pytest.approx((-700.0, 0.0))
+        (linear, quadratic) = kse.getConversionCoefficients('k39', 'high', 15001000.0, True)
+        assert linear == pytest.approx(-700.0 + 2*M_CONV_F*-150.0/-700000.0*1000.0)
+        assert quadratic == pytest.approx(-150.0*M_CONV_F*M_CONV_F)
+        #registering again without a reference frequency drops the frequency correction
+        kse.registerConversion('k39', 'high', -700000.0, -150.0)
+        assert key not in kse.frequency_correction_table
+        assert kse.getConversionCoefficients('k39', 'high', 15001000.0, True) == pytest.approx((-700.0, -150.0*M_CONV_F*M_CONV_F))
+    finally:
+        for registry in [kse.gyromagnetic_ratios, kse.quadratic_field_coefficients, kse.reference_frequencies, kse.conversion_table, kse.frequency_correction_table]:
+            registry.pop(key, None)
+
+def test_unknown_metal_converts_to_zero():
+    assert kse.getConversionCoefficients('na23', 'high', 1e7, True) == (0.0, 0.0)
+
+def test_linear_conversion_is_the_default():
+    rng = np.random.default_rng(3)
+    volts = 0.1 + rng.normal(0, 1e-2, 100)
+    freqs = 12.6e6 + rng.normal(0, 5, 100)
+    ratio = kse.gyromagnetic_ratios[('rb85', 'high')]
+    #the original conversion, dV times the gyromagnetic ratio times the magnetometer conversion factor
+    linear = (volts - volts[0])*M_CONV_F*ratio
+    df = kse.processRawArrays(freqs, volts, 0.8*np.arange(100), 'rb85', 'high', True)
+    np.testing.assert_allclose(df['DMM'], linear, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(kse.convertDMMData(volts, 'rb85', 'high', freqs[0]), linear, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(kse.convertDMMArray(volts, 'rb85', 'high', None, freqs[0]), linear, rtol=1e-12, atol=1e-12)
+
+def test_corrected_conversion():
+    rng = np.random.default_rng(3)
+    volts = 0.1 + rng.normal(0, 1e-2, 100)
+    freqs = 12.6e6 + rng.normal(0, 5, 100)
+    key = ('rb85', 'high')
+    ratio = kse.gyromagnetic_ratios[key]
+    quadratic = kse.quadratic_field_coefficients[key]
+    dB = (volts - volts[0])*M_CONV_F
+    #the slope at the run's baseline frequency, then the quadratic in field term
+    slope = ratio + 2*quadratic*(freqs[0] - kse.reference_frequencies[key])/ratio
+    corrected = slope*dB + quadratic*dB*dB
+    df = kse.processRawArrays(freqs, volts, 0.8*np.arange(100), 'rb85', 'high', True, True)
+    np.testing.assert_allclose(df['DMM'], corrected, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(df['Adjusted Keysight Data'], freqs - corrected, rtol=1e-15)
+    linear = kse.processRawArrays(freqs, volts, 0.8*np.arange(100), 'rb85', 'high', True)
+    assert not np.allclose(df['DMM'], linear['DMM'], rtol=0, atol=1e-9)
+
+@pytest.mark.parametrize('metal, energy', [('rb85', 'high'), ('rb87', 'low'), ('cs133', 'high')])
+def test_process_all_data_rt_matches_baseline(metal, energy):
+    df = kse.processAllData_rt(RT_CSV, metal, energy)
+    expected = baselineProcess(RT_CSV, metal, energy, 2, True)
+    assert len(df) == 8
+    assertMatchesBaseline(df, expected)
+
+@pytest.mark.parametrize('metal, energy', [('rb85', 'high'), ('rb87', 'low'), ('cs133', 'high')])
+def test_process_all_data_matches_baseline(metal, energy):
+    df = kse.processAllData(BATCHED_CSV, metal, energy)
+    expected = baselineProcess(BATCHED_CSV, metal, energy, 3, False)
+    assert len(df) == 8
+    assertMatchesBaseline(df, expected)
+    #both files hold the same readings, so everything but the times agrees
+    rt = kse.processAllData_rt(RT_CSV, metal, energy)
+    np.testing.assert_array_equal(df['DMM'], rt['DMM'])
+
+def writeFirstRowOverflowCSV(fp):
+    #the batched fixture with an overflow reading as the very first row, so the time baseline comes from a row that is dropped
+    with open(BATCHED_CSV, 'r') as infile:
+        lines = infile.read().splitlines()
+    lines.insert(1, '9.9e+37,0.1023001,13:20:00.1,1700000400.1')
+    with open(fp, 'w') as outfile:
+        outfile.write('\n'.join(lines) + '\n')
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 100])
+def test_streamed_csv_matches_processed(tmp_path, chunk_size):
+    import pandas as pd
+    first_row_overflow = str(tmp_path / 'first_row_overflow.csv')
+    writeFirstRowOverflowCSV(first_row_overflow)
+    cases = [(RT_CSV, kse.streamAllData_rt, kse.processAllData_rt),
+             (BATCHED_CSV, kse.streamAllData, kse.processAllData),
+             (first_row_overflow, kse.streamAllData, kse.processAllData)]
+    for (fp_raw, stream, process) in cases:
+        for apply_corrections in [False, True]:
+            fp_out = str(tmp_path / 'processed.csv')
+            rejected = {}
+            num_rows = stream(fp_raw, fp_out, 'rb85', 'high', chunk_size, rejected, apply_corrections)
+            expected = process(fp_raw, 'rb85', 'high', apply_corrections)
+            streamed = pd.read_csv(fp_out)
+            assert num_rows == len(expected)
+            assert list(streamed.columns) == list(expected.columns)
+            for col in expected.columns:
+                np.testing.assert_allclose(streamed[col].to_numpy(), expected[col].to_numpy(), rtol=1e-15, atol=1e-9)
+            assert rejected == expected.attrs['rejected']
+    #the time baseline is the first row in the file, even though that row is an overflow
+    assert kse.processAllData(first_row_overflow, 'rb85', 'high')['Time'].iloc[0] == pytest.approx(0.4)
+
+@pytest.mark.parametrize('apply_corrections', [False, True])
+def test_live_processor_matches_processed(tmp_path, apply_corrections):
+    import pandas as pd
+    rng = np.random.default_rng(5)
+    freqs = 12.65e6 + rng.normal(0, 5, 40)
+    volts = 0.1 + rng.normal(0, 1e-3, 40)
+    t_ints = 0.8*np.arange(40) + 0.3 #the first point isn't at t=0, the times are kept as they come
+    fp = str(tmp_path / 'live_processed.csv')
+    live = kse.LiveDataProcessor(fp, 'rb85', 'high', apply_corrections)
+    rows = [live.addPoint(f, v, t) for (f, v, t) in zip(freqs, volts, t_ints)]
+    live.close()
+    expected = kse.processRawArrays(freqs, volts, t_ints, 'rb85', 'high', True, apply_corrections)
+    assert live.num_rows == 40
+    #the first point is the dmm baseline
+    assert rows[0][2] == 0.0
+    assert rows[0][3] == freqs[0]
+    np.testing.assert_allclose(np.array(rows), expected.to_numpy(), rtol=1e-15, atol=1e-9)
+    written = pd.read_csv(fp)
+    assert list(written.columns) == list(expected.columns)
+    np.testing.assert_allclose(written.to_numpy(), expected.to_numpy(), rtol=1e-15, atol=1e-9)
+
+def test_overflow_rows_are_rejected_and_counted():
+    over = kse.instrument_overflow_val
+    freqs = np.array([over, 3.2e6 + 1, 3.2e6 + 2, over, 3.2e6 + 4, 3.2e6 + 5, -over])
+    volts = np.array([0.5, 0.101, over, over, 0.104, 0.105, 0.106])
+    t_ints = 0.8*np.arange(7)
+    valid, rejected = kse.getOverflowMask([freqs, volts], ['Frequencies', 'Voltages'])
+    np.testing.assert_array_equal(valid, [False, True, False, False, True, True, False])
+    assert rejected == {'Frequencies': 3, 'Voltages': 2}
+    df = kse.processRawArrays(freqs, volts, t_ints, 'rb85', 'high', True)
+    assert df.attrs['rejected'] == {'Frequencies': 3, 'Voltages': 2}
+    assert df.attrs['rows_read'] == 7
+    np.testing.assert_array_equal(df['Time'], t_ints[[1, 4, 5]])
+    np.testing.assert_array_equal(df['Keysight'], freqs[[1, 4, 5]])
+    #the overflow first row isn't the dmm baseline, the first valid row is
+    np.testing.assert_allclose(df['DMM'], (volts[[1, 4, 5]] - 0.101)*M_CONV_F*kse.gyromagnetic_ratios[('rb85', 'high')], rtol=1e-12, atol=1e-12)
+
+def test_all_rows_rejected():
+    over = kse.instrument_overflow_val
+    df = kse.processRawArrays(np.array([over, 1.0]), np.array([0.1, over]), np.array([0.0, 0.8]), 'rb85', 'high', True)
+    assert len(df) == 0
+    assert df.attrs['rejected'] == {'Frequencies': 1, 'Voltages': 1}
+    assert df.attrs['rows_read'] == 2
@@ -0,0 +1,91 @@
+import json
+import math
+import os
+
+import numpy as np
+import pytest
+
+import src.epr_data_collection_rt.latency_probes as lp
+import src.epr_data_collection_rt.queued_writer as qw
+
+
+def test_percentiles_are_within_a_bin_of_exact():
+    rng = np.random.default_rng(6)
+    seconds = rng.lognormal(np.log(0.01), 1.0, 5000)
+    histogram = lp.LatencyHistogram()
+    for s in seconds:
+        histogram.add(s)
+    bin_ratio = 10**(1/lp.BINS_PER_DECADE)
+    for p in [50, 95, 99, 100]:
+        exact = np.percentile(seconds, p, method='inverted_cdf')
+        estimate = histogram.getPercentile(p)
+        assert exact <= estimate*(1 + 1e-12)
+        assert estimate <= exact*bin_ratio
+    assert histogram.count == 5000
+    assert histogram.getMean() == pytest.approx(seconds.mean(), rel=1e-12)
+    assert histogram.max == seconds.max()
+    assert histogram.getPercentile(100) == seconds.max()
+
+def test_out_of_range_latencies_go_in_the_end_bins():
+    histogram = lp.LatencyHistogram()
+    histogram.add(0.0)
+    histogram.add(1e9)
+    assert histogram.counts[0] == 1
+    assert histogram.counts[-1] == 1
+    assert histogram.getPercentile(50) == pytest.approx(lp.getBinUpperEdge(0))
+    assert histogram.getPercentile(100) == pytest.approx(lp.MAX_LATENCY) #the upper edge of the last bin
+    assert histogram.max == 1e9
+
+def test_empty_histogram():
+    histogram = lp.LatencyHistogram()
+    assert math.isnan(histogram.getMean())
+    assert math.isnan(histogram.getPercentile(50))
+    assert histogram.getSummary() == {'count': 0}
+    assert lp.LatencyProbes().getSummaryString() == 'Latency: no data yet'
+
+def test_metrics_file_after_a_failed_write(tmp_path):
+    def write_batch(batch):
+        raise IOError('disk full')
+    writer = qw.QueuedWriter(write_batch)
+    writer.start()
+    writer.put(1)
+    writer.stop()
+    probes = lp.LatencyProbes(['cycle'])
+    probes.add('cycle', 0.2)
+    fp = str(tmp_path / 'run_metrics.json')
+    probes.writeMetricsFile(fp, {'write_queue': writer.getStatus()})
+    with open(fp) as infile:
+        metrics = json.load(infile)
+    assert metrics['write_queue']['write_errors'] == 1
+    assert metrics['write_queue']['last_error'] == 'disk full'
+    assert metrics['phases']['cycle']['count'] == 1
+    assert os.listdir(str(tmp_path)) == ['run_metrics.json']
+
+def test_failed_metrics_write_keeps_the_old_file(tmp_path):
+    probes = lp.LatencyProbes()
+    fp = str(tmp_path / 'run_metrics.json')
+    probes.writeMetricsFile(fp, {'points_collected': 5})
+    circular = []
+    circular.append(circular)
+    with pytest.raises(ValueError):
+        probes.writeMetricsFile(fp, {'points_collected': circular})
+    with open(fp) as infile:
+        assert json.load(infile)['points_collected'] == 5
+    assert os.listdir(str(tmp_path)) == ['run_metrics.json']
+
+def test_run_with_a_write_error_writes_its_metrics(acquisition):
+    acquisition.connect()
+    add_point = acquisition.live_processor.addPoint
+    calls = []
+    def failing_add_point(*args):
+        calls.append(args)
+        if (len(calls) == 1):
+            raise IOError('disk full')
+        add_point(*args)
+    acquisition.live_processor.addPoint = failing_add_point
+    acquisition.run(max_points=10)
+    with open(os.path.join(acquisition.folder, acquisition.metrics_filename)) as infile:
+        metrics = json.load(infile)
+    assert metrics['write_queue']['write_errors'] == 1
+    assert metrics['write_queue']['last_error'] == 'disk full'
+    assert metrics['points_collected'] == 10
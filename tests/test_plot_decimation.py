@@ -0,0 +1,80 @@
+import numpy as np
+
+import src.epr_data_collection_rt.plot_decimation as decimation
+
+
+def syntheticRun(n):
+    """
+    Returns n noisy points with a few single point spikes and dropouts, the kind of thing decimation must not hide.
+    """
+    rng = np.random.default_rng(4)
+    x = 0.8*np.arange(n)
+    y = 3.2e6 + rng.normal(0, 5, n)
+    y[rng.choice(n, 20, replace=False)] += 500
+    y[rng.choice(n, 20, replace=False)] -= 500
+    return x, y
+
+def getLevel(n, factor, max_points):
+    #the same choice getView makes, the finest level that fits
+    level = 0
+    while (n*2/(factor**level) > max_points):
+        level = level + 1
+    return level
+
+
+def test_view_keeps_every_bucket_min_and_max():
+    x, y = syntheticRun(20000)
+    d = decimation.MinMaxDecimator()
+    d.extend(x, y)
+    for (x_min, x_max, max_points) in [(None, None, 500), (1000.3, 9000.1, 300), (5000.0, 5100.0, 2000)]:
+        vx, vy = d.getView(x_min, x_max, max_points)
+        i_from = 0 if x_min is None else int(np.searchsorted(x, x_min, side='left'))
+        i_to = len(x) if x_max is None else int(np.searchsorted(x, x_max, side='right'))
+        size = d.factor**getLevel(i_to - i_from, d.factor, max_points)
+        kept = set(vx.tolist())
+        for start in range(-(-i_from//size)*size, i_to - size + 1, size):
+            bucket = slice(start, start + size)
+            assert x[bucket][np.argmin(y[bucket])] in kept
+            assert x[bucket][np.argmax(y[bucket])] in kept
+        assert np.all(np.diff(vx) > 0)
+        assert vy.min() == y[i_from:i_to].min()
+        assert vy.max() == y[i_from:i_to].max()
+
+def test_view_respects_max_points():
+    x, y = syntheticRun(50000)
+    d = decimation.MinMaxDecimator()
+    d.extend(x, y)
+    for max_points in [100, 1000, 5000]:
+        vx, vy = d.getView(max_points=max_points)
+        #the partial buckets at the ends can add up to 2*(factor-1) points per level
+        assert len(vx) <= max_points + 2*(d.factor - 1)*len(d.level_min)
+        assert len(vx) == len(vy)
+    vx, vy = d.getView(x[100], x[199], max_points=1000)
+    assert np.array_equal(vx, x[100:200])
+    assert np.array_equal(vy, y[100:200])
+
+def test_set_data_matches_appending():
+    x, y = syntheticRun(10001)
+    appended = decimation.MinMaxDecimator()
+    appended.extend(x, y)
+    loaded = decimation.MinMaxDecimator()
+    loaded.setData(x, y)
+    for (x_min, x_max) in [(None, None), (123.0, 4567.0)]:
+        for (a, b) in zip(appended.getView(x_min, x_max, 400), loaded.getView(x_min, x_max, 400)):
+            assert np.array_equal(a, b)
+
+def test_realtime_plot_points_are_indexed_by_time(acquisition, monkeypatch):
+    import os
+    import types
+    #the realtime app imports its modules by name, the same way it does when run from its own folder
+    monkeypatch.syspath_prepend(os.path.join(os.path.dirname(__file__), '..', 'src', 'epr_data_collection_rt'))
+    rt = __import__('kse_data_collection_realtime')
+    window = types.SimpleNamespace(plot_decimator=decimation.MinMaxDecimator())
+    acquisition.on_point = lambda freq, time_interval: rt.MainWindow.add_plot_point(window, freq, time_interval)
+    acquisition.connect()
+    acquisition.run(max_points=20)
+    x, y = window.plot_decimator.getView()
+    assert len(x) == 20
+    assert np.all(np.diff(x) > 0)
+    assert x[0] >= 0 and x[-1] < 1e3 #seconds since the start of the run
+    assert np.all(np.abs(y - 3.2e6) < 1e3) #frequencies
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+
+import src.epr_data_collection_rt.kse_experiment_utils as kse
+import src.epr_data_collection_rt.processed_cache as cache
+import src.epr_data_collection_rt.raw_data_store as store
+
+
+def writeRun(fp, n=50):
+    rng = np.random.default_rng(2)
+    writer = store.RawDataWriter(fp, store.RT_COLUMNS, None, None)
+    writer.appendRows(np.column_stack([3.2e6 + rng.normal(0, 5, n), 0.1 + rng.normal(0, 1e-4, n), 0.8*np.arange(n)]))
+    writer.close()
+
+def countingProcess(calls):
+    def process(fp, metal, energy, apply_corrections=False):
+        calls.append(fp)
+        return store.processRawDataFile(fp, metal, energy, apply_corrections)
+    return process
+
+
+def test_second_processing_is_a_hit(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    writeRun(fp)
+    c = cache.ProcessedDataCache(str(tmp_path / 'cache'))
+    calls = []
+    first = cache.processCached(fp, 'rb85', 'high', countingProcess(calls), c)
+    second = cache.processCached(fp, 'rb85', 'high', countingProcess(calls), c)
+    assert len(calls) == 1
+    assert (c.hits, c.misses) == (1, 1)
+    assert np.array_equal(first.to_numpy(), second.to_numpy())
+    assert list(first.columns) == list(second.columns)
+    assert first.attrs == second.attrs
+
+def test_changed_raw_file_is_a_miss(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    writeRun(fp)
+    c = cache.ProcessedDataCache(str(tmp_path / 'cache'))
+    key = c.getKey(fp, 'rb85', 'high', store.processRawDataFile)
+    writeRun(fp, 60)
+    assert c.getKey(fp, 'rb85', 'high', store.processRawDataFile) != key
+
+def test_changed_coefficients_invalidate_the_entry(tmp_path, monkeypatch):
+    fp = str(tmp_path / 'run.bin')
+    writeRun(fp)
+    c = cache.ProcessedDataCache(str(tmp_path / 'cache'))
+    calls = []
+    cache.processCached(fp, 'rb85', 'high', countingProcess(calls), c)
+    table = dict(kse.conversion_table)
+    (linear, quadratic) = table[('rb85', 'high')]
+    table[('rb85', 'high')] = (2*linear, quadratic)
+    monkeypatch.setattr(kse, 'conversion_table', table)
+    df = cache.processCached(fp, 'rb85', 'high', countingProcess(calls), c)
+    assert len(calls) == 2
+    assert np.allclose(df['Adjusted Keysight Data'], store.processRawDataFile(fp, 'rb85', 'high')['Adjusted Keysight Data'])
+
+def test_corrections_are_cached_separately(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    writeRun(fp)
+    c = cache.ProcessedDataCache(str(tmp_path / 'cache'))
+    assert c.getKey(fp, 'rb85', 'high', store.processRawDataFile) != c.getKey(fp, 'rb85', 'high', store.processRawDataFile, True)
+    calls = []
+    linear = cache.processCached(fp, 'rb85', 'high', countingProcess(calls), c)
+    corrected = cache.processCached(fp, 'rb85', 'high', countingProcess(calls), c, True)
+    assert len(calls) == 2
+    assert np.array_equal(linear['DMM'], store.processRawDataFile(fp, 'rb85', 'high')['DMM'])
+    assert np.array_equal(corrected['DMM'], store.processRawDataFile(fp, 'rb85', 'high', True)['DMM'])
+    assert not np.array_equal(linear['DMM'], corrected['DMM'])
+
+def test_every_raw_file_keeps_its_own_hash(tmp_path):
+    #two caches stand in for two batch processing workers sharing the cache folder
+    fps = [str(tmp_path / (name + '.bin')) for name in ['a', 'b']]
+    for fp in fps:
+        writeRun(fp)
+    workers = [cache.ProcessedDataCache(str(tmp_path / 'cache')) for fp in fps]
+    for (worker, fp) in zip(workers, fps):
+        worker.getRawFileHash(fp)
+    for fp in fps:
+        assert workers[0].loadHashEntry(os.path.abspath(fp))['sha256'] == cache.hashFile(fp)
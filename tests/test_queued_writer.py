@@ -0,0 +1,92 @@
+from threading import Event
+
+import src.epr_data_collection_rt.queued_writer as qw
+
+
+class BlockingWrites:
+    """
+    A write_batch that holds up the writer thread until released, so the queue can be filled.
+    """
+    def __init__(self):
+        self.started = Event()
+        self.release = Event()
+        self.batches = []
+
+    def __call__(self, batch):
+        self.started.set()
+        self.release.wait(5)
+        self.batches.append(list(batch))
+
+
+def test_full_queue_drops_and_counts():
+    writes = BlockingWrites()
+    writer = qw.QueuedWriter(writes, maxsize=10, batch_size=4)
+    writer.start()
+    #the first sample is taken straight off the queue, the writer thread then waits in write_batch
+    assert writer.put(0)
+    assert writes.started.wait(5)
+    queued = [writer.put(i) for i in range(1, 16)]
+    assert queued == [True]*10 + [False]*5
+    status = writer.getStatus()
+    assert status['depth'] == 10
+    assert status['high_water'] == 10
+    assert status['dropped'] == 5
+    writes.release.set()
+    writer.stop()
+    status = writer.getStatus()
+    assert status['written'] == 11
+    assert status['dropped'] == 5
+    assert status['depth'] == 0
+    assert [x for batch in writes.batches for x in batch] == list(range(0, 11))
+    assert max(len(batch) for batch in writes.batches) <= 4
+    assert 'dropped: 5' in writer.getStatusString()
+
+def test_write_errors_are_counted_and_writing_continues():
+    written = []
+    def write_batch(batch):
+        if (batch[0] == 'bad'):
+            raise IOError('disk full')
+        written.extend(batch)
+    writer = qw.QueuedWriter(write_batch, maxsize=10, batch_size=1)
+    writer.start()
+    writer.put('bad')
+    writer.put('good')
+    writer.stop()
+    status = writer.getStatus()
+    assert status['write_errors'] == 1
+    assert str(status['last_error']) == 'disk full'
+    assert written == ['good']
+
+def test_stop_is_safe_to_call_twice():
+    writer = qw.QueuedWriter(lambda batch: None)
+    writer.start()
+    writer.stop()
+    writer.stop()
+    assert not writer.thread.is_alive()
+
+def test_on_idle_is_called_while_nothing_is_queued():
+    idle = Event()
+    writer = qw.QueuedWriter(lambda batch: None, on_idle=idle.set, idle_interval=0.01)
+    writer.start()
+    assert idle.wait(5)
+    writer.stop()
+    assert not writer.thread.is_alive()
+
+def test_stalled_points_get_synced(tmp_path):
+    import time
+    import src.epr_data_collection_rt.raw_data_store as store
+    raw = store.RawDataWriter(str(tmp_path / 'run.bin'), store.RT_COLUMNS, sync_every=None, sync_interval=0.05)
+    def write_batch(batch):
+        for row in batch:
+            raw.append(*row)
+    writer = qw.QueuedWriter(write_batch, on_idle=raw.syncIfDue, idle_interval=0.01)
+    writer.start()
+    writer.put((1.0, 2.0, 3.0)) #then nothing else arrives
+    deadline = time.monotonic() + 5
+    while ((writer.getStatus()['written'] == 0) and (time.monotonic() < deadline)):
+        time.sleep(0.01)
+    while ((raw.unsynced > 0) and (time.monotonic() < deadline)):
+        time.sleep(0.01)
+    assert raw.unsynced == 0
+    writer.stop()
+    raw.close()
@@ -0,0 +1,184 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.epr_data_collection_rt.raw_data_store as store
+import src.epr_data_collection_rt.utilities as util
+
+
+def syntheticPoints(n, start_time=1.7e9):
+    """
+    Returns n frequency, voltage, time interval, and timestamp values like the ones the apps collect,
+    with a few overflow readings and timestamps that land exactly on a whole second.
+    """
+    rng = np.random.default_rng(1)
+    freqs = 3.2e6 + rng.normal(0, 5, n)
+    volts = 0.1 + rng.normal(0, 1e-4, n)
+    freqs[::17] = 9.9e37
+    t_ints = 0.8*np.arange(n) + rng.random(n)*1e-3
+    stamps = start_time + t_ints
+    stamps[::5] = np.floor(stamps[::5])
+    return freqs, volts, t_ints, stamps
+
+def writeOldRealtimeCSV(fp, freqs, volts, t_ints, batch=10):
+    """
+    Writes a raw data csv the way the realtime app used to, a header then batches appended with to_csv.
+    """
+    pd.DataFrame({'Frequencies': [], 'Voltages': [], 'Time Interval': []}).to_csv(fp, mode='a', index=False)
+    for start in range(0, len(freqs), batch):
+        end = start + batch
+        pd.DataFrame({'Frequency': freqs[start:end], 'Voltage': volts[start:end], 'Time Interval': t_ints[start:end]}).to_csv(fp, mode='a', index=False, header=False)
+
+def writeOldBatchedCSV(fp, freqs, volts, stamps, cycle=10):
+    """
+    Writes a raw data csv the way the batched app used to, with the human readable time of every timestamp from timestampToArray.
+    """
+    pd.DataFrame({'Frequencies': [], 'Voltages': [], 'Times': [], 'Timestamps': []}).to_csv(fp, mode='a', index=False)
+    for start in range(0, len(freqs), cycle):
+        end = start + cycle
+        hrtimes = [util.timestampToArray(ts)[1] for ts in stamps[start:end]]
+        pd.DataFrame({'Frequency': freqs[start:end], 'Voltage': volts[start:end], 'Time': hrtimes, 'Timestamps': stamps[start:end]}).to_csv(fp, mode='a', index=False, header=False)
+
+def readText(fp):
+    with open(fp, 'r') as infile:
+        return infile.read()
+
+
+def test_header_round_trip(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    writer = store.RawDataWriter(fp, store.RT_COLUMNS)
+    writer.close()
+    columns, header_size = store.readRawFileHeader(fp)
+    assert columns == store.RT_COLUMNS
+    assert header_size % 8 == 0
+    assert header_size == os.path.getsize(fp)
+    assert store.isRawDataFile(fp)
+
+def test_records_round_trip(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    freqs, volts, t_ints, stamps = syntheticPoints(53)
+    writer = store.RawDataWriter(fp, store.RT_COLUMNS)
+    for i in range(0, 20):
+        writer.append(freqs[i], volts[i], t_ints[i])
+    writer.appendRows(np.column_stack((freqs[20:], volts[20:], t_ints[20:])))
+    writer.close()
+    columns, data = store.loadRawData(fp)
+    assert columns == store.RT_COLUMNS
+    assert isinstance(data, np.memmap)
+    np.testing.assert_array_equal(data, np.column_stack((freqs, volts, t_ints)))
+
+def test_append_to_existing_file(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    writer = store.RawDataWriter(fp, store.RT_COLUMNS)
+    writer.append(1.0, 2.0, 3.0)
+    writer.close()
+    writer = store.RawDataWriter(fp, store.RT_COLUMNS)
+    writer.append(4.0, 5.0, 6.0)
+    writer.close()
+    columns, data = store.loadRawData(fp)
+    np.testing.assert_array_equal(data, [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+
+def test_empty_file_loads(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    store.RawDataWriter(fp, store.BATCHED_COLUMNS).close()
+    columns, data = store.loadRawData(fp)
+    assert data.shape == (0, 3)
+
+def test_torn_record_is_cut_off(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    writer = store.RawDataWriter(fp, store.RT_COLUMNS)
+    writer.appendRows(np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]))
+    writer.close()
+    intact = os.path.getsize(fp)
+    assert store.recoverRawDataFile(fp) == 0
+    #a crash partway through the third record leaves 13 of its 24 bytes
+    with open(fp, 'ab') as outfile:
+        outfile.write(np.array([7.0, 8.0, 9.0], dtype='<f8').tobytes()[:13])
+    assert store.recoverRawDataFile(fp) == 13
+    assert os.path.getsize(fp) == intact
+    columns, data = store.loadRawData(fp)
+    np.testing.assert_array_equal(data, [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+    #reopening a torn file recovers it before appending, so the new points line up
+    with open(fp, 'ab') as outfile:
+        outfile.write(b'\x01'*7)
+    writer = store.RawDataWriter(fp, store.RT_COLUMNS)
+    assert writer.recovered == 7
+    writer.append(7.0, 8.0, 9.0)
+    writer.close()
+    columns, data = store.loadRawData(fp)
+    np.testing.assert_array_equal(data, [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0], [7.0, 8.0, 9.0]])
+
+def test_torn_header_is_emptied(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    store.RawDataWriter(fp, store.RT_COLUMNS).close()
+    header_size = os.path.getsize(fp)
+    with open(fp, 'r+b') as outfile:
+        outfile.truncate(header_size - 3)
+    assert store.recoverRawDataFile(fp) == header_size - 3
+    assert os.path.getsize(fp) == 0
+
+def test_recovery_skips_files_being_written(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    writer = store.RawDataWriter(fp, store.RT_COLUMNS)
+    writer.append(1.0, 2.0, 3.0)
+    writer.sync()
+    with open(fp, 'ab') as outfile:
+        outfile.write(b'\x01'*5) #looks like a torn record while the writer is still going
+    skipped = []
+    assert store.recoverRawDataFolder(str(tmp_path), skipped) == {}
+    assert skipped == ['run.bin']
+    writer.close()
+    assert not os.path.exists(fp + store.LOCK_SUFFIX)
+    skipped = []
+    assert store.recoverRawDataFolder(str(tmp_path), skipped) == {'run.bin': 5}
+    assert skipped == []
+    columns, data = store.loadRawData(fp)
+    np.testing.assert_array_equal(data, [[1.0, 2.0, 3.0]])
+
+def test_second_writer_is_refused(tmp_path):
+    fp = str(tmp_path / 'run.bin')
+    writer = store.RawDataWriter(fp, store.RT_COLUMNS)
+    with pytest.raises(ValueError):
+        store.RawDataWriter(fp, store.RT_COLUMNS)
+    writer.close()
+    store.RawDataWriter(fp, store.RT_COLUMNS).close()
+
+def test_realtime_csv_export_matches_old_csv(tmp_path):
+    freqs, volts, t_ints, stamps = syntheticPoints(45)
+    fp_bin = str(tmp_path / 'run.bin')
+    writer = store.RawDataWriter(fp_bin, store.RT_COLUMNS)
+    writer.appendRows(np.column_stack((freqs, volts, t_ints)))
+    writer.close()
+    fp_old = str(tmp_path / 'old.csv')
+    writeOldRealtimeCSV(fp_old, freqs, volts, t_ints)
+    fp_new = str(tmp_path / 'new.csv')
+    assert store.exportRawDataToCSV(fp_bin, fp_new, chunk_size=7) == 45
+    assert readText(fp_new) == readText(fp_old)
+
+def test_batched_csv_export_matches_old_csv(tmp_path):
+    freqs, volts, t_ints, stamps = syntheticPoints(45)
+    fp_bin = str(tmp_path / 'run.bin')
+    writer = store.RawDataWriter(fp_bin, store.BATCHED_COLUMNS)
+    writer.appendRows(np.column_stack((freqs, volts, stamps)))
+    writer.close()
+    fp_old = str(tmp_path / 'old.csv')
+    writeOldBatchedCSV(fp_old, freqs, volts, stamps)
+    fp_new = str(tmp_path / 'new.csv')
+    assert store.exportRawDataToCSV(fp_bin, fp_new, chunk_size=7) == 45
+    assert readText(fp_new) == readText(fp_old)
+    assert readText(fp_new).split('\n')[0] == 'Frequencies,Voltages,Times,Timestamps'
+
+def test_processed_matches_csv_processing(tmp_path):
+    import src.epr_data_collection_rt.kse_experiment_utils as kse
+    freqs, volts, t_ints, stamps = syntheticPoints(45)
+    fp_bin = str(tmp_path / 'run.bin')
+    writer = store.RawDataWriter(fp_bin, store.RT_COLUMNS)
+    writer.appendRows(np.column_stack((freqs, volts, t_ints)))
+    writer.close()
+    fp_old = str(tmp_path / 'old.csv')
+    writeOldRealtimeCSV(fp_old, freqs, volts, t_ints)
+    from_bin = store.processRawDataFile(fp_bin, 'rb85', 'high')
+    from_csv = kse.processAllData_rt(fp_old, 'rb85', 'high')
+    pd.testing.assert_frame_equal(from_bin, from_csv)
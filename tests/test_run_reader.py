@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+import src.epr_data_collection_rt.raw_data_store as store
+import src.epr_data_collection_rt.run_reader as rr
+
+
+def writeRun(tmp_path, n=5500):
+    """
+    Writes the same run as a binary raw data file and as its csv export, more rows than one index block.
+    """
+    rng = np.random.default_rng(3)
+    rows = np.column_stack([3.2e6 + rng.normal(0, 5, n), 0.1 + rng.normal(0, 1e-4, n), 0.8*np.arange(n) + rng.random(n)*1e-3])
+    fp_bin = str(tmp_path / 'run.bin')
+    writer = store.RawDataWriter(fp_bin, store.RT_COLUMNS, None, None)
+    writer.appendRows(rows)
+    writer.close()
+    fp_csv = str(tmp_path / 'run.csv')
+    store.exportRawDataToCSV(fp_bin, fp_csv)
+    return fp_bin, fp_csv, rows
+
+def fullWindow(rows, t_start, t_end):
+    keep = (rows[:, 2] >= t_start) & (rows[:, 2] <= t_end)
+    return rows[keep]
+
+
+def test_csv_and_binary_windows_match_a_full_read(tmp_path):
+    fp_bin, fp_csv, rows = writeRun(tmp_path)
+    #pandas' default float parser can be off in the last digit, so each window is checked against a full read of its own file
+    full_csv = pd.read_csv(fp_csv).to_numpy()
+    assert np.allclose(full_csv, rows, rtol=1e-12, atol=1e-12)
+    csv_reader = rr.RunReader(fp_csv)
+    bin_reader = rr.RunReader(fp_bin)
+    assert csv_reader.getNumRows() == bin_reader.getNumRows() == len(rows)
+    for (t_start, t_end) in [(0.0, 10.0), (799.5, 1650.2), (3000.0, 1e9), (-5.0, -1.0), (2400.0, 2400.0)]:
+        from_csv = csv_reader.readWindow(t_start, t_end)
+        from_bin = bin_reader.readWindow(t_start, t_end)
+        assert list(from_csv.columns) == list(from_bin.columns) == store.RT_COLUMNS
+        assert np.array_equal(from_csv.to_numpy(dtype=np.float64).reshape(-1, 3), fullWindow(full_csv, t_start, t_end))
+        assert np.array_equal(from_bin.to_numpy(dtype=np.float64).reshape(-1, 3), fullWindow(rows, t_start, t_end))
+        assert len(from_csv) == len(from_bin)
+
+def test_saved_index_is_reused_and_extended(tmp_path):
+    fp_bin, fp_csv, rows = writeRun(tmp_path)
+    first = rr.RunReader(fp_csv)
+    with open(fp_csv, 'a') as outfile:
+        outfile.write('3200000.0,0.1,5000.0\n')
+    second = rr.RunReader(fp_csv)
+    assert np.array_equal(second.index_offsets[:len(first.index_offsets)], first.index_offsets)
+    assert second.getNumRows() == len(rows) + 1
+    assert second.getTimeRange()[1] == 5000.0
+
+def test_readers_are_cached_until_the_file_changes(tmp_path):
+    rr.clearReaderCache()
+    fp_bin, fp_csv, rows = writeRun(tmp_path)
+    rr.readRunWindow(fp_csv, 0.0, 10.0)
+    rr.readRunWindow(fp_csv, 20.0, 30.0)
+    assert rr.getRunReader.cache_info().misses == 1
+    assert rr.getRunReader.cache_info().hits == 1
+    with open(fp_csv, 'a') as outfile:
+        outfile.write('3200000.0,0.1,5000.0\n')
+    window = rr.readRunWindow(fp_csv, 4999.0, 5001.0)
+    assert rr.getRunReader.cache_info().misses == 2
+    assert len(window) == 1
+    rr.clearReaderCache()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import src.epr_data_collection_rt.running_stats as rs
+
+
+def samples(n):
+    #a realistic frequency series, a large offset with small noise and a slow drift, where naive sums lose precision
+    rng = np.random.default_rng(5)
+    return 3.2e6 + rng.normal(0, 5, n) + np.linspace(0, 20, n)
+
+
+def test_running_stats_match_numpy():
+    x = samples(10000)
+    stats = rs.RunningStats()
+    for (i, v) in enumerate(x):
+        stats.add(v)
+        if (i in [0, 1, 99, 9999]):
+            assert stats.count == i + 1
+            assert stats.mean == pytest.approx(np.mean(x[:i+1]), rel=1e-12)
+            assert stats.getStdDev() == pytest.approx(np.std(x[:i+1]), rel=1e-9, abs=1e-9)
+            assert stats.min == np.min(x[:i+1])
+            assert stats.max == np.max(x[:i+1])
+
+def test_windowed_stats_match_numpy():
+    x = samples(5000)
+    window = 100
+    stats = rs.WindowedStats(window)
+    for (i, v) in enumerate(x):
+        stats.add(v)
+        if (i % 250 == 0 or i in [window - 2, window - 1, window, len(x) - 1]):
+            recent = x[max(0, i + 1 - window):i+1]
+            assert stats.count == len(recent)
+            assert stats.mean == pytest.approx(np.mean(recent), rel=1e-12)
+            assert stats.getStdDev() == pytest.approx(np.std(recent), rel=1e-8)
+
+def test_windowed_stats_recompute(monkeypatch):
+    monkeypatch.setattr(rs, 'RECOMPUTE_EVERY', 50)
+    x = samples(1000)
+    stats = rs.WindowedStats(20)
+    for v in x:
+        stats.add(v)
+    assert stats.replaced < 50
+    assert stats.mean == pytest.approx(np.mean(x[-20:]), rel=1e-12)
+    assert stats.getStdDev() == pytest.approx(np.std(x[-20:]), rel=1e-8)
+
+def test_run_statistics_summary():
+    run = rs.RunStatistics('Keysight', 'Hz', 10)
+    assert run.getSummaryString() == 'Keysight: no data yet'
+    for v in samples(25):
+        run.add(v)
+    summary = run.getSummaryString()
+    assert summary.startswith('Keysight (25 points): mean ')
+    assert '| last 10: ' in summary
+    run.clear()
+    assert run.total.count == 0 and run.recent.count == 0
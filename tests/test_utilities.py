@@ -0,0 +1,72 @@
+import time
+
+import numpy as np
+import pytest
+
+import src.epr_data_collection_rt.utilities as util
+
+
+@pytest.fixture
+def timezone(monkeypatch):
+    """
+    Switches the local time zone for the length of a test. Needs time.tzset, so POSIX only.
+    """
+    if (not hasattr(time, 'tzset')):
+        pytest.skip('time.tzset is not available')
+    def setZone(name):
+        monkeypatch.setenv('TZ', name)
+        time.tzset()
+    yield setZone
+    monkeypatch.undo()
+    time.tzset()
+
+def assertMatchesTimestampToArray(times):
+    dates, hrtimes = util.formatTimestampsForCSV(times)
+    expected = [util.timestampToArray(ts) for ts in times]
+    assert dates == [e[0] for e in expected]
+    assert hrtimes == [e[1] for e in expected]
+
+def runAround(center, before, after, step, rng):
+    #points every step seconds with a random fraction, and every fifth one on a whole second
+    times = center + np.arange(-before, after, step) + rng.random(int(np.ceil((before + after)/step)))
+    times[::5] = np.floor(times[::5])
+    return times
+
+def findOffsetChanges(start, end):
+    """
+    Returns the first second of every local UTC offset change between two timestamps, found by bisecting each day that has one.
+    """
+    changes = []
+    for day in range(start, end, 86400):
+        lo, hi = day, day + 86400
+        if (time.localtime(lo).tm_gmtoff == time.localtime(hi).tm_gmtoff):
+            continue
+        while (hi - lo > 1):
+            mid = (lo + hi)//2
+            if (time.localtime(mid).tm_gmtoff == time.localtime(lo).tm_gmtoff):
+                lo = mid
+            else:
+                hi = mid
+        changes.append(hi)
+    return changes
+
+
+@pytest.mark.parametrize('zone', ['America/New_York', 'Europe/London', 'Australia/Lord_Howe'])
+def test_formatting_matches_timestamp_to_array_across_daylight_saving(timezone, zone):
+    timezone(zone)
+    rng = np.random.default_rng(8)
+    #the 2024 spring forward and fall back (Lord Howe moves by 30 minutes)
+    changes = findOffsetChanges(1704067200, 1735689600)
+    assert len(changes) == 2
+    for center in changes:
+        #a short run that crosses the change, and a multi-day run that does
+        assertMatchesTimestampToArray(runAround(center, 3600, 3600, 7.3, rng))
+        assertMatchesTimestampToArray(runAround(center, 3*86400, 86400, 3607.1, rng))
+        #a short run right up to the change that doesn't cross it
+        assertMatchesTimestampToArray(runAround(center, 600, 0, 0.8, rng))
+
+def test_formatting_edge_cases(timezone):
+    timezone('America/New_York')
+    assert util.formatTimestampsForCSV([]) == ([], [])
+    #whole seconds leave the fraction off, fractions that round up to a whole second and ones that don't
+    assertMatchesTimestampToArray(np.array([1700000000.0, 1700000000.9999996, 1700000000.9999994, 1700000000.000001, 1700000001.5]))